@@ -188,6 +188,7 @@ setup(
         'console_scripts': ['netify=netify.app:NetifyApp.cli_main']
     },
     use_2to3=False,
+    python_requires='>=3.7',
     install_requires=install_requires(),
     zip_safe=True,
     include_package_data=True,
@@ -12,14 +12,23 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from argparse import ArgumentParser
 import abc
+import os
 
-from flask import Flask
-
-from .view import Views
+from .catalog import Views
+from .catalog import load_view
 from .config import Config
+from .config import ConfigWatcher
+from .config import Option
+from .config import Section
+from .config import to_bool
+from .config import to_byte_size
+from .config import to_duration
+from .config import to_list
 from .config import guess_a_config_location
+from .config import rotate_secret_key_file
+from .config import to_int
+from .config import to_path
 
 
 class CliMixin(object):
@@ -28,13 +37,14 @@ class CliMixin(object):
     @classmethod
     def cli_main(cls):
         """The main method for the Netify app, when called from the CLI."""
+        # Imported here so apps started by uwsgi don't pay for it.
+        from argparse import ArgumentParser
         parser = ArgumentParser(description=cls.description)
-        discovered_configs = '\n  - '.join(guess_a_config_location())
         parser.add_argument(
-            '-c', '--config', action='store', required=True,
+            '-c', '--config', action='store',
             help=("Specify a path to the config file that you wish to use. "
-                  "Some available config files that were discovered:\n%s" %
-                  discovered_configs))
+                  "When omitted the config files that can be discovered "
+                  "are listed."))
         parser.add_argument(
             '--debug', action='store_true',
             help=("Enable debug in Netify and Flask. (Not suitable for "
@@ -47,15 +57,55 @@ class CliMixin(object):
             '--public', action='store_true',
             help=("Accept connections from external requests using the "
                   "dev server."))
+        parser.add_argument(
+            '-w', '--workers', action='store', type=int, default=0,
+            help=("Serve with this many pre-forked worker processes instead "
+                  "of the dev server. Send SIGHUP to restart the workers. "
+                  "[Default: 0, use the dev server]"))
+        parser.add_argument(
+            '--threads', action='store', type=int, default=8,
+            help="The number of threads of each worker. [Default: 8]")
+        parser.add_argument(
+            '--backlog', action='store', type=int, default=128,
+            help=("The number of connections waiting to be accepted before "
+                  "new ones are refused. [Default: 128]"))
+        parser.add_argument(
+            '--max-requests', action='store', type=int, default=0,
+            help=("Restart a worker after it has handled this many requests. "
+                  "[Default: 0, never]"))
+        parser.add_argument(
+            '--rotate-secret-key', action='store_true',
+            help=("Add a new secret key to the secret key file, keeping the "
+                  "previous keys for verifying existing sessions, and exit."))
         args = parser.parse_args()
+        if not args.config:
+            # Only search for config files when asked: the probes can be slow
+            # on network mounted home directories.
+            discovered_configs = '\n  - '.join(guess_a_config_location())
+            parser.error("the following arguments are required: -c/--config"
+                         "\nSome available config files that were "
+                         "discovered:\n  - %s" % discovered_configs)
 
         host = None
         if args.public:
             host = '0.0.0.0'
 
         netify_app = NetifyApp(config=Config.load_config(args.config))
+        if args.rotate_secret_key:
+            key_file = netify_app.config.get_secret_key_file(
+                os.path.join(netify_app.flask_app.instance_path,
+                             'secret_key'))
+            rotate_secret_key_file(key_file)
+            print('Rotated the secret key in %s' % key_file)
+            return
         netify_app.register_views(Views)
-        netify_app.run(host=host, port=args.port, debug=args.debug)
+        if args.workers > 0:
+            netify_app.serve(host=host, port=args.port, debug=args.debug,
+                             workers=args.workers, threads=args.threads,
+                             backlog=args.backlog,
+                             max_requests=args.max_requests)
+        else:
+            netify_app.run(host=host, port=args.port, debug=args.debug)
 
 
 class UwsgiMixin(object):
@@ -82,12 +132,41 @@ class NetifyCore(abc.ABC):
 
     flask_app = None
     netify_app = None
+    config_watcher = None
+    compressor = None
+    request_metrics = None
+
+    # Counts view registrations so memoized fragments built from the URL map
+    # can be rebuilt when it changes.
+    url_map_version = 0
+
+    # Option schemas for the config sections used by the core application.
+    config_schemas = {
+        Section.netify.value: {
+            'reload': Option(to_bool, False),
+            'reload_interval': Option(to_duration, None),
+            'config_cache': Option(to_bool, False),
+            'secret_key_file': Option(to_path, None),
+            'template_cache_size': Option(to_int, 128),
+            'compress': Option(to_bool, False),
+            'compress_min_size': Option(to_byte_size, 1024),
+            'compress_level': Option(to_int, 6),
+            'compress_cache_size': Option(to_int, 64),
+        },
+        Section.netify_views.value: {
+            'enabled': Option(to_list, ()),
+        },
+    }
 
     def __init__(self, config=None):
         """Create a new NetifyApp or retrieve the existing singleton."""
         if self.netify_app is None:  # First time init
             if self.flask_app is None:
+                from flask import Flask
+                from .session import KeyRotatingSessionInterface
                 self.__class__.flask_app = Flask(__name__)
+                self.flask_app.session_interface = (
+                    KeyRotatingSessionInterface())
                 self.registered_views = []
             self.config = None
             self.__class__.netify_app = self
@@ -103,39 +182,124 @@ class NetifyCore(abc.ABC):
         return getattr(self, 'description', '')
 
     def configure(self, config):
-        """Set up the config parser and update the Flask app config."""
-        if isinstance(config, Config):
-            self.config = config
-        else:
-            self.config = Config(config)
-        self.config.update_flask(self.flask_app)
+        """Set up the config parser and update the Flask app config.
+
+        This is also used to swap in a reloaded config. The Flask config is
+        updated first and the new Config replaces the old one in a single
+        assignment so a request sees either the old or the new config.
+        """
+        if not isinstance(config, Config):
+            config = Config(config)
+        for section, schema in self.config_schemas.items():
+            config.register_schema(section, schema)
+        config.update_flask(self.flask_app)
+        self.config = config
+        from .template import TEMPLATE_CACHE
+        TEMPLATE_CACHE.max_entries = config.get_page_options(
+            Section.netify.value)['template_cache_size']
+        self._setup_metrics()
+        self._setup_reload()
+        self._setup_compression()
+
+    def _setup_metrics(self):
+        """Install the hooks timing the requests.
+
+        The hooks do nothing until the metrics registry is enabled by the
+        Metrics view. They are installed first so the time and response
+        size they record include the work of the other hooks, such as
+        compression.
+        """
+        if self.request_metrics is not None:
+            return
+        from .metrics import RequestMetrics
+        self.request_metrics = RequestMetrics()
+        self.flask_app.before_request(self.request_metrics.before_request)
+        self.flask_app.after_request(self.request_metrics.after_request)
+
+    def _setup_reload(self):
+        """Start watching the config file if reloading is enabled.
+
+        Reloading is opt-in with the "reload" option of the [netify] section.
+        """
+        if self.config_watcher is not None:
+            return
+        options = self.config.get_page_options(Section.netify.value)
+        if not options.get('reload', False):
+            return
+        if not isinstance(self.config.file, str):
+            self.flask_app.logger.warning(
+                'Config reloading needs a single config file path.')
+            return
+        self.config_watcher = ConfigWatcher(
+            self, interval=options['reload_interval'])
+        self.flask_app.before_request(self.config_watcher.ensure_running)
+
+    def _setup_compression(self):
+        """Install the response compressor.
+
+        The compressor reads its options on every response and does nothing
+        unless the "compress" option of the [netify] section is enabled, so
+        it is installed once and follows config reloads.
+        """
+        if self.compressor is not None:
+            return
+        from .compress import Compressor
+        self.compressor = Compressor(self)
+        self.flask_app.after_request(self.compressor.after_request)
 
     def register_views(self, views):
         """Register the view classes against the flask app.
 
         The "Method" name registered in the Flask app is the "name" field for
-        each View class.
+        each View class. The option schema of each enabled view is registered
+        with the config, which is then compiled so that invalid options are
+        reported at startup. A validated config is then written to the
+        compiled config cache when the "config_cache" option is enabled.
+
+        Only the enabled views are loaded, so the modules of the others are
+        never imported.
         """
-        view_config = self.config.netify_views
         routes = self.config.routes
-        enabled = [name.strip() for name in view_config['enabled'].split(',')]
+        enabled = self.config.netify_views['enabled']
         for view in views:
-            view_cls = view.value
             if view.name in enabled:
+                view_cls = load_view(view)
                 if view.name in self.registered_views:
                     self.flask_app.logger.warning(
                         'Not Registering view %s. A view has already '
                         'been registered for %s.' % (view.name,
                                                      view_cls.name))
                 self.flask_app.logger.debug('Registering view %s' % view.name)
+                self.config.register_schema(view.name, view_cls.option_schema)
                 view_cls.register(self, route_prefix=routes.get(view.name,
                                                                 None))
                 self.registered_views.append(view.name)
+        self.config.compile()
+        options = self.config.get_page_options(Section.netify.value)
+        if options['config_cache'] and self.config.parser is not None:
+            self.config.write_cache()
 
     def run(self, host=None, port=None, debug=None):
         """Run the Flask Server."""
         self.flask_app.run(host, port, debug)
 
+    def serve(self, host=None, port=None, debug=None, **kwargs):
+        """Serve the Flask app from pre-forked worker processes.
+
+        The views should be registered first: the app is built before the
+        workers are forked so they share its memory copy on write. The
+        other keyword arguments are passed to PreforkServer.
+        """
+        from .server import PreforkServer
+        if debug is not None:
+            self.flask_app.debug = debug
+        server = PreforkServer(self.flask_app, host or '127.0.0.1',
+                               5000 if port is None else port, **kwargs)
+        print(' * Serving on http://%s:%d/ with %d workers of %d threads' %
+              (server.address[0], server.address[1], server.workers,
+               server.threads))
+        server.serve_forever()
+
 
 class NetifyApp(NetifyCore, CliMixin, UwsgiMixin):
     """An example Netify App composed of the Core and some Mixins."""
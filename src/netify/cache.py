@@ -0,0 +1,119 @@
+"""In-process caches used to avoid repeating work between requests."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import OrderedDict
+import threading
+
+
+_MISSING = object()
+
+# The caches given a name, which are reported by the metrics view.
+CACHES = {}
+
+
+class LruCache(object):
+    """A thread safe, bounded, least recently used cache.
+
+    :param max_entries: The number of entries kept before the least recently
+                        used entries are evicted.
+    :param max_bytes: An optional budget for the total size of the values.
+    :param sizeof: The function giving the size of a value in bytes.
+    :param name: A name to add the cache to CACHES under.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=None, sizeof=len,
+                 name=None):
+        """Create an empty cache."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if name is not None:
+            CACHES[name] = self
+
+    def __len__(self):
+        """Return the number of entries in the cache."""
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Check for a key without counting a hit or miss."""
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Return the value for key, marking it as recently used."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Add a value to the cache, evicting old entries if needed.
+
+        A value bigger than the whole byte budget is not cached.
+        """
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Never flush the whole cache for a value that can't fit.
+                if key in self._entries:
+                    del self._entries[key]
+                    self.size -= self._sizes.pop(key)
+                return
+            self.size += size - self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            while self._entries and (
+                    len(self._entries) > max(self.max_entries, 0) or
+                    (self.max_bytes is not None and
+                     self.size > self.max_bytes)):
+                old_key = self._entries.popitem(last=False)[0]
+                self.size -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """Return the cached value for key or cache the result of factory().
+
+        The factory is called without holding the lock so two threads may
+        both build a missing value; the last one to finish is kept.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Remove every entry from the cache, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return a dict of the cache counters."""
+        return {'entries': len(self._entries), 'size': self.size,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
@@ -0,0 +1,43 @@
+"""The catalog of views a netify app can enable."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from enum import Enum
+from importlib import import_module
+
+
+class Views(Enum):
+    """Enum of the views available to a Netify app.
+
+    The value of each view names the module and class implementing it, so a
+    view's module and its dependencies are only imported when the view is
+    enabled, see load_view.
+    """
+
+    hello_world = 'netify.view:HelloWorld'
+    raw_file = 'netify.rawfile:RawFile'
+    raw_tree = 'netify.rawtree:RawTree'
+    search = 'netify.searchview:Search'
+    metrics = 'netify.metricsview:Metrics'
+
+
+def load_view(view):
+    """Return the view class for a member of Views or a similar Enum.
+
+    The value of the member is either the class itself or a
+    "module:class" string naming it.
+    """
+    if not isinstance(view.value, str):
+        return view.value
+    module_name, _, class_name = view.value.partition(':')
+    return getattr(import_module(module_name), class_name)
@@ -0,0 +1,181 @@
+"""Compress responses with gzip or deflate."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import logging
+import threading
+import time
+import zlib
+
+from flask import request
+
+from .cache import LruCache
+from .config import Section
+from .metrics import REGISTRY
+
+
+# The zlib window bits giving the container format of each content coding.
+ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+COMPRESSIBLE_TYPES = ('application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml')
+
+
+def compress(data, encoding, level=6):
+    """Compress bytes with the named content coding.
+
+    The gzip header is written without a timestamp so the same data always
+    compresses to the same bytes.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def is_compressible(mimetype):
+    """Return True for the mimetypes that are worth compressing."""
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+class Compressor(object):
+    """Compress the responses of a Flask app according to Accept-Encoding.
+
+    The options are read from the [netify] section of the config on each
+    response, so compression follows config reloads. Compressed bodies are
+    kept in an LRU cache keyed by a hash of the uncompressed body, so a page
+    that is served repeatedly is only compressed once. Streamed responses are
+    compressed as they are sent and are not cached.
+
+    The counters are also added to the metrics registry, by content coding,
+    while it is enabled.
+
+    :param netify_app: The NetifyCore object whose config holds the options.
+    :param registry: The MetricsRegistry to record into.
+    """
+
+    def __init__(self, netify_app, registry=REGISTRY):
+        """Create a compressor with an empty cache and counters."""
+        self.netify_app = netify_app
+        self.registry = registry
+        self.cache = LruCache(max_entries=64, name='compress')
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+
+    @property
+    def options(self):
+        """Return the compiled [netify] options."""
+        return self.netify_app.config.get_page_options(Section.netify.value)
+
+    def _count(self, encoding, bytes_in, bytes_out, cpu_time):
+        """Add one compressed response to the counters."""
+        with self._lock:
+            self.responses += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.cpu_time += cpu_time
+        if self.registry.enabled:
+            labels = (encoding,)
+            self.registry.inc('netify_compress_responses_total', labels)
+            self.registry.inc('netify_compress_bytes_in_total', labels,
+                              bytes_in)
+            self.registry.inc('netify_compress_bytes_saved_total', labels,
+                              bytes_in - bytes_out)
+            self.registry.inc('netify_compress_cpu_seconds_total', labels,
+                              cpu_time)
+
+    def stats(self):
+        """Return a dict of the compression counters.
+
+        The cpu_time is the thread CPU time, in seconds, spent compressing
+        bodies that were not in the cache.
+        """
+        return {'responses': self.responses, 'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'bytes_saved': self.bytes_in - self.bytes_out,
+                'cpu_time': self.cpu_time, 'cache': self.cache.stats()}
+
+    def compress_body(self, data, encoding, level):
+        """Return the compressed body, compressing it only once."""
+        key = (hashlib.sha1(data).digest(), encoding, level)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            start = time.thread_time()
+            compressed = compress(data, encoding, level)
+            cpu_time = time.thread_time() - start
+            self.cache.put(key, compressed)
+            self.logger.debug('Compressed %d bytes to %d with %s in %.2f ms',
+                              len(data), len(compressed), encoding,
+                              cpu_time * 1e3)
+        else:
+            cpu_time = 0.0
+        self._count(encoding, len(data), len(compressed), cpu_time)
+        return compressed
+
+    def compress_stream(self, chunks, encoding, level):
+        """Yield the compressed form of a streamed body as it is consumed."""
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      ENCODINGS[encoding])
+        bytes_in = bytes_out = 0
+        cpu_time = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                start = time.thread_time()
+                data = compressor.compress(chunk)
+                cpu_time += time.thread_time() - start
+                bytes_in += len(chunk)
+                if data:
+                    bytes_out += len(data)
+                    yield data
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        data = compressor.flush()
+        self._count(encoding, bytes_in, bytes_out + len(data), cpu_time)
+        yield data
+
+    def after_request(self, response):
+        """Compress the response if the client and the config allow it."""
+        options = self.options
+        if not options['compress']:
+            return response
+        if (response.direct_passthrough or response.status_code != 200 or
+                'Content-Encoding' in response.headers or
+                not is_compressible(response.mimetype)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(list(ENCODINGS))
+        if encoding is None:
+            return response
+        self.cache.max_entries = options['compress_cache_size']
+        level = options['compress_level']
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response,
+                                                     encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < options['compress_min_size']:
+                return response
+            response.set_data(self.compress_body(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # The compressed body differs byte for byte from the original.
+            response.set_etag(etag, weak=True)
+        return response
@@ -12,9 +12,25 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import itertools
+import logging
+import marshal
 import os
+import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
 from configparser import SafeConfigParser
 from enum import Enum
+from types import MappingProxyType
+
+
+# Every compiled snapshot takes the next number so that caches can tell when
+# the config they were built against has been replaced.
+_GENERATIONS = itertools.count(1)
+
+EMPTY_SECTION = MappingProxyType({})
 
 
 def guess_a_config_location():
@@ -32,37 +48,369 @@ def guess_a_config_location():
     return [path for path in paths if os.path.exists(path)]
 
 
+class ConfigError(ValueError):
+    """An option in the config file has a value that can't be used."""
+
+    pass
+
+
+def to_bool(value):
+    """Convert a config string into a bool."""
+    lowered = value.strip().lower()
+    if lowered in ['yes', 'y', 'true', 't', 'on', '1']:
+        return True
+    elif lowered in ['no', 'n', 'false', 'f', 'off', '0']:
+        return False
+    raise ValueError('expected a boolean such as "true" or "false"')
+
+
+def to_int(value):
+    """Convert a config string into an integer."""
+    return int(value.strip())
+
+
+def to_path(value):
+    """Convert a config string into a normalized, absolute path."""
+    if not value.strip():
+        raise ValueError('expected a path')
+    return os.path.abspath(os.path.expanduser(value.strip()))
+
+
+def to_list(value):
+    """Convert a comma separated config string into a tuple of strings."""
+    return tuple(item.strip() for item in value.split(',') if item.strip())
+
+
+_BYTE_SIZE = re.compile(r'^(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?$', re.I)
+_BYTE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3,
+               't': 1024 ** 4}
+
+
+def to_byte_size(value):
+    """Convert a config string like "512", "64k" or "1.5MB" into bytes."""
+    match = _BYTE_SIZE.match(value.strip())
+    if not match:
+        raise ValueError('expected a size such as "512", "64k" or "10MB"')
+    return int(float(match.group(1)) * _BYTE_UNITS[match.group(2).lower()])
+
+
+_DURATION = re.compile(r'^(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)?$', re.I)
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def to_duration(value):
+    """Convert a config string like "2", "250ms" or "5m" into seconds."""
+    match = _DURATION.match(value.strip())
+    if not match:
+        raise ValueError('expected a duration such as "30", "250ms" or "5m"')
+    unit = (match.group(2) or 's').lower()
+    return float(match.group(1)) * _DURATION_UNITS[unit]
+
+
+class Option(namedtuple('Option', ['convert', 'default'])):
+    """Declare the type and default value of an option in a config section.
+
+    :param convert: A function that turns the option's string value into the
+                    value used by the application, raising ValueError for
+                    invalid input. e.g. to_bool, to_int, to_list.
+    :param default: The value used when the option is not in the config file.
+                    It is used as is and not passed through "convert".
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, convert, default=None):
+        """Create a new option declaration."""
+        return super(Option, cls).__new__(cls, convert, default)
+
+
 class Section(Enum):
     """String names for the sections in the Netify config file."""
 
     flask = 'flask'
+    netify = 'netify'
     netify_views = 'netify_views'
     routes = 'routes'
 
 
+def read_secret_key_file(path):
+    """Read the secret keys from a key file.
+
+    The file holds one key per line. The first key is the current key used
+    for signing and any following keys are old keys that are still accepted
+    when verifying. Blank lines and lines starting with "#" are ignored.
+
+    :return: A tuple of the keys with the current key first.
+    """
+    with open(path, 'r') as fin:
+        keys = tuple(line.strip() for line in fin
+                     if line.strip() and not line.startswith('#'))
+    if not keys:
+        raise ConfigError('No secret keys found in %s' % path)
+    return keys
+
+
+def _write_secret_key_file(path, keys, replace):
+    """Atomically write a key file readable only by the owner.
+
+    When "replace" is False an existing key file wins over the new one, so
+    workers racing to create the first key all end up using the same key.
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, mode=0o700, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.secret_key')
+    try:
+        with os.fdopen(fd, 'w') as fout:
+            fout.write('\n'.join(keys) + '\n')
+            fout.flush()
+            os.fsync(fout.fileno())
+        if replace:
+            os.replace(tmp_path, path)
+        else:
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_secret_key_file(path):
+    """Read the keys from a key file, generating the file if it is missing.
+
+    :return: A tuple of the keys with the current key first.
+    """
+    if not os.path.exists(path):
+        _write_secret_key_file(path, [Config.get_random_secret_key().hex()],
+                               replace=False)
+    return read_secret_key_file(path)
+
+
+def rotate_secret_key_file(path, keep=2):
+    """Put a new key at the top of a key file.
+
+    The previous current key and up to "keep" keys in total are retained so
+    that sessions signed before the rotation can still be verified.
+
+    :return: A tuple of the keys written with the new key first.
+    """
+    old_keys = ()
+    if os.path.exists(path):
+        old_keys = read_secret_key_file(path)
+    keys = (Config.get_random_secret_key().hex(),) + old_keys[:keep]
+    _write_secret_key_file(path, keys, replace=True)
+    return keys
+
+
+class ConfigSnapshot(namedtuple('ConfigSnapshot',
+                                ['generation', 'sections', 'strings'])):
+    """An immutable, precompiled copy of every section of a config file.
+
+    :param generation: A unique, increasing number identifying this snapshot.
+    :param sections: Read only mapping of section name to a read only mapping
+                     of the coerced option values.
+    :param strings: The same layout as "sections" but with the interpolated
+                    string values as written in the config file.
+    """
+
+    __slots__ = ()
+
+    def section(self, name):
+        """Return the coerced options for a section or an empty mapping."""
+        return self.sections.get(name, EMPTY_SECTION)
+
+
 class Config(object):
-    """The config object providing access to Netify configuration."""
+    """The config object providing access to Netify configuration.
+
+    The config file is parsed once and every section is compiled into a
+    frozen ConfigSnapshot. All of the section accessors read from the snapshot
+    so handling a request never has to go back to the config parser.
+    """
 
     _instance = None  # storage on the class for the singleton
     default_secret_key_size = 64  # 64 bytes => 512 bits
+    cache_version = 1  # bump when the layout of the cache file changes
+    secret_key_env = 'NETIFY_SECRET_KEY'
+
+    def __init__(self, config_file, schemas=None, strings=None):
+        """Open and read the configuration file from disk.
 
-    def __init__(self, config_file):
-        """Open and read the configuration file from disk."""
+        :param config_file: A path, list of paths or file object to read.
+        :param schemas: Optional dict mapping section names to option schemas.
+                        See register_schema.
+        :param strings: Optional dict of sections holding the interpolated
+                        option strings. When given the file is not parsed
+                        and the "parser" attribute is None. See from_cache.
+        """
         self.file = config_file
-        self.parser = SafeConfigParser()
-        if isinstance(self.file, (str, list)):
-            self.parser.read(self.file)
-        else:  # assume file object was given instead
-            self.parser.read_file(self.file)
+        self.schemas = dict(schemas) if schemas else {}
+        self.source_key = None
+        self.parser = None
+        self._strings = strings
+        if strings is None:
+            if isinstance(self.file, str):
+                self.source_key = self._get_source_key(self.file)
+            self.parser = SafeConfigParser()
+            if isinstance(self.file, (str, list)):
+                self.parser.read(self.file)
+            else:  # assume file object was given instead
+                self.parser.read_file(self.file)
+        self._snapshot = None
 
     @classmethod
     def load_config(cls, config_file):
-        """Load the configuration singleton object from the given file."""
-        cls._instance = cls(config_file)
+        """Load the configuration singleton object from the given file.
+
+        A fresh compiled cache of the file is used instead of parsing it when
+        one is available. See write_cache.
+        """
+        instance = None
+        if isinstance(config_file, str):
+            instance = cls.from_cache(config_file)
+        if instance is None:
+            instance = cls(config_file)
+        cls._instance = instance
+        cls._instance.compile()
         return cls._instance
 
+    @staticmethod
+    def get_cache_path(config_file):
+        """Return the path of the compiled cache for a config file."""
+        head, tail = os.path.split(os.path.abspath(config_file))
+        return os.path.join(head, '.%s.cache' % tail)
+
+    @staticmethod
+    def _get_source_key(config_file):
+        """Return the (path, mtime, size) key identifying a config file."""
+        try:
+            stat = os.stat(config_file)
+        except OSError:
+            return None
+        return (os.path.abspath(config_file), stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def from_cache(cls, config_file, schemas=None):
+        """Load a config from its compiled cache file.
+
+        :return: A new Config object or None if there is no cache or it was
+                 written for a different version of the config file.
+        """
+        try:
+            with open(cls.get_cache_path(config_file), 'rb') as fin:
+                data = marshal.load(fin)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        key = cls._get_source_key(config_file)
+        if (not isinstance(data, dict) or key is None or
+                data.get('version') != cls.cache_version or
+                data.get('key') != key):
+            return None
+        config = cls(config_file, schemas=schemas, strings=data['strings'])
+        config.source_key = key
+        return config
+
+    def write_cache(self):
+        """Atomically write the compiled config next to the source file.
+
+        The cache is keyed by the source path, mtime and size as they were
+        before the file was parsed. Only write it once the config has been
+        validated against all of the registered schemas.
+
+        :return: True if the cache file was written.
+        """
+        if self.source_key is None:
+            return False
+        data = {'version': self.cache_version, 'key': self.source_key,
+                'strings': self.to_string_dict()}
+        path = self.get_cache_path(self.file)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                            prefix=os.path.basename(path))
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                marshal.dump(data, fout)
+            os.replace(tmp_path, path)
+        except OSError:
+            os.remove(tmp_path)
+            return False
+        return True
+
+    def register_schema(self, section, schema):
+        """Declare the types of the options in a config section.
+
+        Declared options are converted and validated when the config is
+        compiled and options missing from the file get their default value.
+        Undeclared options keep the loose string/bool coercion. The snapshot
+        is recompiled on next use.
+
+        :param section: The name of the config section.
+        :param schema: A dict mapping option names to Option objects.
+        """
+        self.schemas[section] = schema
+        self._snapshot = None
+
+    def _compile_section(self, section, raw):
+        """Convert the raw strings of a section using its schema."""
+        schema = self.schemas.get(section, {})
+        options = dict((name, option.default)
+                       for name, option in schema.items())
+        for name, value in raw.items():
+            if name not in schema:
+                options[name] = self._coerce(value)
+                continue
+            try:
+                options[name] = schema[name].convert(value)
+            except ValueError as exc:
+                raise ConfigError('Invalid value %r for option "%s" in the '
+                                  '[%s] section: %s' %
+                                  (value, name, section, exc))
+        return MappingProxyType(options)
+
+    def compile(self):
+        """Compile every section of the parsed file into a new snapshot.
+
+        :raises ConfigError: if an option does not match its schema.
+        """
+        sections = {}
+        strings = {}
+        for section, raw in self._read_strings().items():
+            strings[section] = MappingProxyType(raw)
+        for section in set(strings).union(self.schemas):
+            sections[section] = self._compile_section(
+                section, strings.get(section, EMPTY_SECTION))
+        self._snapshot = ConfigSnapshot(next(_GENERATIONS),
+                                        MappingProxyType(sections),
+                                        MappingProxyType(strings))
+        return self._snapshot
+
+    def _read_strings(self):
+        """Return a dict of sections holding the interpolated strings."""
+        if self._strings is not None:
+            return self._strings
+        return dict((section, dict((option, self.parser.get(section, option))
+                                   for option in self.parser.options(section)))
+                    for section in self.parser.sections())
+
+    @property
+    def snapshot(self):
+        """Return the compiled snapshot, compiling it on first use."""
+        if self._snapshot is None:
+            return self.compile()
+        return self._snapshot
+
+    @property
+    def generation(self):
+        """Return the generation number of the current snapshot."""
+        return self.snapshot.generation
+
     def get(self, *args, **kwargs):
         """Get an Option from one of the Config Sections."""
+        if self.parser is None:  # loaded from the compiled cache
+            return self.snapshot.strings[args[0]][args[1]]
         return self.parser.get(*args, **kwargs)
 
     def to_string_dict(self):
@@ -70,13 +418,8 @@ class Config(object):
 
         All keys and values are strings, as written int he config file.
         """
-        ret_val = {}
-        for section in self.parser.sections():
-            for option in self.parser.options(section):
-                sect = ret_val.get(section, {})
-                sect[option] = self.parser.get(section, option)
-                ret_val[section] = sect
-        return ret_val
+        return dict((section, dict(options))
+                    for section, options in self.snapshot.strings.items())
 
     @classmethod
     def get_random_secret_key(cls, size=None):
@@ -89,46 +432,193 @@ class Config(object):
     def flask_config_dict(self):
         """Parse the config file and create a dict compatible with Flask."""
         flask_config = dict([(obj.name, obj.value) for obj in FlaskDefaults])
-        for option in self.parser.options(Section.flask.value):
-            flask_config[option.upper()] = self.get(Section.flask.value,
-                                                    option)
+        flask_section = self.snapshot.strings.get(Section.flask.value,
+                                                  EMPTY_SECTION)
+        for option, value in flask_section.items():
+            flask_config[option.upper()] = value
         return flask_config
 
+    def get_secret_key_file(self, default=None):
+        """Return the path of the secret key file in use."""
+        options = self.get_page_options(Section.netify.value)
+        return options.get('secret_key_file') or default
+
+    def get_secret_keys(self, default_key_file=None):
+        """Find the secret keys shared by all of the app's workers.
+
+        The keys are taken from the first of these that is set:
+
+          - the NETIFY_SECRET_KEY environment variable, a comma separated
+            list of keys.
+          - the "secret_key" option of the [flask] section.
+          - the key file given by the "secret_key_file" option of the
+            [netify] section, or else default_key_file. The key file is
+            generated on first use. See read_secret_key_file.
+
+        :return: A tuple of keys with the key used for signing first.
+        """
+        return self._find_secret_keys(default_key_file)[0]
+
+    def _find_secret_keys(self, default_key_file=None):
+        """Return the secret keys and the key file they were read from.
+
+        The key file is None when the keys come from the environment or the
+        [flask] section. See get_secret_keys.
+        """
+        env_keys = to_list(os.getenv(self.secret_key_env, ''))
+        if env_keys:
+            return env_keys, None
+        flask_section = self.snapshot.strings.get(Section.flask.value,
+                                                  EMPTY_SECTION)
+        if flask_section.get('secret_key'):
+            return (flask_section['secret_key'],), None
+        key_file = self.get_secret_key_file(default_key_file)
+        if key_file is None:
+            raise ConfigError('No secret key has been configured.')
+        return load_secret_key_file(key_file), key_file
+
     def update_flask(self, flask_app):
-        """Add the options from the Flask section into the flask object."""
-        flask_app.config.update(self.flask_config_dict)
-
-    def _section_as_dict(self, section):
-        views = {}
-        for option in self.parser.options(section):
-            # Don't know which options might be boolean so we can't use
-            # self.parser.getboolean()
-            tmp = self.get(section, option)
-            if str(tmp).lower() in ['yes', 'y', 'true', 't']:
-                views[option] = True
-            elif str(tmp).lower() in ['no', 'n', 'false', 'f']:
-                views[option] = False
-            else:
-                views[option] = str(tmp)
-        return views
+        """Add the options from the Flask section into the flask object.
+
+        The secret keys are found with get_secret_keys, using a key file in
+        the Flask instance folder by default. If no key can be loaded a random
+        key is used, which is only good for a single worker process.
+
+        When the keys come from a key file its path is set as the
+        "SECRET_KEY_FILE" Flask option so that the session interface can
+        pick up a rotated key without restarting the workers.
+        """
+        flask_config = self.flask_config_dict
+        try:
+            keys, key_file = self._find_secret_keys(
+                os.path.join(flask_app.instance_path, 'secret_key'))
+        except (OSError, ConfigError) as exc:
+            logging.getLogger(__name__).warning(
+                'Using a random secret key, sessions will not be shared '
+                'between workers: %s', exc)
+            keys, key_file = (self.get_random_secret_key(),), None
+        flask_config['SECRET_KEY'] = keys[0]
+        flask_config['SECRET_KEY_FALLBACKS'] = list(keys[1:])
+        flask_config['SECRET_KEY_FILE'] = key_file
+        flask_app.config.update(flask_config)
+
+    @staticmethod
+    def _coerce(value):
+        """Convert a string option value into a bool when it looks like one."""
+        # Don't know which options might be boolean so we can't use
+        # self.parser.getboolean()
+        if str(value).lower() in ['yes', 'y', 'true', 't']:
+            return True
+        elif str(value).lower() in ['no', 'n', 'false', 'f']:
+            return False
+        return str(value)
 
     @property
     def netify_views(self):
         """Get the 'netify_views' section."""
-        return self._section_as_dict(Section.netify_views.value)
+        return self.snapshot.section(Section.netify_views.value)
 
     def get_page_options(self, name):
-        """Return a dict of options for a page."""
-        return self._section_as_dict(name)
+        """Return a read only mapping of options for a page."""
+        return self.snapshot.section(name)
 
     @property
     def routes(self):
         """Return the routes section from the config file."""
-        return self._section_as_dict(Section.routes.value)
+        return self.snapshot.section(Section.routes.value)
+
+
+class ConfigWatcher(object):
+    """Reload a config file in the background whenever it changes on disk.
+
+    The file's mtime and size are polled from a daemon thread so the
+    replacement Config is parsed and compiled off the request path. Once the
+    new config is ready it is handed to the NetifyCore object's configure
+    method which swaps it in. Caches built against the old config notice the
+    change through the new snapshot generation number.
+
+    :param netify_app: The NetifyCore object to reconfigure.
+    :param interval: Seconds to wait between polls of the config file.
+    """
+
+    default_interval = 2.0
+
+    def __init__(self, netify_app, interval=None):
+        """Create a watcher for the config file used by netify_app."""
+        self.netify_app = netify_app
+        self.path = netify_app.config.file
+        self.interval = interval if interval else self.default_interval
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self):
+        """Return a cheap fingerprint of the config file."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def ensure_running(self):
+        """Start the polling thread if it isn't running in this process.
+
+        This is safe to call on every request. Forked workers (as started by
+        uwsgi) do not inherit the parent's threads so the watcher is started
+        lazily in the process that actually serves requests.
+        """
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run,
+                                            name='netify-config-watcher')
+            self._thread.daemon = True
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        """Poll the config file forever."""
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception('Failed to reload config file %s',
+                                      self.path)
+
+    def check(self):
+        """Reload the config if the file changed since the last check.
+
+        :return: True if a new config was swapped in.
+        """
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        old_config = self.netify_app.config
+        new_config = old_config.__class__(self.path,
+                                          schemas=old_config.schemas)
+        new_config.compile()
+        for section in (Section.netify_views, Section.routes):
+            if (old_config.snapshot.strings.get(section.value) !=
+                    new_config.snapshot.strings.get(section.value)):
+                self.logger.warning(
+                    'The [%s] section of %s changed. A restart is required '
+                    'for it to take effect.', section.value, self.path)
+        self.netify_app.configure(new_config)
+        if new_config.get_page_options(Section.netify.value).get(
+                'config_cache', False):
+            new_config.write_cache()
+        self.logger.info('Reloaded config file %s (generation %s).',
+                         self.path, new_config.generation)
+        return True
 
 
 class FlaskDefaults(Enum):
     """Default values for the Flask section of the config file."""
 
-    SECRET_KEY = Config.get_random_secret_key()
     LOGGER_NAME = 'netify'
@@ -0,0 +1,230 @@
+"""Cache rendered text in files shared by every process of a host."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+# Open disk caches, keyed by their directory.
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+# Entries being written are hidden from readers and the eviction scan.
+_TEMP_PREFIX = '.tmp-'
+
+
+class DiskCache(object):
+    """A cache of text stored as one file per entry in a directory.
+
+    Every process using the same directory shares the entries, which
+    survive restarts. An entry is written to a temporary file which is
+    then renamed over the entry, so readers only ever see complete entries
+    and an entry is never truncated while it is read. Each hit reads and
+    decodes the whole file; only the page cache is shared between the
+    processes, not the decoded text.
+
+    The entries are kept within max_bytes by a scan of the directory that
+    removes the least recently used entries, by mtime, until the total is
+    below low_water of the budget. A process scans when the entries it
+    wrote could have taken the total over the budget, or when it last
+    scanned more than scan_interval seconds ago. A hit refreshes the mtime
+    of an entry that wasn't used for touch_interval seconds.
+
+    :param directory: The directory to keep the entries in. It is created
+                      when the first entry is written.
+    :param max_bytes: The budget for the total size of the entries.
+    """
+
+    touch_interval = 60.0
+
+    scan_interval = 60.0
+
+    low_water = 0.9
+
+    # Temporary files left behind by a process that died while writing.
+    stale_age = 3600.0
+
+    def __init__(self, directory, max_bytes):
+        """Create a cache of the entries in a directory."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._size = None
+        self._scanned = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _get_path(self, key):
+        """Return the path of the file holding the entry for key.
+
+        The entries are spread over 256 subdirectories so no directory grows
+        too large.
+        """
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def get(self, key):
+        """Return the text cached for key or None."""
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as fin:
+                entry_stat = os.fstat(fin.fileno())
+                text = str(fin.read(), 'utf-8')
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        if time.time() - entry_stat.st_mtime > self.touch_interval:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key, text):
+        """Cache the text for key, evicting old entries if needed.
+
+        Text bigger than the whole budget is not cached.
+
+        :return: True if the entry was written.
+        """
+        data = text.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return False
+        path = self._get_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                             prefix=_TEMP_PREFIX)
+            try:
+                with os.fdopen(fd, 'wb') as fout:
+                    fout.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError:
+            self.logger.warning('Failed to write to the disk cache %s',
+                                self.directory, exc_info=True)
+            return False
+        with self._lock:
+            self.writes += 1
+            if self._size is not None:
+                self._size += len(data)
+            scan = (self._size is None or self._size > self.max_bytes or
+                    time.monotonic() - self._scanned > self.scan_interval)
+        if scan:
+            self.evict()
+        return True
+
+    def _scan(self):
+        """Return the (mtime, size, path) of every entry.
+
+        Temporary files older than stale_age are removed along the way.
+        """
+        entries = []
+        now = time.time()
+        try:
+            with os.scandir(self.directory) as dir_entries:
+                subdirs = [entry.path for entry in dir_entries
+                           if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return entries
+        for subdir in subdirs:
+            try:
+                with os.scandir(subdir) as dir_entries:
+                    for dir_entry in dir_entries:
+                        try:
+                            entry_stat = dir_entry.stat()
+                            if not dir_entry.name.startswith(_TEMP_PREFIX):
+                                entries.append((entry_stat.st_mtime,
+                                                entry_stat.st_size,
+                                                dir_entry.path))
+                            elif now - entry_stat.st_mtime > self.stale_age:
+                                os.unlink(dir_entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries while over the budget.
+
+        Other processes may be evicting at the same time; an entry one of
+        them already removed still counts as evicted.
+
+        :return: The number of entries removed.
+        """
+        entries = self._scan()
+        total = sum(entry[1] for entry in entries)
+        removed = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * self.low_water
+            entries.sort()
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        with self._lock:
+            self._size = total
+            self._scanned = time.monotonic()
+            self.evictions += removed
+        return removed
+
+    def stats(self):
+        """Return a dict of the cache counters of this process.
+
+        The size is the total found by the last scan plus what this process
+        has written since.
+        """
+        return {'size': self._size or 0, 'hits': self.hits,
+                'misses': self.misses, 'writes': self.writes,
+                'evictions': self.evictions}
+
+
+def get_disk_cache(directory, max_bytes):
+    """Return the DiskCache of a directory, shared by all threads.
+
+    The budget of the cache is set to max_bytes, so a config change takes
+    effect on the next call.
+    """
+    with _CACHES_LOCK:
+        cache = _CACHES.get(directory)
+        if cache is None:
+            cache = _CACHES[directory] = DiskCache(directory, max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
+
+
+def get_disk_caches():
+    """Return the DiskCache objects used by this process."""
+    with _CACHES_LOCK:
+        return list(_CACHES.values())
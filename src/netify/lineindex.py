@@ -0,0 +1,148 @@
+"""Find lines in large files without reading them from the start."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from array import array
+from bisect import bisect_left
+import mmap
+import threading
+
+from .cache import LruCache
+
+
+# Line indexes of recently viewed files, keyed by device and inode.
+LINE_INDEX_CACHE = LruCache(max_entries=64, name='line_index')
+
+
+class LineIndex(object):
+    """A sparse index of the newlines in a file.
+
+    The index records how many newlines come before the start of each block
+    of block_size bytes, so finding a line only means scanning the one block
+    it starts in. The blocks are counted with bytes.count, never line by
+    line. When the file grows the index is extended from its last complete
+    block; when it is truncated or rewritten the index is rebuilt.
+
+    :param block_size: The number of bytes between index entries.
+    """
+
+    fingerprint_size = 64
+
+    def __init__(self, block_size=64 * 1024):
+        """Create an index of an empty file."""
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything that has been indexed."""
+        self.counts = array('Q', [0])
+        self.size = 0
+        self.newlines = 0
+        self.stamp = None
+        self._fingerprint = b''
+        self._last_byte = b''
+
+    def _fingerprint_of(self, data, size):
+        """Return the bytes just before offset size."""
+        return data[max(0, size - self.fingerprint_size):size]
+
+    def update(self, data, stamp):
+        """Bring the index up to date with the contents of a file.
+
+        The caller must hold the index's lock, see locate.
+
+        :param data: The file contents as an mmap or bytes object.
+        :param stamp: The file's (size, mtime) stat fingerprint. Nothing is
+                      read when it matches the indexed one.
+        """
+        if stamp == self.stamp:
+            return
+        size = len(data)
+        if (size <= self.size or self._fingerprint_of(data, self.size) !=
+                self._fingerprint):
+            self.reset()
+        block_size = self.block_size
+        pos = (len(self.counts) - 1) * block_size
+        running = self.counts[-1]
+        while pos + block_size <= size:
+            running += data[pos:pos + block_size].count(b'\n')
+            self.counts.append(running)
+            pos += block_size
+        self.newlines = running + data[pos:size].count(b'\n')
+        self.size = size
+        self.stamp = stamp
+        self._fingerprint = self._fingerprint_of(data, size)
+        self._last_byte = data[size - 1:size]
+
+    def locate(self, data, stamp, start, count):
+        """Update the index and return the byte range of some lines.
+
+        :param start: The first line, counted from 0. A negative start
+                      counts back from the end of the file.
+        :param count: The number of lines.
+        :return: A (begin, end, start, lines) tuple of the byte range, the
+                 first line of the range and the number of lines in the
+                 file.
+        """
+        with self._lock:
+            self.update(data, stamp)
+            lines = self.lines
+            if start < 0:
+                start = max(0, lines + start)
+            begin, end = self.line_range(data, start, count)
+        return begin, end, start, lines
+
+    @property
+    def lines(self):
+        """Return the number of lines, counting an unterminated last line."""
+        if self._last_byte in (b'', b'\n'):
+            return self.newlines
+        return self.newlines + 1
+
+    def line_offset(self, data, line):
+        """Return the byte offset where a line, counted from 0, starts."""
+        if line <= 0:
+            return 0
+        if line > self.newlines:
+            return self.size
+        block = bisect_left(self.counts, line) - 1
+        pos = block * self.block_size
+        for _ in range(line - self.counts[block]):
+            pos = data.find(b'\n', pos) + 1
+        return pos
+
+    def line_range(self, data, start, count):
+        """Return the (begin, end) byte offsets of count lines from start."""
+        return (self.line_offset(data, start),
+                self.line_offset(data, start + count))
+
+
+def find_lines(path, file_stat, start, count, block_size=64 * 1024):
+    """Locate a range of lines in a file using its cached LineIndex.
+
+    The file is mapped into memory so only the blocks that haven't been
+    indexed yet and the block the range starts in are read. See
+    LineIndex.locate for the arguments and return value.
+    """
+    key = (file_stat.st_dev, file_stat.st_ino)
+    index = LINE_INDEX_CACHE.get(key)
+    if index is None or index.block_size != block_size:
+        index = LineIndex(block_size)
+        LINE_INDEX_CACHE.put(key, index)
+    stamp = (file_stat.st_size, file_stat.st_mtime_ns)
+    if file_stat.st_size == 0:
+        return index.locate(b'', stamp, start, count)
+    with open(path, 'rb') as fin:
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return index.locate(data, stamp, start, count)
@@ -0,0 +1,493 @@
+"""Record request metrics and report them in the Prometheus text format."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from bisect import bisect_left
+from collections import namedtuple
+from functools import wraps
+from time import perf_counter
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from flask import request
+
+from .cache import CACHES
+from .diskcache import get_disk_caches
+
+
+# The upper bounds of the buckets of the latency histograms, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The upper bounds of the buckets of the response size histogram, in bytes.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216)
+
+# The file of the merged samples of the processes that have exited.
+ARCHIVE_FILE = 'archive.json'
+
+# The start time and endpoint of the request each thread is handling.
+_REQUEST = threading.local()
+
+
+class Family(namedtuple('Family', ['kind', 'help', 'labels', 'buckets'])):
+    """Describe a metric and the labels its samples are recorded with.
+
+    :param kind: "counter", "gauge" or "histogram".
+    :param help: The help text reported for the metric.
+    :param labels: The names of the labels, in the order their values are
+                   given when a sample is recorded.
+    :param buckets: The upper bounds of the buckets of a histogram.
+    """
+
+    __slots__ = ()
+
+
+FAMILIES = {
+    'netify_requests_total': Family(
+        'counter', 'Requests handled, by view and status code.',
+        ('view', 'status'), None),
+    'netify_request_duration_seconds': Family(
+        'histogram', 'Time taken to handle a request until its response '
+        'is ready to be sent, by view.', ('view',), LATENCY_BUCKETS),
+    'netify_phase_duration_seconds': Family(
+        'histogram', 'Time spent in each phase of handling a request, by '
+        'view and phase.', ('view', 'phase'), LATENCY_BUCKETS),
+    'netify_response_size_bytes': Family(
+        'histogram', 'Size of the response bodies of a known length, by '
+        'view.', ('view',), SIZE_BUCKETS),
+    'netify_cache_hits_total': Family(
+        'counter', 'Hits of the in-process caches.', ('cache',), None),
+    'netify_cache_misses_total': Family(
+        'counter', 'Misses of the in-process caches.', ('cache',), None),
+    'netify_cache_evictions_total': Family(
+        'counter', 'Evictions from the in-process caches.', ('cache',),
+        None),
+    'netify_cache_entries': Family(
+        'gauge', 'Entries held by the in-process caches.', ('cache',), None),
+    'netify_cache_size_bytes': Family(
+        'gauge', 'Bytes held by the in-process caches with a byte budget.',
+        ('cache',), None),
+    'netify_disk_cache_hits_total': Family(
+        'counter', 'Hits of the disk caches.', ('directory',), None),
+    'netify_disk_cache_misses_total': Family(
+        'counter', 'Misses of the disk caches.', ('directory',), None),
+    'netify_disk_cache_writes_total': Family(
+        'counter', 'Entries written to the disk caches.', ('directory',),
+        None),
+    'netify_disk_cache_evictions_total': Family(
+        'counter', 'Entries evicted from the disk caches.', ('directory',),
+        None),
+    'netify_compress_responses_total': Family(
+        'counter', 'Responses compressed, by content coding.', ('encoding',),
+        None),
+    'netify_compress_bytes_in_total': Family(
+        'counter', 'Bytes of the response bodies before compression.',
+        ('encoding',), None),
+    'netify_compress_bytes_saved_total': Family(
+        'counter', 'Bytes saved by compressing response bodies.',
+        ('encoding',), None),
+    'netify_compress_cpu_seconds_total': Family(
+        'counter', 'Thread CPU time spent compressing response bodies.',
+        ('encoding',), None),
+}
+
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format."""
+    return (value.replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def format_labels(names, values):
+    """Return the label set of a sample as written in the text format."""
+    return ','.join('%s="%s"' % (name, escape_label(str(value)))
+                    for name, value in zip(names, values))
+
+
+def format_value(value):
+    """Return a sample value or bucket bound as written in the text format."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def format_text(samples):
+    """Return merged samples in the Prometheus text exposition format.
+
+    :param samples: A dict mapping the metric names to dicts of the values
+                    keyed by their label set, as returned by collect.
+                    Histogram values are lists of the count of every bucket,
+                    including the "+Inf" bucket, followed by their sum.
+    """
+    lines = []
+    for name, family in FAMILIES.items():
+        values = samples.get(name)
+        if not values:
+            continue
+        lines.append('# HELP %s %s' % (name, family.help))
+        lines.append('# TYPE %s %s' % (name, family.kind))
+        for labels in sorted(values):
+            value = values[labels]
+            if family.kind != 'histogram':
+                lines.append('%s{%s} %s' % (name, labels,
+                                            format_value(value)))
+                continue
+            prefix = labels + ',' if labels else ''
+            count = 0
+            bounds = family.buckets + (float('inf'),)
+            for bound, bucket_count in zip(bounds, value):
+                count += bucket_count
+                lines.append('%s_bucket{%sle="%s"} %d' % (
+                    name, prefix, format_value(bound), count))
+            lines.append('%s_sum{%s} %s' % (name, labels,
+                                            format_value(value[-1])))
+            lines.append('%s_count{%s} %d' % (name, labels, count))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def merge_samples(merged, samples, with_gauges=True):
+    """Add the samples of one process to merged samples, in place.
+
+    Counters and histograms are summed. Gauges are summed too, which
+    gives the total over the processes, unless with_gauges is false: the
+    gauges of a process that has exited no longer hold. Samples of unknown
+    metrics, or of histograms whose buckets have changed, are skipped.
+    """
+    for name, values in samples.items():
+        family = FAMILIES.get(name)
+        if family is None or (family.kind == 'gauge' and not with_gauges):
+            continue
+        target = merged.setdefault(name, {})
+        for labels, value in values.items():
+            if family.kind != 'histogram':
+                target[labels] = target.get(labels, 0) + value
+            elif len(value) == len(family.buckets) + 2:
+                old = target.get(labels)
+                target[labels] = (list(value) if old is None else
+                                  [a + b for a, b in zip(old, value)])
+    return merged
+
+
+def _read_samples(path):
+    """Return the samples saved in a file, or None if it can't be read."""
+    try:
+        with open(path, 'r', encoding='utf-8') as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_samples(path, samples):
+    """Save samples to a file, replacing it atomically."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fout:
+            json.dump(samples, fout)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _is_running(pid):
+    """Return True if a process with this pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def cache_samples():
+    """Return the samples of the counters of the caches of this process."""
+    samples = dict((name, {}) for name in FAMILIES)
+    for name, cache in sorted(CACHES.items()):
+        labels = format_labels(('cache',), (name,))
+        stats = cache.stats()
+        samples['netify_cache_hits_total'][labels] = stats['hits']
+        samples['netify_cache_misses_total'][labels] = stats['misses']
+        samples['netify_cache_evictions_total'][labels] = stats['evictions']
+        samples['netify_cache_entries'][labels] = stats['entries']
+        samples['netify_cache_size_bytes'][labels] = stats['size']
+    for cache in get_disk_caches():
+        labels = format_labels(('directory',), (cache.directory,))
+        stats = cache.stats()
+        for counter in ('hits', 'misses', 'writes', 'evictions'):
+            samples['netify_disk_cache_%s_total' % counter][labels] = (
+                stats[counter])
+    return dict((name, values) for name, values in samples.items()
+                if values)
+
+
+class MetricsRegistry(object):
+    """The metrics recorded by this process, shared by all of its threads.
+
+    Nothing is recorded until enable is called. The samples are then kept
+    in memory and a daemon thread saves them, every flush_interval seconds
+    while they change, to a file of this process in a directory shared by
+    every process of the host. Forked workers, such as those of uwsgi or
+    PreforkServer, each start from empty samples and save them to their
+    own file, so collect can merge the files into totals for the host.
+
+    The files of processes that have exited are folded into an archive
+    file by collect, so the counters keep growing across worker restarts.
+    Remove the directory to reset them.
+    """
+
+    def __init__(self):
+        """Create a disabled registry with no samples."""
+        self.enabled = False
+        self.directory = None
+        self.flush_interval = 1.0
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._pid = None
+        self._path = None
+        self._changed = False
+        self._stopped = threading.Event()
+
+    def enable(self, directory, flush_interval=1.0):
+        """Start recording samples and saving them to directory."""
+        with self._lock:
+            self.directory = directory
+            self.flush_interval = flush_interval
+            self._pid = None
+            self._stopped.set()
+            self.enabled = True
+
+    def disable(self):
+        """Stop recording samples, forgetting those of this process."""
+        with self._lock:
+            self.enabled = False
+            self._samples = {}
+            self._pid = None
+            self._path = None
+            self._stopped.set()
+
+    def _start_process(self):
+        """Start afresh in a new process, as after a fork.
+
+        This must be called with the lock held.
+        """
+        pid = self._pid = os.getpid()
+        self._samples = {}
+        self._path = os.path.join(self.directory, '%d-%s.json' % (
+            pid, os.urandom(4).hex()))
+        self._stopped = threading.Event()
+        thread = threading.Thread(target=self._flush_loop,
+                                  args=(self._stopped,),
+                                  name='netify-metrics')
+        thread.daemon = True
+        thread.start()
+
+    def inc(self, name, label_values, amount=1):
+        """Add to a counter."""
+        key = (name, label_values)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start_process()
+            self._samples[key] = self._samples.get(key, 0) + amount
+            self._changed = True
+
+    def observe(self, name, label_values, value):
+        """Add a value to a histogram."""
+        buckets = FAMILIES[name].buckets
+        key = (name, label_values)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start_process()
+            counts = self._samples.get(key)
+            if counts is None:
+                counts = self._samples[key] = [0] * (len(buckets) + 2)
+            counts[bisect_left(buckets, value)] += 1
+            counts[-1] += value
+            self._changed = True
+
+    def snapshot(self):
+        """Return the samples of this process with their labels formatted.
+
+        The counters of the caches are read at the same time.
+        """
+        with self._lock:
+            samples = [(key, list(value) if isinstance(value, list) else
+                        value) for key, value in self._samples.items()]
+            self._changed = False
+        snapshot = cache_samples()
+        for (name, label_values), value in samples:
+            labels = format_labels(FAMILIES[name].labels, label_values)
+            snapshot.setdefault(name, {})[labels] = value
+        return snapshot
+
+    def flush(self):
+        """Save the samples of this process to its file."""
+        with self._lock:
+            if not self.enabled:
+                return
+            if self._pid != os.getpid():
+                self._start_process()
+            path = self._path
+        samples = self.snapshot()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_samples(path, samples)
+        except OSError:
+            self.logger.warning('Failed to save the metrics to %s', path,
+                                exc_info=True)
+
+    def _flush_loop(self, stopped):
+        """Save the samples while they change, until stopped is set."""
+        while not stopped.wait(self.flush_interval):
+            with self._lock:
+                changed = self._changed
+            if changed:
+                self.flush()
+
+    def collect(self):
+        """Return the samples of every process using the directory, merged.
+
+        The samples of this process are saved first so they are up to date.
+        The other processes' are as of their last flush.
+        """
+        self.flush()
+        merged = {}
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            # Only one process at a time folds the files into the archive.
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archive = _read_samples(archive_path) or {}
+            folded = []
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if (entry.name.startswith('.') or
+                            entry.name == ARCHIVE_FILE or
+                            not entry.name.endswith('.json')):
+                        continue
+                    samples = _read_samples(entry.path)
+                    if samples is None:
+                        continue
+                    try:
+                        pid = int(entry.name.split('-', 1)[0])
+                    except ValueError:
+                        continue
+                    if _is_running(pid):
+                        merge_samples(merged, samples)
+                    else:
+                        merge_samples(archive, samples, with_gauges=False)
+                        folded.append(entry.path)
+            if folded:
+                _write_samples(archive_path, archive)
+                for path in folded:
+                    os.unlink(path)
+        return merge_samples(merged, archive)
+
+
+# The registry of this process.
+REGISTRY = MetricsRegistry()
+
+
+def start_timer():
+    """Return the start time to pass to observe_phase.
+
+    None is returned while the registry is disabled, which makes the other
+    calls do nothing.
+    """
+    return perf_counter() if REGISTRY.enabled else None
+
+
+def current_view():
+    """Return the endpoint of the request this thread is handling.
+
+    The endpoint is noted by RequestMetrics.before_request: looking it up
+    through the request context for every phase would take longer than
+    recording the phase. "" is returned outside a request.
+    """
+    return getattr(_REQUEST, 'view', '')
+
+
+def observe_phase(phase, start):
+    """Record the time taken by a phase of the current request."""
+    if start is not None:
+        REGISTRY.observe('netify_phase_duration_seconds',
+                         (current_view(), phase), perf_counter() - start)
+
+
+def timed(phase):
+    """Decorate a function to record the time of its calls as a phase."""
+    def decorator(func):
+        """Wrap func with a timer."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            """Call func, timing it while metrics are recorded."""
+            if not REGISTRY.enabled:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe('netify_phase_duration_seconds',
+                                 (getattr(_REQUEST, 'view', ''), phase),
+                                 perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class RequestMetrics(object):
+    """Time the requests of a Flask app and measure their responses.
+
+    The hooks are installed once and do nothing while the registry is
+    disabled. The time of a streamed response stops once the response is
+    ready to be streamed and its size is only known if it was given a
+    Content-Length.
+
+    :param registry: The MetricsRegistry to record into.
+    """
+
+    def __init__(self, registry=REGISTRY):
+        """Create the hooks for a registry."""
+        self.registry = registry
+
+    def before_request(self):
+        """Start timing a request."""
+        _REQUEST.start = start_timer()
+        _REQUEST.view = ('' if _REQUEST.start is None else
+                         request.endpoint or '')
+
+    def after_request(self, response):
+        """Record the time taken by a request and the size of its response."""
+        start = getattr(_REQUEST, 'start', None)
+        if start is None:
+            return response
+        view = _REQUEST.view
+        _REQUEST.start = None
+        _REQUEST.view = ''
+        self.registry.observe('netify_request_duration_seconds', (view,),
+                              perf_counter() - start)
+        self.registry.inc('netify_requests_total',
+                          (view, str(response.status_code)))
+        size = response.content_length
+        if size is not None:
+            self.registry.observe('netify_response_size_bytes', (view,),
+                                  size)
+        return response
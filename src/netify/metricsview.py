@@ -0,0 +1,59 @@
+"""A view reporting the metrics of the app for Prometheus to scrape."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+from flask import Response
+
+from .config import Option
+from .config import to_duration
+from .config import to_path
+from .metrics import REGISTRY
+from .metrics import format_text
+from .view import NetifyView
+
+
+# The content type of the Prometheus text exposition format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metrics(NetifyView):
+    """Report the request, phase and cache metrics of every worker process.
+
+    Metrics are only recorded while this view is enabled. Its options are
+    read when it is registered: the worker processes save their samples to
+    the files in "directory", by default "metrics" in the instance path,
+    every "flush_interval" seconds and each scrape merges them.
+    """
+
+    name = 'metrics'
+    route_base = '/metrics'
+    option_schema = {
+        'directory': Option(to_path, None),
+        'flush_interval': Option(to_duration, 1.0),
+    }
+
+    @classmethod
+    def register(cls, netify_app, **kwargs):
+        """Register this view and start recording metrics."""
+        super(Metrics, cls).register(netify_app, **kwargs)
+        options = netify_app.config.get_page_options(cls.name)
+        directory = options['directory'] or os.path.join(
+            netify_app.flask_app.instance_path, 'metrics')
+        REGISTRY.enable(directory, options['flush_interval'])
+
+    def index(self):
+        """Return the merged metrics in the Prometheus text format."""
+        return Response(format_text(REGISTRY.collect()),
+                        content_type=CONTENT_TYPE)
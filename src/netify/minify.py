@@ -0,0 +1,129 @@
+"""Minify HTML pages as they are rendered or streamed."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import re
+
+
+VOID_ELEMENTS = ('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                 'link', 'meta', 'param', 'source', 'track', 'wbr')
+
+# Elements whose content is whitespace sensitive or not HTML at all.
+PRESERVED_ELEMENTS = ('pre', 'textarea', 'script', 'style')
+
+_PRESERVE_RE = re.compile(r'<(%s)\b[^>]*>' % '|'.join(PRESERVED_ELEMENTS),
+                          re.I)
+
+_PRESERVE_END_RES = {name: re.compile(r'</%s\s*>' % name, re.I)
+                     for name in PRESERVED_ELEMENTS}
+
+# End tags that are optional (li) or ignored by browsers (void elements).
+_END_TAG_RE = re.compile(r'</(?:li|%s)\s*>' % '|'.join(VOID_ELEMENTS), re.I)
+
+_SELF_CLOSING_RE = re.compile(r'(<(?:%s)\b[^>]*?)\s*/>' %
+                              '|'.join(VOID_ELEMENTS), re.I)
+
+# A double quoted attribute value that is safe to leave unquoted. The
+# lookahead makes sure the match is inside a tag rather than in text.
+_QUOTED_ATTR_RE = re.compile(r'''="([^\s"'=<>`]+)"(?!/)(?=[^<>]*>)''')
+
+# Whitespace in text, other than a single space, is collapsed to one space.
+# The match starts with a plain \s so the regex engine can skip ahead fast.
+_SPACE_RE = re.compile(r'\s(?:(?<=[^ ])|(?=\s))\s*(?=[^<>]*(?:<|\Z))')
+
+
+def minify_html(text):
+    """Minify a complete piece of HTML with no preserved elements in it.
+
+    Runs of whitespace in text become a single space, optional and ignored
+    end tags are dropped, void elements lose their self closing slash and
+    simple attribute values lose their quotes.
+    """
+    text = _END_TAG_RE.sub('', text)
+    if '/>' in text:
+        text = _SELF_CLOSING_RE.sub(r'\1>', text)
+    text = _QUOTED_ATTR_RE.sub(r'=\1', text)
+    return _SPACE_RE.sub(' ', text)
+
+
+def _incomplete_tag(text, start):
+    """Return the index of an unfinished tag at the end of text or -1."""
+    index = text.rfind('<', start)
+    if index != -1 and text.find('>', index) == -1:
+        return index
+    return -1
+
+
+class HtmlMinifier(object):
+    """Minify HTML that arrives in chunks.
+
+    The content of pre, textarea, script and style elements is passed
+    through byte for byte. A tag or run of whitespace split between two
+    chunks is held back until the rest of it has been fed in, so the output
+    doesn't depend on where the chunks were split.
+    """
+
+    def __init__(self):
+        """Create a minifier at the start of a document."""
+        self._pending = ''
+        self._end_re = None
+
+    def feed(self, chunk):
+        """Minify the next chunk and return as much output as is ready."""
+        # Markup chunks are converted so the pending text isn't escaped.
+        text = self._pending + str(chunk)
+        out = []
+        pos = 0
+        while pos < len(text):
+            if self._end_re is not None:
+                match = self._end_re.search(text, pos)
+                if match is None:
+                    cut = _incomplete_tag(text, pos)
+                    cut = len(text) if cut == -1 else cut
+                    out.append(text[pos:cut])
+                    pos = cut
+                    break
+                out.append(text[pos:match.end()])
+                pos = match.end()
+                self._end_re = None
+            else:
+                match = _PRESERVE_RE.search(text, pos)
+                if match is None:
+                    cut = _incomplete_tag(text, pos)
+                    if cut == -1:
+                        cut = max(pos, len(text.rstrip()))
+                    out.append(minify_html(text[pos:cut]))
+                    pos = cut
+                    break
+                out.append(minify_html(text[pos:match.end()]))
+                pos = match.end()
+                self._end_re = _PRESERVE_END_RES[match.group(1).lower()]
+        self._pending = text[pos:]
+        return ''.join(out)
+
+    def flush(self):
+        """Return the output held back for the end of the document."""
+        text, self._pending = self._pending, ''
+        if self._end_re is not None:
+            return text
+        return minify_html(text)
+
+
+def minify_chunks(chunks):
+    """Yield the minified form of an iterable of HTML strings."""
+    minifier = HtmlMinifier()
+    for chunk in chunks:
+        data = minifier.feed(chunk)
+        if data:
+            yield data
+    yield minifier.flush()
@@ -0,0 +1,694 @@
+"""The RawFile view, serving a directory of files in raw form."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from bisect import bisect_right
+from datetime import datetime
+import codecs
+import itertools
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+
+from flask import abort
+from flask import url_for
+from flask import make_response
+from flask import Markup
+from flask import request
+from flask import Response
+from flask import session
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+from yattag import Doc
+
+from .cache import LruCache
+from .config import Option
+from .config import to_bool
+from .config import to_byte_size
+from .config import to_int
+from .config import to_list
+from .config import to_path
+from .diskcache import get_disk_cache
+from .lineindex import find_lines
+from .template import HtmlPage
+from .template import link_list_to_html_list
+from .template import list_to_html_list
+from .view import NetifyView
+
+
+# Rendered directory listings, keyed by the directory's stat fingerprint.
+# The listing_cache_size option is split evenly between this cache and
+# DIR_INDEX_CACHE.
+LISTING_CACHE = LruCache(max_entries=256, max_bytes=8 * 1024 ** 2,
+                         name='listing')
+
+# The sorted names listed for a directory, keyed like LISTING_CACHE.
+DIR_INDEX_CACHE = LruCache(max_entries=64, max_bytes=8 * 1024 ** 2,
+                           sizeof=lambda names: sum(map(len, names)),
+                           name='dir_index')
+
+
+class RawView(NetifyView):
+    """A base for the views of a directory of files served in raw form.
+
+    The directory is given by the "path" option, and names given to the
+    view are resolved below it.
+    """
+
+    option_schema = {
+        'path': Option(to_path, None),
+        'suffix_whitelist': Option(to_list, ()),
+    }
+
+    @property
+    def path(self):
+        """Get the path of the director of files to serve."""
+        return self.page_options['path'] or ''
+
+    @property
+    def dirname(self):
+        """Return the name of the top level directory."""
+        return os.path.split(self.path)[1]
+
+    def _get_display_name(self, name):
+        """Return a name that can be displayed to represent the shown file."""
+        if not name:
+            return self.dirname
+        val = os.path.join(self.dirname, name)
+        if val.endswith('|'):
+            return val[-1]
+        return val
+
+    def _get_safe_path(self, name):
+        """Return the path of a file or directory to serve or None.
+
+        Names that would resolve to a path outside of the served directory,
+        through ".." components or by being absolute, give None.
+        """
+        if not self.path:
+            return None
+        path = os.path.normpath(os.path.join(self.path, name))
+        if path != self.path and not path.startswith(
+                os.path.join(self.path, '')):
+            return None
+        return path
+
+    def _get_safe_base_path(self, path):
+        """Get a relative path that is safe to show a user."""
+        base = path.replace(os.path.commonprefix([self.path, path]), '')
+        if base.startswith('/'):
+            base = base[1:]
+        return base
+
+    @staticmethod
+    def _get_name_links(names, external=False):
+        """Return (href, name) pairs linking names to the RawFile view.
+
+        The URL of the RawFile:get route is built once and the names, which
+        can't contain NUL characters, are quoted in a single call and
+        spliced into it.
+
+        :param names: Paths relative to the top of the served directory.
+        :param external: Build absolute URLs.
+        """
+        if not names:
+            return []
+        prefix, _, suffix = url_for('RawFile:get', name='\x00',
+                                    _external=external).partition('%00')
+        quoted = quote('\x00'.join(names).replace('/', '|'),
+                       safe='\x00').split('\x00')
+        return [(prefix + href + suffix, name)
+                for href, name in zip(quoted, names)]
+
+    def _get_links(self, path, fnames):
+        """Return (href, name) pairs linking to entries of a directory."""
+        base = self._get_safe_base_path(path).rstrip('/')
+        base = base + '/' if base else ''
+        return self._get_name_links([base + fname for fname in fnames])
+
+
+class RawFile(RawView):
+    """View a directy of files in raw form in your browser."""
+
+    name = 'raw_file'
+    route_base = '/raw_file'
+    option_schema = dict(RawView.option_schema, **{
+        'flash_messages': Option(to_bool, True),
+        'minify': Option(to_bool, False),
+        'stream_threshold': Option(to_byte_size, 1024 ** 2),
+        'chunk_size': Option(to_byte_size, 64 * 1024),
+        'listing_cache_size': Option(to_byte_size, 16 * 1024 ** 2),
+        'page_size': Option(to_int, 1000),
+        'max_page_size': Option(to_int, 10000),
+        'line_count': Option(to_int, 1000),
+        'byte_count': Option(to_byte_size, 1024 ** 2),
+        'accel_redirect': Option(str.strip, ''),
+        'render_cache_size': Option(to_byte_size, 0),
+        'render_cache_min_size': Option(to_byte_size, 4 * 1024),
+        'render_cache_dir': Option(to_path, None),
+    })
+
+    # Bump when the output of _get_file changes, so cached renders are
+    # not served any more.
+    render_version = 1
+
+    @staticmethod
+    def _get_top_dir_link():
+        """Get a link to the Top Directory of the Raw File view."""
+        doc = Doc()
+        with doc.tag('a'):
+            doc.attr(href=url_for('RawFile:index'))
+            doc.text('Top Dir')
+        return doc.getvalue()
+
+    @staticmethod
+    def _get_parent_dir_link(parent_dir):
+        """Get a link to the parent directory of the current page."""
+        doc = Doc()
+        with doc.tag('a'):
+            if parent_dir == "":
+                doc.attr(href=url_for('RawFile:index'))
+            else:
+                doc.attr(href=url_for('RawFile:get',
+                                      name=parent_dir.replace('/', '|')))
+            doc.text('Parent Dir')
+        return doc.getvalue()
+
+    @staticmethod
+    def _get_download_link(name):
+        """Get a link to download the raw bytes of the current file."""
+        doc = Doc()
+        with doc.tag('a'):
+            doc.attr(href=url_for('RawFile:download',
+                                  name=name.replace('/', '|')))
+            doc.text('Download')
+        return doc.getvalue()
+
+    def _get_navigation_links(self, path, download=False):
+        """Build a list of HTML links for navigation.
+
+        :param download: Add a link to download the file at path.
+        """
+        links = []
+        base = self._get_safe_base_path(path)
+        if base != "":
+            links.append(self._get_top_dir_link())
+            if base.count('/') >= 1:
+                parent_dir = os.path.split(base)[0]
+                links.append(self._get_parent_dir_link(parent_dir))
+        if download:
+            links.append(self._get_download_link(base))
+        return list_to_html_list(links)
+
+    def _get_dir_key(self, path, dir_stat):
+        """Return a cache key that changes whenever a listing would."""
+        return (path, dir_stat.st_dev, dir_stat.st_ino, dir_stat.st_mtime_ns,
+                dir_stat.st_ctime_ns, self.page_options['suffix_whitelist'],
+                self.netify_app.config.generation)
+
+    def _get_listing_cache_budget(self):
+        """Return the byte budget of each of the two listing caches.
+
+        LISTING_CACHE and DIR_INDEX_CACHE share the listing_cache_size
+        option, so together they stay within it.
+        """
+        return self.page_options['listing_cache_size'] // 2
+
+    def _get_dir_index(self, path, dir_stat):
+        """Return the sorted tuple of names listed for a directory.
+
+        The index is cached per directory generation so each page of a
+        listing only has to find its place in the index.
+        """
+        DIR_INDEX_CACHE.max_bytes = self._get_listing_cache_budget()
+        return DIR_INDEX_CACHE.get_or_create(
+            self._get_dir_key(path, dir_stat),
+            lambda: tuple(self._scan_dir(path)))
+
+    def _get_page_limit(self):
+        """Return the number of entries to list on one page or None.
+
+        The "limit" query parameter overrides the page_size option up to
+        max_page_size entries. A page_size of 0 lists every entry unless a
+        limit is requested.
+        """
+        options = self.page_options
+        limit = request.args.get('limit', None, type=int)
+        if limit is None:
+            limit = options['page_size']
+            if limit <= 0:
+                return None
+        return max(1, min(limit, options['max_page_size']))
+
+    def _get_dir_listing(self, path, dir_stat=None):
+        """Return an HTML list of a page of the directory contents.
+
+        The page holds the entries that sort after the "after" query
+        parameter, up to the page limit. Listings are kept in LISTING_CACHE
+        against the directory's inode, mtime and ctime, so a listing is
+        rebuilt only when an entry is added, removed or renamed, or when
+        the config changes. Checking that a listing is still fresh costs one
+        stat of the directory.
+        """
+        if dir_stat is None:
+            dir_stat = os.stat(path)
+        LISTING_CACHE.max_bytes = self._get_listing_cache_budget()
+        after = request.args.get('after', '')
+        limit = self._get_page_limit()
+        key = self._get_dir_key(path, dir_stat) + (
+            self.netify_app.url_map_version, request.script_root, after,
+            limit, 'limit' in request.args)
+        return LISTING_CACHE.get_or_create(
+            key, lambda: self._build_dir_listing(
+                path, self._get_dir_index(path, dir_stat), after, limit))
+
+    @staticmethod
+    def _get_query_link(text, **query):
+        """Link to the current page with the given query parameters."""
+        doc = Doc()
+        with doc.tag('a'):
+            doc.attr(href=url_for(request.endpoint, **dict(request.view_args,
+                                                           **query)))
+            doc.text(text)
+        return doc.getvalue()
+
+    def _get_page_link(self, text, after, limit):
+        """Link to another page of the current directory listing.
+
+        A requested limit is linked as the effective, bounded limit.
+        """
+        query = {}
+        if after:
+            query['after'] = after
+        if 'limit' in request.args:
+            query['limit'] = limit
+        return self._get_query_link(text, **query)
+
+    def _get_page_navigation(self, names, start, end, limit):
+        """Build the links to the first, previous and next listing pages."""
+        links = []
+        if start > 0:
+            links.append(self._get_page_link('First Page', '', limit))
+            previous = start - limit
+            links.append(self._get_page_link(
+                'Previous Page', names[previous - 1] if previous > 0 else '',
+                limit))
+        if end < len(names):
+            links.append(self._get_page_link('Next Page', names[end - 1],
+                                             limit))
+        doc = Doc()
+        with doc.tag('div'):
+            doc.attr(klass='pages')
+            if start < len(names):
+                doc.text('Entries %d-%d of %d' % (start + 1, end, len(names)))
+            else:
+                doc.text('No entries after the last of %d' % len(names))
+            doc.asis(list_to_html_list(links))
+        return doc.getvalue()
+
+    def _scan_dir(self, path):
+        """Return the sorted names to list for a directory.
+
+        Hidden entries are skipped and entries without a whitelisted suffix
+        are only listed, with a trailing "/", if they are directories. The
+        entry types come from os.scandir, which usually knows them without a
+        stat call per entry.
+        """
+        suffixes = self.page_options['suffix_whitelist']
+        fnames = []
+        with os.scandir(path) as entries:
+            if not suffixes:
+                fnames = [entry.name for entry in entries
+                          if not entry.name.startswith('.')]
+            else:
+                for entry in entries:
+                    fname = entry.name
+                    if fname.startswith('.'):
+                        continue
+                    if fname.endswith(suffixes):
+                        fnames.append(fname)
+                    elif entry.is_dir():
+                        fnames.append(fname + '/')
+        fnames.sort()
+        return fnames
+
+    def _build_dir_listing(self, path, names, after='', limit=None):
+        """Build an HTML list of one page of the directory contents.
+
+        :param names: The sorted names of the directory's entries.
+        :param after: List the entries that sort after this name.
+        :param limit: The number of entries on the page or None for all.
+        """
+        start = bisect_right(names, after) if after else 0
+        if limit is None:
+            return link_list_to_html_list(self._get_links(path, names[start:]))
+        end = min(start + limit, len(names))
+        listing = link_list_to_html_list(
+            self._get_links(path, names[start:end]))
+        if start == 0 and end == len(names):
+            return listing
+        return self._get_page_navigation(names, start, end, limit) + listing
+
+    @staticmethod
+    def _get_file(path):
+        """Return the contents of a file as a preformatted text field."""
+        with open(path, 'r') as fin:
+            return ''.join(('<pre>', Markup.escape(fin.read()), '</pre>'))
+
+    def _get_rendered_file(self, path, path_stat):
+        """Return the contents of a file rendered by _get_file.
+
+        With a render_cache_size, files of at least render_cache_min_size
+        bytes are rendered once and kept in a DiskCache shared by every
+        worker, in render_cache_dir or the instance folder. The cache key
+        holds the device, inode, size and mtime of the file, so a changed
+        file is rendered again.
+        """
+        options = self.page_options
+        if (not options['render_cache_size'] or
+                path_stat.st_size < options['render_cache_min_size']):
+            return self._get_file(path)
+        cache = get_disk_cache(
+            options['render_cache_dir'] or os.path.join(
+                self.netify_app.flask_app.instance_path, 'render_cache'),
+            options['render_cache_size'])
+        key = ('RawFile._get_file', self.render_version, path_stat.st_dev,
+               path_stat.st_ino, path_stat.st_size, path_stat.st_mtime_ns)
+        contents = cache.get(key)
+        if contents is None:
+            contents = self._get_file(path)
+            cache.put(key, contents)
+        return contents
+
+    @staticmethod
+    def _iter_file(path, chunk_size):
+        """Yield the contents of a file as an escaped preformatted text field.
+
+        The file is read and escaped chunk_size characters at a time so only
+        one chunk is held in memory at once.
+        """
+        yield '<pre>'
+        with open(path, 'r') as fin:
+            for chunk in iter(lambda: fin.read(chunk_size), ''):
+                yield Markup.escape(chunk)
+        yield '</pre>'
+
+    @staticmethod
+    def _iter_slice(path, begin, end, chunk_size):
+        """Yield bytes begin to end of a file as a preformatted text field.
+
+        The bytes are decoded as UTF-8 as they are read so a character split
+        by the slice boundaries is replaced rather than failing the page.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        yield '<pre>'
+        with open(path, 'rb') as fin:
+            fin.seek(begin)
+            remaining = end - begin
+            while remaining > 0:
+                data = fin.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield Markup.escape(decoder.decode(data))
+        yield Markup.escape(decoder.decode(b'', final=True))
+        yield '</pre>'
+
+    def _get_slice(self, path, path_stat):
+        """Return the (begin, end, navigation) of the requested file slice.
+
+        The "start" and "count" query parameters select lines, counted from
+        1, and the "offset" and "length" parameters select bytes. A negative
+        start or offset counts back from the end of the file, so start=-100
+        shows the last 100 lines. Lines are found with the file's cached
+        LineIndex. None is returned when no slice is requested.
+        """
+        args = request.args
+        options = self.page_options
+        size = path_stat.st_size
+        links = []
+        if 'start' in args or 'count' in args:
+            count = max(1, args.get('count', options['line_count'], type=int))
+            start = args.get('start', 1, type=int)
+            begin, end, start, lines = find_lines(
+                path, path_stat, start - 1 if start > 0 else start, count)
+            last = min(start + count, lines)
+            summary = 'Lines %d-%d of %d' % (min(start + 1, last), last,
+                                             lines)
+            query = {'count': count} if 'count' in args else {}
+            if start > 0:
+                links.append(self._get_query_link(
+                    'First Lines', start=1, **query))
+                links.append(self._get_query_link(
+                    'Previous Lines', start=max(1, start + 1 - count),
+                    **query))
+            if last < lines:
+                links.append(self._get_query_link(
+                    'Next Lines', start=last + 1, **query))
+                links.append(self._get_query_link(
+                    'Last Lines', start=-count, **query))
+        elif 'offset' in args or 'length' in args:
+            length = max(1, args.get('length', options['byte_count'],
+                                     type=int))
+            begin = args.get('offset', 0, type=int)
+            begin = max(0, size + begin) if begin < 0 else min(begin, size)
+            end = min(size, begin + length)
+            summary = 'Bytes %d-%d of %d' % (begin, end, size)
+            query = {'length': length} if 'length' in args else {}
+            if begin > 0:
+                links.append(self._get_query_link(
+                    'Previous Bytes', offset=max(0, begin - length), **query))
+            if end < size:
+                links.append(self._get_query_link(
+                    'Next Bytes', offset=end, **query))
+        else:
+            return None
+        doc = Doc()
+        with doc.tag('div'):
+            doc.attr(klass='pages')
+            doc.text(summary)
+            doc.asis(list_to_html_list(links))
+        return begin, end, doc.getvalue()
+
+    def _get_file_contents(self, path, path_stat):
+        """Return the (contents, stream) of a file or of a slice of it.
+
+        Contents at least stream_threshold bytes long are returned as an
+        iterator of chunks to be streamed.
+        """
+        options = self.page_options
+        chunk_size = options['chunk_size']
+        file_slice = self._get_slice(path, path_stat)
+        if file_slice is None:
+            if path_stat.st_size >= options['stream_threshold']:
+                return self._iter_file(path, chunk_size), True
+            return self._get_rendered_file(path, path_stat), False
+        begin, end, navigation = file_slice
+        contents = itertools.chain(
+            (navigation,), self._iter_slice(path, begin, end, chunk_size))
+        if end - begin >= options['stream_threshold']:
+            return contents, True
+        return ''.join(contents), False
+
+    def _get_validators(self, path_stat):
+        """Return an (etag, last_modified) pair for a file or directory.
+
+        The validators come from the inode, size and mtime in the stat
+        result of the path so the file is never read. The config generation
+        and URL map version are part of the ETag as the page depends on them
+        too.
+        """
+        etag = '%x-%x-%x-%x-%x' % (path_stat.st_ino, path_stat.st_size,
+                                   path_stat.st_mtime_ns,
+                                   self.netify_app.config.generation,
+                                   self.netify_app.url_map_version)
+        return etag, datetime.utcfromtimestamp(int(path_stat.st_mtime))
+
+    def _has_flashes(self):
+        """Return True if the page will show pending flashed messages."""
+        return bool(self.page_options['flash_messages'] and
+                    session.get('_flashes'))
+
+    @staticmethod
+    def _is_modified(etag, last_modified):
+        """Check the validators against the conditional request headers."""
+        return is_resource_modified(request.environ, etag=etag,
+                                    last_modified=last_modified)
+
+    @staticmethod
+    def _set_validators(response, etag, last_modified):
+        """Add the ETag and Last-Modified headers to a response."""
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
+
+    def _get_byte_range(self, size, etag, last_modified):
+        """Return the (start, stop) bytes asked for by a Range request.
+
+        None is returned when the whole file should be sent, either because
+        no range was asked for or because the If-Range validator doesn't
+        match any more. Only single ranges are supported. An unsatisfiable
+        range aborts the request with a 416 error.
+        """
+        byte_range = request.range
+        if byte_range is None or len(byte_range.ranges) != 1:
+            return None
+        if 'If-Range' in request.headers:
+            if_range = request.if_range
+            if not (if_range.etag == etag or
+                    if_range.date == last_modified):
+                return None
+        range_for_length = byte_range.range_for_length(size)
+        if range_for_length is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = 'bytes */%d' % size
+            abort(response)
+        return range_for_length
+
+    @staticmethod
+    def _iter_bytes(path, start, stop, chunk_size):
+        """Yield bytes start to stop of a file chunk_size bytes at a time."""
+        with open(path, 'rb') as fin:
+            fin.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                data = fin.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def _send_file(self, path, size, mimetype, validators):
+        """Return a response streaming the bytes of a file or a range of it.
+
+        Whole files are sent through the server's wsgi.file_wrapper so
+        servers that support it can send them with sendfile.
+        """
+        chunk_size = self.page_options['chunk_size']
+        byte_range = self._get_byte_range(size, *validators)
+        if byte_range is None:
+            response = Response(
+                wrap_file(request.environ, open(path, 'rb'), chunk_size),
+                mimetype=mimetype, direct_passthrough=True)
+            response.content_length = size
+        else:
+            start, stop = byte_range
+            response = Response(
+                self._iter_bytes(path, start, stop, chunk_size),
+                status=206, mimetype=mimetype, direct_passthrough=True)
+            response.content_length = stop - start
+            response.headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, stop - 1, size)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    def _accel_redirect(self, path, mimetype):
+        """Return a response handing the file at path over to nginx.
+
+        The X-Accel-Redirect header points to the file below the
+        accel_redirect location, which must be an internal nginx location
+        aliasing the served directory. nginx then sends the file, including
+        any Range requests, without tying up a worker.
+        """
+        location = self.page_options['accel_redirect'].rstrip('/')
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = '%s/%s' % (
+            location, quote(os.path.relpath(path, self.path)))
+        return response
+
+    def _raw_file(self, name=None):
+        """Build up a page for the Raw File view."""
+        name = name if name else ''
+        name = name.replace('|', '/')
+        display_name = self._get_display_name(name)
+        options = self.page_options
+        stream = False
+        validators = None
+        if not options['path']:
+            body_txt = 'No directory to serve in the config file.'
+        else:
+            path = self._get_safe_path(name)
+            try:
+                path_stat = os.stat(path) if path else None
+            except OSError:
+                path_stat = None
+            path = path or self.path
+            # A page showing flashed messages differs from the plain page, so
+            # it is always sent in full and without validators to revalidate.
+            if path_stat is not None and not self._has_flashes():
+                validators = self._get_validators(path_stat)
+                if not self._is_modified(*validators):
+                    return self._set_validators(Response(status=304),
+                                                *validators)
+            body = Doc()
+            with body.tag('h1'):
+                body.text('File: %s' % display_name)
+            with body.tag('div'):
+                body.attr(klass='navigation')
+                body.asis(self._get_navigation_links(
+                    path, download=path_stat is not None and
+                    stat.S_ISREG(path_stat.st_mode)))
+            contents = ''
+            if path_stat is not None:
+                if stat.S_ISDIR(path_stat.st_mode):
+                    contents = self._get_dir_listing(path, path_stat)
+                else:
+                    contents, stream = self._get_file_contents(path,
+                                                               path_stat)
+            body_txt = itertools.chain(
+                (body.getvalue(), '<div class="files">'),
+                (contents,) if isinstance(contents, str) else contents,
+                ('</div>',))
+        flash_messages = options['flash_messages']
+        # The body holds file contents so it is kept out of Jinja2.
+        page = HtmlPage(head=None, body=body_txt,
+                        flash_messages=flash_messages, static=('head',),
+                        minify=options['minify'])
+        if stream:
+            response = page.stream()
+        else:
+            response = make_response(page.render_template())
+        if validators is not None:
+            self._set_validators(response, *validators)
+        return response
+
+    def index(self):
+        """Get the Top Directory listing."""
+        return self._raw_file()
+
+    def get(self, name):
+        """Display a file or directory given by name."""
+        return self._raw_file(name=name)
+
+    def download(self, name):
+        """Send the raw bytes of the file given by name."""
+        path = self._get_safe_path(name.replace('|', '/'))
+        try:
+            path_stat = os.stat(path) if path else None
+        except OSError:
+            path_stat = None
+        if path_stat is None or not stat.S_ISREG(path_stat.st_mode):
+            abort(404)
+        validators = etag, last_modified = self._get_validators(path_stat)
+        if not is_resource_modified(request.environ, etag=etag,
+                                    last_modified=last_modified):
+            return self._set_validators(Response(status=304), *validators)
+        mimetype = (mimetypes.guess_type(path)[0] or
+                    'application/octet-stream')
+        if self.page_options['accel_redirect']:
+            response = self._accel_redirect(path, mimetype)
+        else:
+            response = self._send_file(path, path_stat.st_size, mimetype,
+                                       validators)
+        return self._set_validators(response, *validators)
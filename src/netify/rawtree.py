@@ -0,0 +1,175 @@
+"""The RawTree view, listing a whole tree of files in one request."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import itertools
+import os
+import time
+from urllib.parse import quote
+
+from flask import abort
+from flask import Markup
+from flask import request
+from flask import Response
+from flask import stream_with_context
+
+from .config import Option
+from .config import to_bool
+from .config import to_int
+from .rawfile import RawView
+from .template import HtmlPage
+from .template import link_list_to_html_list
+from .template import list_to_html_list
+from .tree import TreeWalk
+from .tree import get_executor
+
+
+class RawTree(RawView):
+    """List a directory of files and everything below it in one request.
+
+    The tree is shown as HTML, as tab separated text (format=text) or as an
+    XML sitemap of the RawFile view (format=sitemap). The directories are
+    scanned by a thread pool shared by the requests of a process, and each
+    directory is sent as soon as it has been scanned. Entries are linked
+    to the RawFile view, and the sitemap is served, only when RawFile is
+    enabled and serves the same directory.
+    """
+
+    name = 'raw_tree'
+    route_base = '/raw_tree'
+    option_schema = dict(RawView.option_schema, **{
+        'flash_messages': Option(to_bool, False),
+        'minify': Option(to_bool, False),
+        'max_depth': Option(to_int, 16),
+        'max_entries': Option(to_int, 100000),
+        'workers': Option(to_int, 4),
+    })
+
+    # The sitemap protocol allows this many URLs in one sitemap.
+    max_sitemap_urls = 50000
+
+    def _get_walk(self, name):
+        """Return a TreeWalk of the directory given by name.
+
+        The "format" query parameter selects the output format, and the
+        "depth" and "limit" query parameters can lower the max_depth and
+        max_entries options. Anything but a directory is not found.
+        """
+        options = self.page_options
+        path = self._get_safe_path(name.replace('|', '/'))
+        if path is None or not os.path.isdir(path):
+            abort(404)
+        prefix = self._get_safe_base_path(path).rstrip('/')
+        max_depth = options['max_depth']
+        max_entries = options['max_entries']
+        out_format = request.args.get('format', 'html')
+        if out_format == 'sitemap':
+            max_entries = min(max_entries, self.max_sitemap_urls)
+        depth = request.args.get('depth', max_depth, type=int)
+        limit = request.args.get('limit', max_entries, type=int)
+        workers = max(1, options['workers'])
+        # Only the HTML listing does without the sizes and mtimes.
+        return TreeWalk(self.path, prefix + '/' if prefix else '',
+                        options['suffix_whitelist'],
+                        with_stat=out_format != 'html',
+                        max_depth=max(0, min(depth, max_depth)),
+                        max_entries=max(1, min(limit, max_entries)),
+                        executor=get_executor(workers), max_pending=workers)
+
+    def _links_raw_file(self):
+        """Return True if names can be linked to the RawFile view.
+
+        RawFile resolves names against its own path, so the two views must
+        serve the same directory.
+        """
+        if 'RawFile:get' not in self.netify_app.flask_app.view_functions:
+            return False
+        raw_options = self.netify_app.config.get_page_options('raw_file')
+        return raw_options['path'] == self.path
+
+    def _iter_html(self, walk):
+        """Yield an HTML list of the entries of each directory of a walk."""
+        linked = self._links_raw_file()
+        for dirname, entries in walk:
+            yield '<h2>%s</h2>' % Markup.escape(
+                os.path.join(self.dirname, dirname))
+            names = [entry.name for entry in entries]
+            if linked:
+                yield link_list_to_html_list(self._get_name_links(names))
+            else:
+                yield list_to_html_list([Markup.escape(name)
+                                         for name in names])
+        if walk.truncated:
+            yield '<p>The listing stopped after %d entries.</p>' % (
+                walk.entries)
+
+    @staticmethod
+    def _iter_text(walk):
+        """Yield a line of text for each entry of a walk.
+
+        Lines hold the quoted name, the size and the mtime of an entry
+        separated by tabs. Directory names end with "/". A walk that was
+        cut short ends with a "#truncated" line.
+        """
+        for _, entries in walk:
+            yield ''.join('%s\t%d\t%d\n' % (quote(entry.name), entry.size,
+                                            entry.mtime)
+                          for entry in entries)
+        if walk.truncated:
+            yield '#truncated\n'
+
+    def _iter_sitemap(self, walk):
+        """Yield an XML sitemap of the RawFile pages of the files of a walk."""
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns='
+               '"http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for _, entries in walk:
+            files = [entry for entry in entries if not entry.is_dir]
+            links = self._get_name_links([entry.name for entry in files],
+                                         external=True)
+            yield ''.join(
+                '<url><loc>%s</loc><lastmod>%s</lastmod></url>\n' % (
+                    Markup.escape(href), time.strftime(
+                        '%Y-%m-%dT%H:%M:%SZ', time.gmtime(entry.mtime)))
+                for (href, _), entry in zip(links, files))
+        yield '</urlset>\n'
+
+    def _raw_tree(self, name=''):
+        """Stream the tree below the directory given by name."""
+        options = self.page_options
+        if not options['path']:
+            abort(404)
+        walk = self._get_walk(name)
+        out_format = request.args.get('format', 'html')
+        if out_format == 'text':
+            return Response(stream_with_context(self._iter_text(walk)),
+                            mimetype='text/plain')
+        elif out_format == 'sitemap':
+            if not self._links_raw_file():
+                abort(404)
+            return Response(stream_with_context(self._iter_sitemap(walk)),
+                            mimetype='application/xml')
+        body = itertools.chain(
+            ('<h1>Tree: %s</h1>' % Markup.escape(
+                self._get_display_name(name.replace('|', '/'))),),
+            self._iter_html(walk))
+        return HtmlPage(head=None, body=body,
+                        flash_messages=options['flash_messages'],
+                        static=('head',), minify=options['minify']).stream()
+
+    def index(self):
+        """List the whole tree."""
+        return self._raw_tree()
+
+    def get(self, name):
+        """List the tree below the directory given by name."""
+        return self._raw_tree(name=name)
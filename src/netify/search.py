@@ -0,0 +1,408 @@
+"""A full text search index of a tree of files, stored with sqlite."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from array import array
+from urllib.request import pathname2url
+import fcntl
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+# Words are runs of letters, digits and underscores, matched without case.
+_WORD_RE = re.compile(r'\w{1,64}')
+
+# File ids are never reused (AUTOINCREMENT) so the ids of deleted files left
+# in the posting lists can't match a new file.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    postings INTEGER NOT NULL,
+    files BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    files BLOB NOT NULL,
+    PRIMARY KEY (term, segment)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_segment ON postings (segment);
+"""
+
+# Bump when SCHEMA changes; older indexes are then dropped and rebuilt.
+SCHEMA_VERSION = 1
+
+# The array type code of the file ids stored in the posting lists.
+FILE_ID_TYPE = 'I'
+
+# Open search indexes, keyed by the path of their database.
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def tokenize(text):
+    """Return the set of lower case words in some text."""
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def walk_files(root, suffixes=()):
+    """Yield the (name, stat) of the files to index below root.
+
+    Names are relative to root and use "/" as the separator. Hidden files
+    and directories are skipped and symbolic links to directories are not
+    followed. When suffixes is not empty only the files ending with one of
+    them are yielded.
+    """
+    suffixes = tuple(suffixes)
+    stack = ['']
+    while stack:
+        prefix = stack.pop()
+        with os.scandir(os.path.join(root, prefix)) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                name = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name + '/')
+                elif ((not suffixes or entry.name.endswith(suffixes)) and
+                      entry.is_file()):
+                    yield name, entry.stat()
+
+
+class SearchIndex(object):
+    """An inverted index of the words in a tree of files.
+
+    The index is an sqlite database mapping every word to the ids of the
+    files it appears in. The ids are stored as arrays in segments: each
+    update writes one row per word for the files it read, rather than a row
+    per word and file, and the smallest segments are merged once there are
+    more than max_segments of them. Files that change or disappear are only
+    removed from the files table; their ids are dropped from the posting
+    lists when their segment is merged, or when more than max_dead_ratio of
+    the files of a segment are gone.
+
+    Updates compare the mtime and size of every file with the indexed ones
+    so only new and changed files are read. One process at a time updates
+    the index, guarded by an flock on a lock file next to the database,
+    while the database is in WAL mode so every other thread and process
+    keeps searching through its own read only connection.
+
+    :param db_path: The path of the sqlite database file.
+    """
+
+    # The number of postings kept in memory before a segment is written.
+    segment_size = 1000000
+
+    max_segments = 16
+
+    max_dead_ratio = 0.25
+
+    def __init__(self, db_path):
+        """Create an index stored at db_path, which is created on update."""
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._refreshed = None
+
+    def _connect(self):
+        """Return this thread's read only connection or None.
+
+        None is returned until the database has been created.
+        """
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            self._local.pid = pid
+            self._local.connection = None
+        if self._local.connection is None:
+            try:
+                self._local.connection = sqlite3.connect(
+                    'file:%s?mode=ro' % pathname2url(self.db_path), uri=True,
+                    isolation_level=None)
+            except sqlite3.OperationalError:
+                return None
+        return self._local.connection
+
+    def _connect_writer(self):
+        """Open a connection for updating the index, creating it if needed."""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        connection = sqlite3.connect(self.db_path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            connection.executescript(
+                'DROP TABLE IF EXISTS postings; '
+                'DROP TABLE IF EXISTS segments; '
+                'DROP TABLE IF EXISTS files; '
+                'PRAGMA user_version = %d;' % SCHEMA_VERSION)
+        connection.executescript(SCHEMA)
+        return connection
+
+    @staticmethod
+    def _write_segment(connection, postings):
+        """Write the postings, a dict of file id arrays, as a new segment.
+
+        The segment is committed together with the files rows added since
+        the last one, so a file is never marked as indexed without its
+        words. The segment row holds the ids of its files so the share of
+        them that are gone can be counted without reading the postings.
+        """
+        if postings:
+            files = array(FILE_ID_TYPE, sorted(set().union(
+                *postings.values())))
+            segment = connection.execute(
+                'INSERT INTO segments (postings, files) VALUES (?, ?)',
+                (sum(map(len, postings.values())),
+                 files.tobytes())).lastrowid
+            connection.executemany(
+                'INSERT INTO postings (term, segment, files) VALUES (?, ?, ?)',
+                ((term, segment, ids.tobytes())
+                 for term, ids in postings.items()))
+            postings.clear()
+        connection.commit()
+
+    def _merge_segments(self, connection):
+        """Merge small segments and drop the ids of files that are gone.
+
+        Once there are more than max_segments segments the largest
+        max_segments / 2 are kept and the others are rewritten as one. Each
+        kept segment is rewritten on its own once more than max_dead_ratio
+        of its files are gone.
+
+        :return: A (merged, compacted) pair of the number of segments
+                 merged and of the kept segments rewritten.
+        """
+        segments = connection.execute(
+            'SELECT id, files FROM segments ORDER BY postings DESC, id'
+        ).fetchall()
+        live = set(row[0] for row in connection.execute(
+            'SELECT id FROM files'))
+        merged = []
+        if len(segments) > self.max_segments:
+            merged = [row[0] for row in segments[self.max_segments // 2:]]
+            segments = segments[:self.max_segments // 2]
+            self._rewrite_segments(connection, merged, live)
+        compacted = 0
+        for segment, files in segments:
+            ids = array(FILE_ID_TYPE)
+            ids.frombytes(files)
+            dead = len(ids) - len(live.intersection(ids))
+            if dead > self.max_dead_ratio * len(ids):
+                self._rewrite_segments(connection, [segment], live)
+                compacted += 1
+        return len(merged), compacted
+
+    def _rewrite_segments(self, connection, segments, live):
+        """Replace segments with one holding only the ids of live files."""
+        postings = {}
+        for segment in segments:
+            for term, files in connection.execute(
+                    'SELECT term, files FROM postings WHERE segment = ?',
+                    (segment,)):
+                ids = postings.get(term)
+                if ids is None:
+                    ids = postings[term] = array(FILE_ID_TYPE)
+                ids.frombytes(files)
+            connection.execute('DELETE FROM postings WHERE segment = ?',
+                               (segment,))
+            connection.execute('DELETE FROM segments WHERE id = ?',
+                               (segment,))
+        for term in list(postings):
+            ids = array(FILE_ID_TYPE, sorted(live.intersection(
+                postings[term])))
+            if ids:
+                postings[term] = ids
+            else:
+                del postings[term]
+        self._write_segment(connection, postings)
+
+    @staticmethod
+    def _read_words(path):
+        """Return the set of words in a file."""
+        words = set()
+        with open(path, 'r', encoding='utf-8', errors='replace') as fin:
+            for line in fin:
+                words.update(_WORD_RE.findall(line.lower()))
+        return words
+
+    def update(self, root, suffixes=()):
+        """Bring the index up to date with the files below root.
+
+        A segment is committed every segment_size postings so searches see
+        the index grow while a large tree is indexed for the first time.
+
+        :return: A dict counting the added, updated and removed files and
+                 the merged and compacted segments.
+        """
+        counts = {'added': 0, 'updated': 0, 'removed': 0, 'merged': 0,
+                  'compacted': 0}
+        connection = self._connect_writer()
+        try:
+            known = {name: (file_id, mtime_ns, size)
+                     for file_id, name, mtime_ns, size in connection.execute(
+                         'SELECT id, name, mtime_ns, size FROM files')}
+            postings = {}
+            pending = 0
+            for name, file_stat in walk_files(root, suffixes):
+                old = known.pop(name, None)
+                if old is not None:
+                    if old[1:] == (file_stat.st_mtime_ns, file_stat.st_size):
+                        continue
+                    connection.execute('DELETE FROM files WHERE id = ?',
+                                       (old[0],))
+                try:
+                    words = self._read_words(os.path.join(root, name))
+                except OSError:
+                    self.logger.warning('Failed to index %s', name)
+                    continue
+                file_id = connection.execute(
+                    'INSERT INTO files (name, mtime_ns, size) '
+                    'VALUES (?, ?, ?)', (name, file_stat.st_mtime_ns,
+                                         file_stat.st_size)).lastrowid
+                for word in words:
+                    ids = postings.get(word)
+                    if ids is None:
+                        ids = postings[word] = array(FILE_ID_TYPE)
+                    ids.append(file_id)
+                counts['updated' if old else 'added'] += 1
+                pending += len(words)
+                if pending >= self.segment_size:
+                    self._write_segment(connection, postings)
+                    pending = 0
+            connection.executemany('DELETE FROM files WHERE id = ?',
+                                   [(old[0],) for old in known.values()])
+            counts['removed'] = len(known)
+            self._write_segment(connection, postings)
+            counts['merged'], counts['compacted'] = self._merge_segments(
+                connection)
+        finally:
+            connection.close()
+        return counts
+
+    def _update_exclusive(self, root, suffixes):
+        """Update the index unless another process is already doing so."""
+        start = time.time()
+        with open(self.db_path + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            try:
+                counts = self.update(root, suffixes)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception('Failed to update search index %s',
+                                      self.db_path)
+                return
+        self.logger.info('Updated search index %s in %.2f s: %s',
+                         self.db_path, time.time() - start, counts)
+
+    def refresh(self, root, suffixes, interval):
+        """Update the index in a background thread if an update is due.
+
+        This is safe to call on every request. An update is started when
+        none has run in this process for interval seconds. Forked workers
+        each start their own but only one of them updates at a time.
+
+        :return: True if an update was started.
+        """
+        pid = os.getpid()
+        with self._lock:
+            now = time.monotonic()
+            if self._pid == pid and (
+                    self._thread.is_alive() or
+                    now - self._refreshed < interval):
+                return False
+            self._pid = pid
+            self._refreshed = now
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            self._thread = threading.Thread(
+                target=self._update_exclusive, args=(root, suffixes),
+                name='netify-search-index')
+            self._thread.daemon = True
+            self._thread.start()
+        return True
+
+    @staticmethod
+    def _read_postings(connection, word):
+        """Return the array of the ids of the files a word appears in."""
+        ids = array(FILE_ID_TYPE)
+        for (files,) in connection.execute(
+                'SELECT files FROM postings WHERE term = ?', (word,)):
+            ids.frombytes(files)
+        return ids
+
+    def search(self, query, limit=100):
+        """Return the names of the files containing every word of a query.
+
+        The posting lists are intersected starting from the shortest, which
+        sqlite can size without reading them, and the files that are gone
+        are filtered out when the names are looked up.
+
+        :return: A (names, more) tuple of the first limit matching names in
+                 sorted order and whether more files matched.
+        """
+        words = tokenize(query)
+        connection = self._connect()
+        if connection is None or not words:
+            return [], False
+        connection.execute('BEGIN')
+        try:
+            lengths = []
+            for word in words:
+                length = connection.execute(
+                    'SELECT SUM(LENGTH(files)) FROM postings WHERE term = ?',
+                    (word,)).fetchone()[0]
+                if not length:
+                    return [], False
+                lengths.append((length, word))
+            matches = None
+            for _, word in sorted(lengths):
+                ids = self._read_postings(connection, word)
+                matches = (set(ids) if matches is None else
+                           matches.intersection(ids))
+                if not matches:
+                    return [], False
+            matches = sorted(matches)
+            names = []
+            for start in range(0, len(matches), 500):
+                chunk = matches[start:start + 500]
+                names.extend(row[0] for row in connection.execute(
+                    'SELECT name FROM files WHERE id IN (%s) '
+                    'ORDER BY name LIMIT ?' % ','.join('?' * len(chunk)),
+                    chunk + [limit + 1]))
+                names = sorted(names)[:limit + 1]
+        except sqlite3.OperationalError:
+            # The index is still being created.
+            return [], False
+        finally:
+            connection.execute('COMMIT')
+        return names[:limit], len(names) > limit
+
+
+def get_index(db_path):
+    """Return the SearchIndex stored at db_path, shared by all threads."""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(db_path)
+        if index is None:
+            index = _INDEXES[db_path] = SearchIndex(db_path)
+        return index
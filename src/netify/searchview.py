@@ -0,0 +1,128 @@
+"""The Search view, finding the files that contain some words."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+from flask import url_for
+from flask import Markup
+from flask import request
+from yattag import Doc
+
+from .config import Option
+from .config import to_bool
+from .config import to_duration
+from .config import to_int
+from .config import to_list
+from .config import to_path
+from .search import get_index
+from .template import HtmlPage
+from .template import link_list_to_html_list
+from .template import list_to_html_list
+from .view import NetifyView
+
+
+class Search(NetifyView):
+    """Search the words in a tree of text files like the RawFile view's.
+
+    The "path" and "suffix_whitelist" options default to those of the
+    [raw_file] section when the RawFile view is enabled. Results link to
+    RawFile only when both views serve the same directory, as RawFile
+    resolves the names against its own path.
+    """
+
+    name = 'search'
+    route_base = '/search'
+    option_schema = {
+        'path': Option(to_path, None),
+        'suffix_whitelist': Option(to_list, None),
+        'index_file': Option(to_path, None),
+        'update_interval': Option(to_duration, 60.0),
+        'max_results': Option(to_int, 100),
+        'flash_messages': Option(to_bool, False),
+        'minify': Option(to_bool, False),
+    }
+
+    @property
+    def index_file(self):
+        """Return the path of the search index database."""
+        return self.page_options['index_file'] or os.path.join(
+            self.netify_app.flask_app.instance_path, 'search_index.sqlite')
+
+    @staticmethod
+    def _get_search_form(query):
+        """Build the search form, filled in with the current query."""
+        doc = Doc()
+        with doc.tag('form', method='get', action=url_for('Search:index')):
+            doc.stag('input', type='search', name='q', value=query)
+            doc.stag('input', type='submit', value='Search')
+        return doc.getvalue()
+
+    def _get_tree(self):
+        """Return the path and suffixes to search and whether to link them.
+
+        :return: A (path, suffix_whitelist, link) tuple where link is True if
+                 the results can be linked to the RawFile view.
+        """
+        options = self.page_options
+        path = options['path']
+        suffixes = options['suffix_whitelist']
+        if 'RawFile:get' not in self.netify_app.flask_app.view_functions:
+            return path, suffixes or (), False
+        raw_options = self.netify_app.config.get_page_options('raw_file')
+        if not path:
+            path = raw_options['path']
+        if suffixes is None:
+            suffixes = raw_options['suffix_whitelist']
+        return path, suffixes or (), bool(path) and path == raw_options['path']
+
+    def _get_results(self, names, more, link):
+        """Build the list of matching files, linked to RawFile if link."""
+        doc = Doc()
+        with doc.tag('p'):
+            doc.text('Matching files: %d%s' % (len(names),
+                                               '+' if more else ''))
+        if link:
+            doc.asis(link_list_to_html_list(
+                [(url_for('RawFile:get', name=name.replace('/', '|')), name)
+                 for name in names]))
+        else:
+            doc.asis(list_to_html_list([Markup.escape(name)
+                                        for name in names]))
+        return doc.getvalue()
+
+    def index(self):
+        """Show the search form and the files matching the "q" parameter.
+
+        Every search gives the index a chance to start a background update
+        once update_interval seconds have passed since the last one.
+        """
+        options = self.page_options
+        query = request.args.get('q', '')
+        body = Doc()
+        with body.tag('h1'):
+            body.text('Search')
+        body.asis(self._get_search_form(query))
+        path, suffixes, link = self._get_tree()
+        if not path:
+            body.text('No directory to search in the config file.')
+        else:
+            index = get_index(self.index_file)
+            index.refresh(path, suffixes, options['update_interval'])
+            if query:
+                names, more = index.search(query, options['max_results'])
+                body.asis(self._get_results(names, more, link))
+        return HtmlPage(head=None, body=body.getvalue(),
+                        flash_messages=options['flash_messages'],
+                        static=('head',),
+                        minify=options['minify']).make_response()
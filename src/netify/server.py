@@ -0,0 +1,280 @@
+"""Serve a WSGI app from pre-forked, multi-threaded worker processes."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from wsgiref.simple_server import WSGIRequestHandler
+from wsgiref.simple_server import WSGIServer
+import logging
+import os
+import selectors
+import signal
+import socket
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RequestHandler(WSGIRequestHandler):
+    """Handle one request, logging through the logging module.
+
+    A client that stalls for timeout seconds is dropped so it can't hold on
+    to a worker thread.
+    """
+
+    timeout = 30
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log a request at debug level rather than on stderr."""
+        LOGGER.debug('%s %s', self.address_string(), format % args)
+
+
+class WorkerServer(WSGIServer):
+    """Answer the connections of a shared listening socket with threads.
+
+    The listening socket is non-blocking and shared with the other worker
+    processes. Each of the threads waits for a connection and then races
+    the others to accept it, so a busy thread never holds up a connection
+    another thread or process could take.
+
+    :param listener: The bound and listening socket.
+    :param app: The WSGI application.
+    :param server_name: The SERVER_NAME of the WSGI environment.
+    :param threads: The number of threads handling requests.
+    :param max_requests: Stop after handling about this many requests, or
+                         never when 0.
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, listener, app, server_name, threads=8,
+                 max_requests=0):
+        """Set up a server of an already listening socket."""
+        super(WorkerServer, self).__init__(
+            listener.getsockname()[:2], RequestHandler,
+            bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        self.server_name = server_name
+        self.server_port = listener.getsockname()[1]
+        self.setup_environ()
+        self.set_app(app)
+        self.threads = threads
+        self.max_requests = max_requests
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def process_request(self, request, client_address):
+        """Handle a request and count it against max_requests."""
+        super(WorkerServer, self).process_request(request, client_address)
+        if self.max_requests:
+            with self._lock:
+                self.requests += 1
+                if self.requests >= self.max_requests:
+                    self._stopping.set()
+
+    def handle_error(self, request, client_address):
+        """Log an error raised while handling a request."""
+        LOGGER.exception('Error handling a request from %s',
+                         client_address[0])
+
+    def _accept_loop(self):
+        """Accept and handle connections until the server is stopped."""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.socket, selectors.EVENT_READ)
+            while not self._stopping.is_set():
+                if selector.select(self.poll_interval):
+                    # Returns straight away when another worker won the race.
+                    self._handle_request_noblock()
+
+    def serve(self, parent_pid=None):
+        """Handle requests until stop is called.
+
+        Requests that are being handled are finished before returning.
+
+        :param parent_pid: Stop when the process is no longer a child of
+                           this process, as when the master was killed.
+        """
+        threads = [threading.Thread(target=self._accept_loop,
+                                    name='netify-worker-%d' % num)
+                   for num in range(self.threads)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(self.poll_interval)
+                if parent_pid is not None and os.getppid() != parent_pid:
+                    self.stop()
+
+    def stop(self):
+        """Stop accepting connections."""
+        self._stopping.set()
+
+
+class PreforkServer(object):
+    """Serve a WSGI app from a pool of forked worker processes.
+
+    The socket is bound and the app is built before the workers are forked,
+    so the workers share the app's memory copy on write. Each worker is a
+    WorkerServer with its own threads. Workers that exit, including after
+    max_requests requests, are replaced.
+
+    The master process stops gracefully on SIGTERM or SIGINT: the workers
+    finish the requests they are handling, for up to graceful_timeout
+    seconds, and exit. On SIGHUP a new set of workers is started and the old
+    ones are stopped gracefully, without refusing any connections.
+
+    :param app: The WSGI application.
+    :param host: The address to listen on.
+    :param port: The port to listen on, or 0 for any free port.
+    :param workers: The number of worker processes.
+    :param threads: The number of threads of each worker.
+    :param backlog: The length of the queue of connections waiting to be
+                    accepted.
+    :param max_requests: Restart a worker after this many requests, or never
+                         when 0.
+    :param graceful_timeout: How long to wait for stopping workers before
+                             they are killed.
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=2,
+                 threads=8, backlog=128, max_requests=0,
+                 graceful_timeout=30.0):
+        """Bind the listening socket."""
+        self.app = app
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        family, sock_type, proto, _, address = socket.getaddrinfo(
+            host, port, 0, socket.SOCK_STREAM, 0, socket.AI_PASSIVE)[0]
+        self.listener = socket.socket(family, sock_type, proto)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(backlog)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()[:2]
+        self.server_name = socket.getfqdn(self.address[0])
+        self.generation = 0
+        self._children = {}
+        self._stopping = False
+        self._restarting = False
+
+    def _run_worker(self, parent_pid):
+        """Serve requests in a freshly forked worker until it is stopped."""
+        server = WorkerServer(self.listener, self.app, self.server_name,
+                              self.threads, self.max_requests)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        # A Ctrl-C reaches the whole process group; the master handles it.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        server.serve(parent_pid)
+
+    def _spawn(self):
+        """Fork a worker of the current generation."""
+        parent_pid = os.getpid()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self._run_worker(parent_pid)
+                status = 0
+            except BaseException:  # pylint: disable=broad-except
+                LOGGER.exception('Worker %d failed', os.getpid())
+            finally:
+                os._exit(status)  # pylint: disable=protected-access
+        self._children[pid] = self.generation
+        LOGGER.info('Started worker %d', pid)
+
+    def _reap(self):
+        """Forget the workers that have exited."""
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()
+                return
+            if pid == 0:
+                return
+            if self._children.pop(pid, None) == self.generation:
+                LOGGER.info('Worker %d exited with status %d', pid, status)
+
+    def _signal_workers(self, signum, pids):
+        """Send a signal to the worker processes that are still running."""
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _stop_workers(self):
+        """Stop every worker, killing those that outlast graceful_timeout."""
+        self._signal_workers(signal.SIGTERM, list(self._children))
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        self._signal_workers(signal.SIGKILL, list(self._children))
+        for pid in list(self._children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            del self._children[pid]
+
+    def _on_stop(self, signum, frame):  # pylint: disable=unused-argument
+        """Handle SIGTERM and SIGINT by stopping the server."""
+        self._stopping = True
+
+    def _on_restart(self, signum, frame):  # pylint: disable=unused-argument
+        """Handle SIGHUP by restarting the workers."""
+        self._restarting = True
+
+    def _restart(self):
+        """Replace the workers with a new generation."""
+        self._restarting = False
+        old = [pid for pid, generation in self._children.items()
+               if generation == self.generation]
+        self.generation += 1
+        for _ in range(self.workers):
+            self._spawn()
+        self._signal_workers(signal.SIGTERM, old)
+        LOGGER.info('Restarting workers %s', old)
+
+    def serve_forever(self):
+        """Start the workers and keep them running until a SIGTERM."""
+        handlers = {signal.SIGTERM: self._on_stop,
+                    signal.SIGINT: self._on_stop,
+                    signal.SIGHUP: self._on_restart}
+        previous = {signum: signal.signal(signum, handler)
+                    for signum, handler in handlers.items()}
+        try:
+            while not self._stopping:
+                self._reap()
+                if self._restarting:
+                    self._restart()
+                running = sum(1 for generation in self._children.values()
+                              if generation == self.generation)
+                for _ in range(self.workers - running):
+                    self._spawn()
+                time.sleep(self.poll_interval)
+        finally:
+            self._stop_workers()
+            self.listener.close()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
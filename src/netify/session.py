@@ -0,0 +1,110 @@
+"""Session handling for netify apps that share secret keys."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import os
+import threading
+import time
+
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from itsdangerous import URLSafeTimedSerializer
+
+from .config import ConfigError
+from .config import read_secret_key_file
+
+
+class KeyRotatingSessionInterface(SecureCookieSessionInterface):
+    """A signed cookie session interface that supports key rotation.
+
+    New cookies are always signed with the app's current "SECRET_KEY".
+    Cookies are verified against the current key first and then against each
+    key listed in the "SECRET_KEY_FALLBACKS" Flask config option, so sessions
+    signed before a key rotation remain valid until the old key is dropped.
+
+    When the "SECRET_KEY_FILE" Flask config option names a key file, it is
+    checked at most every "key_file_check_interval" seconds and the keys are
+    reloaded when it changes, so a rotated key reaches running workers
+    without a restart.
+    """
+
+    key_file_check_interval = 1.0
+
+    def __init__(self):
+        """Create a session interface that has not read the key file yet."""
+        super(KeyRotatingSessionInterface, self).__init__()
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._key_file_stamp = None
+        self._key_file_checked = 0.0
+
+    def reload_keys(self, app):
+        """Reload the app's secret keys if the key file has changed."""
+        key_file = app.config.get('SECRET_KEY_FILE')
+        now = time.monotonic()
+        if (not key_file or
+                now - self._key_file_checked < self.key_file_check_interval):
+            return
+        with self._lock:
+            self._key_file_checked = now
+            try:
+                stat = os.stat(key_file)
+                stamp = (key_file, stat.st_ino, stat.st_size,
+                         stat.st_mtime_ns)
+                if stamp == self._key_file_stamp:
+                    return
+                keys = read_secret_key_file(key_file)
+            except (OSError, ConfigError) as exc:
+                self.logger.warning('Cannot reload the secret keys: %s', exc)
+                return
+            self._key_file_stamp = stamp
+            app.config['SECRET_KEY_FALLBACKS'] = list(keys[1:])
+            app.config['SECRET_KEY'] = keys[0]
+
+    def get_signing_serializer(self, app, secret_key=None):
+        """Return a serializer for the given key or the app's current key."""
+        secret_key = secret_key if secret_key else app.secret_key
+        if not secret_key:
+            return None
+        signer_kwargs = dict(key_derivation=self.key_derivation,
+                             digest_method=self.digest_method)
+        return URLSafeTimedSerializer(secret_key, salt=self.salt,
+                                      serializer=self.serializer,
+                                      signer_kwargs=signer_kwargs)
+
+    def open_session(self, app, request):
+        """Load the session, accepting cookies signed by any known key."""
+        self.reload_keys(app)
+        if not app.secret_key:
+            return None
+        val = request.cookies.get(app.session_cookie_name)
+        if not val:
+            return self.session_class()
+        max_age = int(app.permanent_session_lifetime.total_seconds())
+        keys = [app.secret_key] + list(app.config.get('SECRET_KEY_FALLBACKS',
+                                                      []))
+        for key in keys:
+            try:
+                data = self.get_signing_serializer(app, key).loads(
+                    val, max_age=max_age)
+            except BadSignature:
+                continue
+            return self.session_class(data)
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        """Save the session, signing it with the app's current key."""
+        self.reload_keys(app)
+        super(KeyRotatingSessionInterface, self).save_session(
+            app, session, response)
@@ -13,23 +13,82 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import abc
+import hashlib
 
 from flask import Markup
-from flask import render_template_string
+from flask import Response
+from flask import current_app
+from flask import has_request_context
+from flask import make_response
+from flask import request
+from flask import stream_with_context
+from flask import template_rendered
 from flask import url_for
 from yattag import Doc
 
+from .cache import LruCache
+from .metrics import timed
+from .minify import minify_chunks
 
-def render_template(template):
+
+# Compiled Jinja2 templates keyed by a hash of their source.
+TEMPLATE_CACHE = LruCache(max_entries=128, name='template')
+
+# Pre-rendered HtmlPage shells keyed by their head and flash message setting.
+SHELL_CACHE = LruCache(max_entries=64, name='shell')
+
+# Page fragments memoized by memoize_fragment.
+FRAGMENT_CACHE = LruCache(max_entries=32, name='fragment')
+
+# Marks the place of a literal region in a pre-rendered page shell.
+LITERAL_MARKER = '\x00netify-literal\x00'
+
+
+def compile_template(template_string):
+    """Return the compiled Jinja2 template for a template string.
+
+    Compiled templates are kept in TEMPLATE_CACHE so a page that renders the
+    same template string on every request is only lexed and parsed once.
+    """
+    app = current_app._get_current_object()
+    key = (id(app.jinja_env),
+           hashlib.sha1(template_string.encode('utf-8')).digest())
+    return TEMPLATE_CACHE.get_or_create(
+        key, lambda: app.jinja_env.from_string(template_string))
+
+
+def memoize_fragment(netify, factory, *args):
+    """Return factory(*args), building it once per app, config and URL map.
+
+    Fragments are kept in FRAGMENT_CACHE against the Flask app, the
+    generation of the netify config and the URL map version of the netify
+    app, so they are rebuilt after the config is reloaded or views are
+    registered. The script root of the current request is part of the key
+    as well since fragments may contain URLs.
+    """
+    script_root = request.script_root if has_request_context() else None
+    key = (factory, args, netify.flask_app, netify.config.generation,
+           netify.url_map_version, script_root)
+    return FRAGMENT_CACHE.get_or_create(key, lambda: factory(*args))
+
+
+@timed('jinja')
+def render_template(template, **context):
     """Run a template through Jinja2 and make it safe for the web.
 
     :param template: Either a string or yattag.Doc object.
+    :param context: Extra variables made available to the template.
     """
     if isinstance(template, Doc):
         template_string = template.getvalue()
     else:
         template_string = template
-    return Markup(render_template_string(template_string))
+    app = current_app._get_current_object()
+    compiled = compile_template(template_string)
+    app.update_template_context(context)
+    rendered = compiled.render(context)
+    template_rendered.send(app, template=compiled, context=context)
+    return Markup(rendered)
 
 
 class Page(abc.ABC):
@@ -44,6 +103,29 @@ class Page(abc.ABC):
         """Helper method for rendering a page template."""
         return render_template(self.build())
 
+    def render_chunks(self):
+        """Render the page and return an iterator over chunks of it."""
+        return iter([self.render_template()])
+
+    def make_response(self):
+        """Return a Flask response for the page carrying a strong ETag.
+
+        The ETag is a hash of the rendered page, so a client sending it back
+        in If-None-Match gets an empty 304 response instead of the page.
+        """
+        response = make_response(self.render_template())
+        response.add_etag()
+        return response.make_conditional(request)
+
+    def stream(self):
+        """Return a Flask response that streams the rendered page.
+
+        The chunks from render_chunks are sent as they are produced so a
+        large page never has to be held in memory all at once.
+        """
+        return Response(stream_with_context(self.render_chunks()),
+                        mimetype='text/html')
+
     def __call__(self, *args, **kwargs):
         """Helper method to shortcut the interface for building a Page."""
         self.__class__.__init__(self, *args, **kwargs)
@@ -58,13 +140,28 @@ class HtmlPage(Page):
                  will contain only the charset meta tag.
 
     :param body: Either a string or yattag.Doc object representing the page's
-                 body section.
+                 body section. When the body is a literal region (see
+                 "static") it may also be an iterable of strings, which is
+                 consumed lazily by the stream method.
+
+    :param static: The names of the fragments ("head" and/or "body") that are
+                   trusted template text. Static fragments are compiled into
+                   the page template and may use Jinja2 syntax. The other
+                   fragments are literal regions: they are never run through
+                   Jinja2 and are spliced into the page after the template
+                   parts around them have been rendered. Use literal regions
+                   for anything containing user or file content.
+
+    :param minify: Minify the rendered page. The content of pre elements is
+                   left untouched.
 
     """
 
     object_string_map = {'head': 'head_txt', 'body': 'body_txt'}
+    default_static = ('head', 'body')
 
-    def __init__(self, head=None, body=None, flash_messages=True):
+    def __init__(self, head=None, body=None, flash_messages=True,
+                 static=None, minify=False):
         """Create a new HtmlPage object."""
         if head is not None:
             self.head = head
@@ -73,6 +170,8 @@ class HtmlPage(Page):
         self.head_txt = None
         self.body_txt = None
         self.flash_messages = flash_messages
+        self.static = self.default_static if static is None else static
+        self.minify = minify
 
     def get_text(self):
         """Convert possible yattag.Doc objects to strings.
@@ -81,74 +180,255 @@ class HtmlPage(Page):
         converts the "self.head" and "self.body" contents into a string. If the
         objects are already strings then this is a null operation.
         """
+        if getattr(self, 'head', '') in ['', None]:
+            self.head = DEFAULT_HEAD
         for obj_name in self.object_string_map:
             obj = getattr(self, obj_name, '')
             obj = '' if obj is None else obj
             if isinstance(obj, Doc):
                 setattr(self, self.object_string_map[obj_name],
                         obj.getvalue())
+            elif not isinstance(obj, str) and obj_name in self.static:
+                setattr(self, self.object_string_map[obj_name], ''.join(obj))
             else:
                 setattr(self, self.object_string_map[obj_name], obj)
 
-    def build(self):
-        """Build a yattag.Doc template."""
-        if getattr(self, 'head', '') in ['', None]:
-            self.head = Doc()
-            self.head.stag('meta', charset='utf-8')
-        self.get_text()
+    @staticmethod
+    def build_shell(head_txt, flash_messages):
+        """Render the parts of the page that surround the body.
+
+        :return: A (prefix, suffix) tuple of strings to put either side of
+                 the body text.
+        """
+        marker = '\x00netify-body\x00'
         doc = Doc()
         doc.asis('<!DOCTYPE html/>')
         with doc.tag('html'):
             doc.attr(lang='en')
             with doc.tag('head'):
-                doc.asis(self.head_txt)
+                doc.asis(head_txt)
             with doc.tag('body'):
-                doc.asis(self.body_txt)
-                if self.flash_messages:
+                doc.asis(marker)
+                if flash_messages:
                     doc.asis(get_flashed_messages_div())
-        return doc
+        prefix, suffix = doc.getvalue().split(marker)
+        return prefix, suffix
+
+    def get_shell(self):
+        """Return the cached shell for this page.
+
+        :return: A (prefix_segments, suffix) tuple. The prefix is split into
+                 segments wherever a literal head has to be spliced in.
+        """
+        head = self.head_txt if 'head' in self.static else LITERAL_MARKER
+        flash_messages = bool(self.flash_messages)
+
+        def build():
+            """Build the shell and split it at the literal markers."""
+            prefix, suffix = self.build_shell(head, flash_messages)
+            return tuple(prefix.split(LITERAL_MARKER)), suffix
+        return SHELL_CACHE.get_or_create((head, flash_messages), build)
+
+    @timed('build')
+    def split_page(self):
+        """Split the page into template segments and literal regions.
+
+        :return: A (segments, literals) tuple of lists where the page is
+                 segments[0] + literals[0] + segments[1] + ... + segments[-1].
+
+        This is the work of build, so it is timed as the "build" phase.
+        """
+        self.get_text()
+        prefix_segments, suffix = self.get_shell()
+        segments = list(prefix_segments)
+        literals = [] if 'head' in self.static else [self.head_txt]
+        if 'body' in self.static:
+            segments[-1] = ''.join((segments[-1], self.body_txt, suffix))
+        else:
+            literals.append(self.body_txt)
+            segments.append(suffix)
+        return segments, literals
+
+    def build(self):
+        """Build the page template string.
+
+        Only the body is spliced in on each call; the rest of the page comes
+        from a shell that is rendered once per distinct head and flash
+        message setting. Literal regions are included as is, so a page with
+        literal regions must be rendered with its render_template method.
+        """
+        return ''.join(flatten(interleave(*self.split_page())))
+
+    def render_template(self):
+        """Render the template segments and splice in the literal regions."""
+        return Markup(''.join(self.render_chunks()))
+
+    def render_chunks(self):
+        """Render the template segments and splice in the literal regions.
+
+        The template segments, including any flashed messages, are rendered
+        straight away while the request is still being handled. Literal
+        regions given as iterables are only consumed as the returned iterator
+        is, so they can be streamed. The minifier works on the chunks as
+        they are consumed too.
+        """
+        segments, literals = self.split_page()
+        rendered = [render_template(segment) if segment else ''
+                    for segment in segments]
+        chunks = flatten(interleave(rendered, literals))
+        if self.minify:
+            return minify_chunks(chunks)
+        return chunks
+
+
+def interleave(segments, literals):
+    """Yield segments[0], literals[0], segments[1], ... segments[-1]."""
+    for index, literal in enumerate(literals):
+        yield segments[index]
+        yield literal
+    yield segments[-1]
+
+
+def flatten(chunks):
+    """Yield the strings from a mix of strings and iterables of strings."""
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            yield chunk
+        else:
+            for sub_chunk in chunk:
+                yield sub_chunk
+
+
+DEFAULT_HEAD = '<meta charset="utf-8" />'
+
+
+def escape_text(text):
+    """Escape a string for use as text in an HTML document."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attr(text):
+    """Escape a string for use as a double quoted HTML attribute value."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('"',
+                                                                   '&quot;')
+
+
+def escape_all(strings, escape=escape_text):
+    """Escape a list of strings with a single pass of the escape function."""
+    if not strings:
+        return []
+    escaped = escape('\x00'.join(strings)).split('\x00')
+    if len(escaped) != len(strings):  # some strings contained a NUL
+        escaped = [escape(string) for string in strings]
+    return escaped
+
+
+def _open_html_list(out, value, key_sep, list_tag, close=''):
+    """Write the opening tag of a nested list and return its stack frame."""
+    if isinstance(value, dict):
+        out.append('<ul>')
+        return (True, iter(value.items()), key_sep, '</ul>' + close)
+    out.append('<%s>' % list_tag)
+    return (False, iter(value), None, '</%s>%s' % (list_tag, close))
+
+
+def write_html_list(out, value, key_sep=None, list_tag=None):
+    """Append an HTML list representing a dict, list or tuple to out.
+
+    Nested dicts, lists and tuples are written without recursion into the
+    one output list of strings. Dict keys and values are escaped while list
+    items that are not containers are written as is.
+
+    :param out: A list of strings to append to.
+    :param value: The dict, list or tuple to convert.
+    :param key_sep: The separator between dict keys and values at the top
+                    level. Nested dicts always use the default ": ".
+    :param list_tag: The tag used for the top level list. Nested lists are
+                     always "ul".
+    """
+    if not value:
+        return
+    stack = [_open_html_list(out, value, key_sep if key_sep else ': ',
+                             list_tag if list_tag else 'ul')]
+    while stack:
+        is_dict, items, sep, close = stack[-1]
+        for item in items:
+            if is_dict:
+                key, child = item
+                if isinstance(child, dict):
+                    out.append('<li>')
+                    out.append(escape_text('%s%s' % (key, sep)))
+                elif isinstance(child, (list, tuple)):
+                    out.append('<li>')
+                else:
+                    out.append('<li>%s</li>' % escape_text(
+                        '%s%s%s' % (key, sep, child)))
+                    continue
+            else:
+                child = item
+                if not isinstance(child, (dict, list, tuple)):
+                    out.append('<li>')
+                    out.append(child)
+                    out.append('</li>')
+                    continue
+                out.append('<li>')
+            if not child:
+                out.append('</li>')
+                continue
+            stack.append(_open_html_list(out, child, ': ', 'ul', '</li>'))
+            break
+        else:
+            stack.pop()
+            out.append(close)
 
 
 def dict_to_html_list(dictionary, key_sep=None):
     """Convert a python dictionary into a string representing an HTML list."""
-    key_sep = ': ' if not key_sep else key_sep
-    doc = Doc()
-    if not dictionary:
-        return ""
-    with doc.tag('ul'):
-        for key in dictionary:
-            with doc.tag('li'):
-                if isinstance(dictionary[key], dict):
-                    doc.text('%s%s' % (key, key_sep))
-                    doc.asis(dict_to_html_list(dictionary[key]))
-                elif isinstance(dictionary[key], (list, tuple)):
-                    doc.asis(list_to_html_list(dictionary[key]))
-                else:
-                    doc.text('%s%s%s' % (key, key_sep, dictionary[key]))
-    return doc.getvalue()
+    out = []
+    write_html_list(out, dictionary, key_sep=key_sep)
+    return ''.join(out)
 
 
 def list_to_html_list(iterable, list_tag=None):
     """Convert a python list into a string representing an HTML list."""
+    out = []
+    write_html_list(out, iterable, list_tag=list_tag)
+    return ''.join(out)
+
+
+def link_list_to_html_list(links, list_tag=None):
+    """Convert (href, text) pairs into an HTML list of links.
+
+    The hrefs and the link texts are each escaped in bulk.
+    """
+    if not links:
+        return ''
+    hrefs, texts = zip(*links)
     list_tag = list_tag if list_tag else 'ul'
-    if not iterable:
-        return ""
-    doc = Doc()
-    with doc.tag(list_tag):
-        for item in iterable:
-            with doc.tag('li'):
-                if isinstance(item, dict):
-                    doc.asis(dict_to_html_list(item))
-                elif isinstance(item, (list, tuple)):
-                    doc.asis(list_to_html_list(item))
-                else:
-                    doc.asis(item)
-    return doc.getvalue()
+    out = ['<%s>' % list_tag]
+    for href, text in zip(escape_all(hrefs, escape_attr), escape_all(texts)):
+        out.append('<li><a href="%s">%s</a></li>' % (href, text))
+    out.append('</%s>' % list_tag)
+    return ''.join(out)
+
+
+def _is_secret(name):
+    """Return True for the config options holding the secret keys."""
+    return name.upper().startswith('SECRET_KEY')
 
 
 def build_debug_div(netify):
-    """Generate a div section containing debugging information."""
-    config_dict = netify.config.to_string_dict()
+    """Generate a div section containing debugging information.
+
+    The secret keys are left out of both configs.
+    """
+    config_dict = dict(
+        (section, dict((name, value) for name, value in options.items()
+                       if not _is_secret(name)))
+        for section, options in netify.config.to_string_dict().items())
+    flask_config = dict((name, value)
+                        for name, value in netify.flask_app.config.items()
+                        if not _is_secret(name))
     div = Doc()
     with div.tag('div'):
         div.attr(klass="debug")
@@ -164,7 +444,7 @@ def build_debug_div(netify):
         div.stag('br')
         div.text('Flask Config')
         div.stag('br')
-        div.asis(dict_to_html_list(dict(netify.flask_app.config)))
+        div.asis(dict_to_html_list(flask_config))
     return div.getvalue()
 
 
@@ -12,10 +12,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from io import StringIO
 from unittest import main
 from unittest import skip
+from unittest.mock import MagicMock
 from unittest.mock import Mock
 from unittest.mock import patch
+import os
 
 import netify
 import netify.app as app
@@ -45,7 +48,7 @@ class TestNetifyCore(NetifyTest):
         self.assertIsInstance(napp.description, str)
 
     @patch('netify.config.Config.update_flask')
-    @patch('netify.config.SafeConfigParser', Mock())
+    @patch('netify.config.SafeConfigParser', MagicMock())
     def test_configure_path(self, mock_update_flask):
         """Verify the configure method accepts a config path."""
         path = 'some/fake/path'
@@ -55,7 +58,7 @@ class TestNetifyCore(NetifyTest):
         self.assertTrue(mock_update_flask.called)
 
     @patch('netify.config.Config.update_flask')
-    @patch('netify.config.SafeConfigParser', Mock())
+    @patch('netify.config.SafeConfigParser', MagicMock())
     def test_configure_obj(self, mock_update_flask):
         """Verify the configure method accepts a config object."""
         config_obj = config.Config('blah/blah/blah')
@@ -64,6 +67,17 @@ class TestNetifyCore(NetifyTest):
         self.assertEqual(napp.config, config_obj)
         self.assertTrue(mock_update_flask.called)
 
+    def test_configure_key_file(self):
+        """The secret key file is kept in the instance folder."""
+        napp = app.NetifyApp()
+        with patch.dict('os.environ', clear=True):
+            napp.configure(StringIO('[flask]\n'))
+        key_file = self.app.config['SECRET_KEY_FILE']
+        self.assertEqual(key_file, os.path.join(self.app.instance_path,
+                                                'secret_key'))
+        self.assertEqual(config.read_secret_key_file(key_file),
+                         (self.app.secret_key,))
+
     @staticmethod
     @patch.object(netify.app.NetifyApp, 'flask_app')
     def test_run(mflask_app):
@@ -75,6 +89,17 @@ class TestNetifyCore(NetifyTest):
         napp.run(host, port, debug)
         mflask_app.run.assert_called_once_with(host, port, debug)
 
+    @staticmethod
+    @patch('netify.server.PreforkServer')
+    @patch.object(netify.app.NetifyApp, 'flask_app')
+    def test_serve(mflask_app, mock_server):
+        """Verify the serve method hands the app to a PreforkServer."""
+        napp = app.NetifyApp()
+        napp.serve('host', 8080, workers=4, threads=2)
+        mock_server.assert_called_once_with(mflask_app, 'host', 8080,
+                                            workers=4, threads=2)
+        mock_server().serve_forever.assert_called_once_with()
+
     @skip('Not implemented yet')
     def test_register_views(self):
         """Verify the process of registering Flask views."""
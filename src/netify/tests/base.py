@@ -12,6 +12,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import tempfile
 import unittest
 
 import flask_testing
@@ -28,6 +29,13 @@ class NetifyTest(flask_testing.TestCase):
     """A base class for netify tests that require the netify/flask app."""
 
     def create_app(self):
-        """Create an instance of the flask_app for the Flask Testing API."""
+        """Create an instance of the flask_app for the Flask Testing API.
+
+        The instance folder is a temporary directory so that configuring
+        the app never writes a secret key file into the source tree.
+        """
         napp = app.NetifyApp()
+        instance_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(instance_dir.cleanup)
+        napp.flask_app.instance_path = instance_dir.name
         return napp.flask_app
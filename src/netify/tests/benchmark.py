@@ -0,0 +1,872 @@
+"""Micro benchmarks for the hot paths in netify.
+
+The benchmarks are skipped during a normal test run because they take a while
+and their results depend on the host. Run them explicitly with::
+
+    NETIFY_BENCHMARK=1 python -m unittest -v netify.tests.benchmark
+"""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from unittest import main
+from unittest import skipUnless
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from flask import Flask
+from flask import Markup
+from flask import render_template_string
+from flask import url_for
+from yattag import Doc
+
+import netify.compress as compress
+import netify.diskcache as diskcache
+import netify.lineindex as lineindex
+import netify.metrics as metrics
+import netify.minify as minify
+import netify.rawfile as rawfile
+import netify.rawtree as rawtree
+import netify.search as search
+import netify.template as template
+
+from .base import BasicTest
+from .config import make_config
+
+
+benchmark = skipUnless(os.getenv('NETIFY_BENCHMARK'),
+                       'Set NETIFY_BENCHMARK=1 to run the benchmarks.')
+
+
+def best_of(func, number, repeat=5):
+    """Return the best time per call of func in seconds.
+
+    Garbage collection stays enabled, as it is when serving requests, so
+    code creating reference cycles is measured fairly and can't exhaust
+    memory.
+    """
+    timer = timeit.Timer(func, setup='import gc; gc.enable()')
+    return min(timer.repeat(number=number, repeat=repeat)) / number
+
+
+def format_time(seconds):
+    """Format a duration in seconds using a readable unit."""
+    if seconds >= 0.1:
+        return '%.3f s' % seconds
+    elif seconds >= 1e-3:
+        return '%.2f ms' % (seconds * 1e3)
+    return '%.2f us' % (seconds * 1e6)
+
+
+def report(name, before, after):
+    """Print a before and after comparison for a benchmark."""
+    print('\n%s: before %s, after %s, speedup x%.1f' %
+          (name, format_time(before), format_time(after), before / after))
+
+
+@benchmark
+class ConfigBenchmark(BasicTest):
+    """Measure the config overhead paid by a view on every request."""
+
+    lookups = 3  # HelloWorld.index reads its page options three times
+
+    def test_page_options(self):
+        """Compare re-parsing a section with reading the snapshot."""
+        conf = make_config()
+        conf.compile()
+
+        def parse_section():
+            """The per request cost before snapshots were introduced."""
+            for _ in range(self.lookups):
+                dict((option, conf._coerce(conf.get('raw_file', option)))
+                     for option in conf.parser.options('raw_file'))
+
+        def read_snapshot():
+            """The per request cost when reading the compiled snapshot."""
+            for _ in range(self.lookups):
+                conf.get_page_options('raw_file')
+
+        before = best_of(parse_section, 2000)
+        after = best_of(read_snapshot, 2000)
+        report('config lookups per request', before, after)
+        self.assertLess(after, before)
+
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from netify.app import NetifyApp
+app = NetifyApp.uwsgi_main(%r)
+app.test_client().get('/')
+print(time.perf_counter() - start)
+"""
+
+STARTUP_CONFIG = """
+[flask]
+debug = false
+
+[netify]
+config_cache = %s
+secret_key_file = %s
+
+[netify_views]
+enabled = hello_world
+
+[routes]
+hello_world=/
+"""
+
+
+def subprocess_env():
+    """Return the environment of a Python subprocess importing netify."""
+    env = dict(os.environ)
+    src_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [src_dir] + env.get('PYTHONPATH', '').split(os.pathsep))
+    return env
+
+
+def time_startup(config_path, runs=5):
+    """Time a fresh interpreter from import to serving the first request."""
+    env = subprocess_env()
+    script = STARTUP_SCRIPT % config_path
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         env=env, stderr=subprocess.DEVNULL)
+        times.append(float(output.decode().split()[-1]))
+    return min(times)
+
+
+@benchmark
+class StartupBenchmark(BasicTest):
+    """Measure uwsgi_main from import to the first servable app."""
+
+    def test_config_cache(self):
+        """Compare starting with and without the compiled config cache."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plain = os.path.join(tmp_dir, 'plain.cfg')
+            cached = os.path.join(tmp_dir, 'cached.cfg')
+            key_file = os.path.join(tmp_dir, 'secret_key')
+            with open(plain, 'w') as fout:
+                fout.write(STARTUP_CONFIG % ('false', key_file))
+            with open(cached, 'w') as fout:
+                fout.write(STARTUP_CONFIG % ('true', key_file))
+            time_startup(cached, runs=1)  # write the cache
+            before = time_startup(plain)
+            after = time_startup(cached)
+        report('uwsgi_main startup', before, after)
+
+
+def import_time(modules, runs=5):
+    """Return the best time a fresh interpreter takes to import modules.
+
+    The time is the sum of the cumulative times reported by "python -X
+    importtime" for the top level imports.
+    """
+    times = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import %s' % ', '.join(modules)],
+            env=subprocess_env(), stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, check=True).stderr.decode()
+        total = 0
+        for line in output.splitlines():
+            fields = line.split('|')
+            # Nested imports are indented below the one importing them.
+            if (len(fields) == 3 and fields[1].strip().isdigit() and
+                    not fields[2].startswith('  ')):
+                total += int(fields[1])
+        times.append(total / 1e6)
+    return min(times)
+
+
+@benchmark
+class ImportBenchmark(BasicTest):
+    """Measure the cost of importing netify.app in a new process."""
+
+    def test_import_time(self):
+        """Compare importing everything up front with importing on demand.
+
+        The "before" case is synthetic: the old eager import can't be run
+        from this tree, so it is approximated by importing netify.app
+        together with every module it used to pull in.
+        """
+        before = import_time(['argparse', 'flask', 'netify.app',
+                              'netify.view', 'netify.template',
+                              'netify.session', 'netify.rawfile',
+                              'netify.rawtree', 'netify.searchview',
+                              'netify.metricsview', 'netify.server'])
+        after = import_time(['netify.app'])
+        report('import netify.app (synthetic before)', before, after)
+        after = import_time(['netify.app', 'flask', 'netify.view',
+                             'netify.template', 'netify.session',
+                             'netify.rawfile'])
+        report('build an app with raw_file enabled (synthetic before)',
+               before, after)
+        flask_time = import_time(['flask', 'flask_classy', 'yattag'])
+        print('of which flask, flask_classy and yattag take %s' %
+              format_time(flask_time))
+
+
+class YattagHtmlPage(template.HtmlPage):
+    """An HtmlPage built and rendered the way HtmlPage originally was.
+
+    The whole page is rebuilt with yattag and then lexed, compiled and
+    rendered by Jinja2 on every call.
+    """
+
+    def build(self):
+        """Build the full page, body included, with yattag."""
+        self.get_text()
+        doc = Doc()
+        doc.asis('<!DOCTYPE html/>')
+        with doc.tag('html'):
+            doc.attr(lang='en')
+            with doc.tag('head'):
+                doc.asis(self.head_txt)
+            with doc.tag('body'):
+                doc.asis(self.body_txt)
+                if self.flash_messages:
+                    doc.asis(template.get_flashed_messages_div())
+        return doc
+
+    def render_template(self):
+        """Render the whole page with render_template_string."""
+        return Markup(render_template_string(self.build().getvalue()))
+
+
+@benchmark
+class PageBenchmark(BasicTest):
+    """Measure the throughput of HtmlPage(...).render_template()."""
+
+    head = ('<head><link href="/static/fret.css" type="text/css" '
+            'rel="stylesheet"></link></head>')
+    body = '<h1>File: example</h1><ul>%s</ul>' % (
+        '<li><a href="/raw_file/x">x</a></li>' * 50)
+
+    def test_render_template(self):
+        """Compare building the page with yattag and with a cached shell."""
+        flask_app = Flask(__name__)
+        flask_app.secret_key = 'benchmark'
+        with flask_app.test_request_context():
+            def render(page_cls):
+                """Return a function rendering a page of page_cls."""
+                return lambda: page_cls(head=self.head, body=self.body,
+                                        static=('head',)).render_template()
+            self.assertEqual(render(YattagHtmlPage)(),
+                             render(template.HtmlPage)())
+            before = best_of(render(YattagHtmlPage), 2000)
+            after = best_of(render(template.HtmlPage), 2000)
+        report('HtmlPage.render_template', before, after)
+        print('pages per second: before %d, after %d' %
+              (1 / before, 1 / after))
+
+    def test_large_body(self):
+        """Compare rendering a large literal body with and without Jinja2."""
+        body = '<pre>%s</pre>' % ('a line of &lt;escaped&gt; text\n' * 200000)
+        flask_app = Flask(__name__)
+        flask_app.secret_key = 'benchmark'
+        with flask_app.test_request_context():
+            before = best_of(lambda: YattagHtmlPage(
+                body=body, static=()).render_template(), 3, repeat=3)
+            after = best_of(lambda: template.HtmlPage(
+                body=body, static=()).render_template(), 3, repeat=3)
+        report('HtmlPage.render_template %d MB body' % (len(body) >> 20),
+               before, after)
+
+
+@benchmark
+class FragmentBenchmark(BasicTest):
+    """Compare the HelloWorld debug page with and without fragment caching."""
+
+    def test_debug_page(self):
+        """Time the debug page against the page without debug output."""
+        flask_app = Flask('netify')
+        flask_app.secret_key = 'benchmark'
+        conf = make_config()
+        conf.compile()
+        netify = Mock(flask_app=flask_app, config=conf, url_map_version=1)
+
+        def page(head, body=''):
+            """Render a page like HelloWorld.index."""
+            return template.HtmlPage(head=head, body=body,
+                                     flash_messages=False).render_template()
+
+        def uncached():
+            """Rebuild the header and debug div on every request."""
+            return page(template.make_header(),
+                        template.build_debug_div(netify))
+
+        def memoized():
+            """Reuse the header and debug div for the config generation."""
+            return page(template.memoize_fragment(netify,
+                                                  template.make_header),
+                        template.memoize_fragment(
+                            netify, template.build_debug_div, netify))
+
+        with flask_app.test_request_context():
+            self.assertEqual(uncached(), memoized())
+            normal = best_of(lambda: page(template.memoize_fragment(
+                netify, template.make_header)), 2000)
+            before = best_of(uncached, 2000)
+            after = best_of(memoized, 2000)
+        report('HelloWorld debug page', before, after)
+        print('page without debug output: %s' % format_time(normal))
+
+
+def legacy_dict_to_html_list(dictionary, key_sep=None):
+    """The original, recursive dict_to_html_list for comparison."""
+    key_sep = ': ' if not key_sep else key_sep
+    doc = Doc()
+    if not dictionary:
+        return ""
+    with doc.tag('ul'):
+        for key in dictionary:
+            with doc.tag('li'):
+                if isinstance(dictionary[key], dict):
+                    doc.text('%s%s' % (key, key_sep))
+                    doc.asis(legacy_dict_to_html_list(dictionary[key]))
+                elif isinstance(dictionary[key], (list, tuple)):
+                    doc.asis(legacy_list_to_html_list(dictionary[key]))
+                else:
+                    doc.text('%s%s%s' % (key, key_sep, dictionary[key]))
+    return doc.getvalue()
+
+
+def legacy_list_to_html_list(iterable, list_tag=None):
+    """The original, recursive list_to_html_list for comparison."""
+    list_tag = list_tag if list_tag else 'ul'
+    if not iterable:
+        return ""
+    doc = Doc()
+    with doc.tag(list_tag):
+        for item in iterable:
+            with doc.tag('li'):
+                if isinstance(item, dict):
+                    doc.asis(legacy_dict_to_html_list(item))
+                elif isinstance(item, (list, tuple)):
+                    doc.asis(legacy_list_to_html_list(item))
+                else:
+                    doc.asis(item)
+    return doc.getvalue()
+
+
+def legacy_link_list(links):
+    """Build a list of links with a yattag Doc per link, as RawFile did."""
+    html_links = []
+    for href, text in links:
+        doc = Doc()
+        with doc.tag('a'):
+            doc.attr(href=href)
+            doc.text(text)
+        html_links.append(doc.getvalue())
+    return legacy_list_to_html_list(html_links)
+
+
+@benchmark
+class HtmlListBenchmark(BasicTest):
+    """Compare the iterative HTML list builders with the recursive ones."""
+
+    sizes = (10000, 100000, 1000000)
+
+    def _compare(self, name, before, after, repeat):
+        """Check both functions agree then time them."""
+        self.assertEqual(before(), after())
+        report(name, best_of(before, 1, repeat), best_of(after, 1, repeat))
+
+    def test_link_list(self):
+        """Directory listing sized lists of links."""
+        for size in self.sizes:
+            links = [('/raw_file/dir%%7Cfile_%d.txt' % i,
+                      'dir/file_%d.txt' % i) for i in range(size)]
+            self._compare('link list of %d items' % size,
+                          lambda: legacy_link_list(links),
+                          lambda: template.link_list_to_html_list(links),
+                          repeat=1 if size >= 1000000 else 3)
+
+    def test_nested(self):
+        """Nested dicts and lists of the same total size."""
+        for size in self.sizes:
+            data = dict(('section_%d' % i, {'key': 'value & more',
+                                            'items': ['<i>a</i>', 'b']})
+                        for i in range(size // 4))
+            self._compare('nested dict of %d items' % size,
+                          lambda: legacy_dict_to_html_list(data),
+                          lambda: template.dict_to_html_list(data),
+                          repeat=1 if size >= 1000000 else 3)
+
+    def test_deep(self):
+        """Deeply nested lists, where recursion copies quadratically."""
+        data = ['leaf']
+        for _ in range(500):
+            data = [data]
+        self._compare('list nested 500 deep',
+                      lambda: legacy_list_to_html_list(data),
+                      lambda: template.list_to_html_list(data), repeat=3)
+
+
+@benchmark
+class CompressBenchmark(BasicTest):
+    """Measure compressing a directory listing page on every response."""
+
+    def test_listing(self):
+        """Compare compressing every response with the compressed cache."""
+        links = [('/raw_file/dir|file_%d.txt' % num, 'dir/file_%d.txt' % num)
+                 for num in range(1000)]
+        page = template.HtmlPage(
+            body=template.link_list_to_html_list(links),
+            flash_messages=False).build().encode('utf-8')
+        netify_app = Mock()
+        netify_app.config.get_page_options.return_value = {}
+        compressor = compress.Compressor(netify_app)
+        before = best_of(lambda: compress.compress(page, 'gzip'), 200)
+        after = best_of(
+            lambda: compressor.compress_body(page, 'gzip', 6), 200)
+        report('gzip a %d kB listing' % (len(page) >> 10), before, after)
+        stats = compressor.stats()
+        print('bytes saved per response: %d of %d, CPU time spent: %s' %
+              (stats['bytes_saved'] / stats['responses'], len(page),
+               format_time(stats['cpu_time'])))
+
+
+@benchmark
+class MinifyBenchmark(BasicTest):
+    """Measure the CPU cost of minifying against the bytes it saves."""
+
+    def test_listing(self):
+        """Minify a RawFile style directory listing of 1000 entries."""
+        links = [('/raw_file/dir|file_%d.txt' % num, 'dir/file_%d.txt' % num)
+                 for num in range(1000)]
+        page = template.HtmlPage(
+            head=template.DEFAULT_HEAD,
+            body='<h1>File: dir</h1><div class="navigation">%s</div>'
+                 '<div class="files">%s</div>' % (
+                     template.list_to_html_list(['<a href="/raw_file/">'
+                                                 'Top Dir</a>']),
+                     template.link_list_to_html_list(links)),
+            flash_messages=False).build()
+        minified = ''.join(minify.minify_chunks([page]))
+        cost = best_of(lambda: ''.join(minify.minify_chunks([page])), 50)
+        print('\nminify a %d kB listing: %s, %d bytes saved (%.1f%%)' %
+              (len(page) >> 10, format_time(cost), len(page) - len(minified),
+               100.0 * (len(page) - len(minified)) / len(page)))
+        gzipped = len(compress.compress(page.encode(), 'gzip'))
+        gzipped_minified = len(compress.compress(minified.encode(), 'gzip'))
+        print('gzipped: %d bytes, minified and gzipped: %d bytes (%.1f%%)' %
+              (gzipped, gzipped_minified,
+               100.0 * (gzipped - gzipped_minified) / gzipped))
+
+
+def make_raw_file(options):
+    """Return a RawFile view and a Flask app it can build URLs with."""
+    flask_app = Flask(__name__)
+    flask_app.add_url_rule('/raw_file/<name>', 'RawFile:get')
+    flask_app.add_url_rule('/raw_file/', 'RawFile:index')
+    netify_app = Mock(flask_app=flask_app, url_map_version=1)
+    netify_app.config.generation = 1
+    netify_app.config.get_page_options.return_value = options
+    raw_file = rawfile.RawFile()
+    raw_file.netify_app = netify_app
+    return raw_file, flask_app
+
+
+@benchmark
+class ListingCacheBenchmark(BasicTest):
+    """Compare building a directory listing with serving it warm."""
+
+    def test_listing(self):
+        """List a directory of 10000 files."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for num in range(10000):
+                open(os.path.join(tmp_dir, 'file_%05d.txt' % num),
+                     'w').close()
+            raw_file, flask_app = make_raw_file({
+                'path': tmp_dir, 'suffix_whitelist': ('.txt',),
+                'listing_cache_size': 16 * 1024 ** 2, 'page_size': 0})
+            with flask_app.test_request_context():
+                before = best_of(lambda: raw_file._build_dir_listing(
+                    tmp_dir, raw_file._scan_dir(tmp_dir)), 5)
+                after = best_of(
+                    lambda: raw_file._get_dir_listing(tmp_dir), 2000)
+        report('directory listing of 10000 files', before, after)
+        print('listing cache: %s' % rawfile.LISTING_CACHE.stats())
+
+
+def legacy_build_dir_listing(raw_file, path):
+    """List a directory the way RawFile did before it used os.scandir."""
+    all_fnames = [f for f in os.listdir(path) if not f.startswith('.')]
+    suffixes = raw_file.page_options['suffix_whitelist']
+    fnames = []
+    for fname in all_fnames:
+        if not suffixes or fname.endswith(suffixes):
+            fnames.append(fname)
+        elif os.path.isdir(os.path.join(path, fname)):
+            fnames.append(fname + '/')
+    fnames.sort()
+    base = raw_file._get_safe_base_path(path)
+    names = [os.path.join(base, name) for name in fnames]
+    return template.link_list_to_html_list(
+        [(url_for('RawFile:get', name=name.replace('/', '|')), name)
+         for name in names])
+
+
+def build_dir_listing(raw_file, path):
+    """List every entry of a directory the way RawFile does now."""
+    return raw_file._build_dir_listing(path, raw_file._scan_dir(path))
+
+
+@benchmark
+class ScandirListingBenchmark(BasicTest):
+    """Compare the scandir listing engine with the listdir based one."""
+
+    sizes = (1000, 50000, 500000)
+
+    def test_listing(self):
+        """List synthetic directories where half the files are filtered."""
+        for size in self.sizes:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                for num in range(size):
+                    suffix = '.txt' if num % 2 else '.dat'
+                    open(os.path.join(tmp_dir, 'file_%07d%s' % (num, suffix)),
+                         'w').close()
+                raw_file, flask_app = make_raw_file({
+                    'path': tmp_dir, 'suffix_whitelist': ('.txt',)})
+                repeat = 5 if size < 100000 else 1
+                with flask_app.test_request_context():
+                    self.assertEqual(
+                        legacy_build_dir_listing(raw_file, tmp_dir),
+                        build_dir_listing(raw_file, tmp_dir))
+                    before = best_of(lambda: legacy_build_dir_listing(
+                        raw_file, tmp_dir), 1, repeat=repeat)
+                    after = best_of(
+                        lambda: build_dir_listing(raw_file, tmp_dir), 1,
+                        repeat=repeat)
+            report('listing of %d entries' % size, before, after)
+
+
+@benchmark
+class PaginationBenchmark(BasicTest):
+    """Check the cost of a listing page doesn't depend on its position."""
+
+    size = 500000
+
+    def test_pages(self):
+        """Build the first, middle and last pages of a 500k entry index."""
+        names = tuple('file_%07d.txt' % num for num in range(self.size))
+        raw_file, flask_app = make_raw_file({
+            'path': '', 'page_size': 1000, 'max_page_size': 10000})
+        with flask_app.test_request_context('/raw_file/'):
+            for position in (0, self.size // 2, self.size - 1000):
+                after = names[position - 1] if position else ''
+                cost = best_of(lambda: raw_file._build_dir_listing(
+                    '', names, after, 1000), 20)
+                print('\npage at entry %d of %d: %s' %
+                      (position, self.size, format_time(cost)))
+            whole = best_of(lambda: raw_file._build_dir_listing(
+                '', names, '', None), 1, repeat=1)
+        print('one page of every entry: %s' % format_time(whole))
+
+
+@benchmark
+class LineSliceBenchmark(BasicTest):
+    """Compare showing the tail of a large log with reading all of it."""
+
+    lines = 2000000
+
+    def test_tail(self):
+        """Show the last 1000 lines of a file of 2M lines."""
+        raw_file, flask_app = make_raw_file({
+            'line_count': 1000, 'byte_count': 1024 ** 2, 'chunk_size': 65536,
+            'stream_threshold': 1024 ** 3})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'big.log')
+            with open(path, 'w') as fout:
+                fout.writelines('%07d some log message text\n' % num
+                                for num in range(self.lines))
+            with flask_app.test_request_context('/raw_file/?start=-1000'):
+                path_stat = os.stat(path)
+                before = best_of(lambda: raw_file._get_file(path), 1,
+                                 repeat=3)
+                cold = best_of(lambda: lineindex.find_lines(
+                    path, path_stat, -1000, 1000), 1, repeat=1)
+                after = best_of(lambda: raw_file._get_file_contents(
+                    path, path_stat), 20)
+                with open(path, 'a') as fout:
+                    fout.write('one more line\n')
+                grown = best_of(lambda: raw_file._get_file_contents(
+                    path, os.stat(path)), 1, repeat=1)
+        report('last 1000 of %d lines' % self.lines, before, after)
+        print('indexing the whole file: %s, after it grew: %s' %
+              (format_time(cold), format_time(grown)))
+
+
+def scan_tree(root, words):
+    """Find the files containing every word by reading the whole tree."""
+    names = []
+    for name, _ in search.walk_files(root, ('.txt',)):
+        with open(os.path.join(root, name)) as fin:
+            if words <= search.tokenize(fin.read()):
+                names.append(name)
+    return sorted(names)
+
+
+@benchmark
+class SearchBenchmark(BasicTest):
+    """Compare indexed searches with reading every file of a tree."""
+
+    files = 1000
+    words_per_file = 8000
+
+    def test_search(self):
+        """Search 1000 files of 8000 words from a skewed vocabulary."""
+        rand = random.Random(0)
+        vocabulary = ['word%d' % num for num in range(50000)]
+        weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = os.path.join(tmp_dir, 'tree')
+            for num in range(self.files):
+                directory = os.path.join(root, 'dir%02d' % (num % 50))
+                os.makedirs(directory, exist_ok=True)
+                with open(os.path.join(directory, 'f%04d.txt' % num),
+                          'w') as fout:
+                    fout.write(' '.join(rand.choices(
+                        vocabulary, weights, k=self.words_per_file)))
+            index = search.SearchIndex(os.path.join(tmp_dir, 'index.sqlite'))
+            build = best_of(lambda: index.update(root, ('.txt',)), 1,
+                            repeat=1)
+            noop = best_of(lambda: index.update(root, ('.txt',)), 1,
+                           repeat=3)
+            print('\nindexing %d files: %s, update with no changes: %s' %
+                  (self.files, format_time(build), format_time(noop)))
+            for query in ('word0', 'word40000', 'word0 word5 word2000'):
+                words = search.tokenize(query)
+                names, _ = index.search(query, limit=self.files)
+                self.assertEqual(names, scan_tree(root, words))
+                before = best_of(lambda: scan_tree(root, words), 1, repeat=1)
+                after = best_of(lambda: index.search(query), 20)
+                report('search for %r' % query, before, after)
+
+
+def make_tree_app(path):
+    """Return a Flask app serving path with the RawFile and RawTree views.
+
+    Registering sets the views' netify_app, which the caller must restore.
+
+    The page options are the views' defaults, except that the RawFile
+    listing cache is off so every listing is built as on a first visit.
+    """
+    flask_app = Flask(__name__)
+    flask_app.secret_key = 'benchmark'
+    options = {}
+    for view_cls in (rawfile.RawFile, rawtree.RawTree):
+        options[view_cls.name] = {
+            key: option.default
+            for key, option in view_cls.option_schema.items()}
+        options[view_cls.name].update(path=path, suffix_whitelist=('.txt',))
+    options['raw_file']['listing_cache_size'] = 0
+    options['raw_tree']['max_entries'] = 10 ** 7
+    netify_app = Mock(flask_app=flask_app, url_map_version=1)
+    netify_app.config.generation = 1
+    netify_app.config.get_page_options.side_effect = options.__getitem__
+    rawfile.RawFile.register(netify_app)
+    rawtree.RawTree.register(netify_app)
+    return flask_app
+
+
+@benchmark
+class TreeBenchmark(BasicTest):
+    """Compare one tree listing with requesting every directory's page."""
+
+    dirs = 500
+    files_per_dir = 200
+
+    def test_tree(self):
+        """List 500 directories of 200 files, the way a mirror would."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for num in range(self.dirs):
+                directory = os.path.join(tmp_dir, 'd%02d' % (num % 20),
+                                         'd%03d' % num)
+                os.makedirs(directory)
+                for fnum in range(self.files_per_dir):
+                    open(os.path.join(directory, 'f%03d.txt' % fnum),
+                         'w').close()
+            for view_cls in (rawfile.RawFile, rawtree.RawTree):
+                patcher = patch.object(view_cls, 'netify_app')
+                patcher.start()
+                self.addCleanup(patcher.stop)
+            client = make_tree_app(tmp_dir).test_client()
+            names = sorted(
+                os.path.relpath(os.path.join(parent, name),
+                                tmp_dir).replace('/', '|')
+                for parent, names, _ in os.walk(tmp_dir) for name in names)
+
+            def crawl():
+                """Request the RawFile page of every directory."""
+                client.get('/raw_file/')
+                for name in names:
+                    client.get('/raw_file/%s' % name)
+
+            before = best_of(crawl, 1, repeat=3)
+            after = best_of(lambda: client.get('/raw_tree/').data, 1,
+                            repeat=3)
+            report('tree of %d entries' % (
+                (len(names) + 1) * self.files_per_dir), before, after)
+            after = best_of(lambda: client.get(
+                '/raw_tree/?format=text').data, 1, repeat=3)
+            report('tree of %d entries as text' % (
+                (len(names) + 1) * self.files_per_dir), before, after)
+
+
+@benchmark
+class RenderCacheBenchmark(BasicTest):
+    """Compare rendering a file with reading its render from the disk cache."""
+
+    def test_render_cache(self):
+        """Show a 900KB source file in a worker with an empty memory."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'page.html')
+            with open(path, 'w') as fout:
+                fout.writelines('<li><a href="/x?a=%d&amp;b=1">"%d"</a></li>\n'
+                                % (num, num) for num in range(20000))
+            options = {'render_cache_size': 64 * 1024 ** 2,
+                       'render_cache_min_size': 0,
+                       'render_cache_dir': os.path.join(tmp_dir, 'cache')}
+            raw_file, _ = make_raw_file(options)
+            path_stat = os.stat(path)
+            html = raw_file._get_rendered_file(path, path_stat)
+
+            def cold_worker():
+                """Serve the file from a cache this process hasn't used."""
+                diskcache._CACHES.clear()
+                return raw_file._get_rendered_file(path, path_stat)
+
+            self.assertEqual(cold_worker(), html)
+            before = best_of(lambda: raw_file._get_file(path), 20)
+            after = best_of(cold_worker, 20)
+        report('render a %dKB file' % (path_stat.st_size >> 10), before,
+               after)
+
+
+SERVER_SCRIPT = """
+import sys
+import time
+from flask import Flask
+from werkzeug.serving import make_server
+from netify.server import PreforkServer
+app = Flask(__name__)
+app.add_url_rule('/', 'index', lambda: '<p>A netify page.</p>' * 500)
+# A page waiting 10ms on I/O, as when a file is read from a slow disk.
+app.add_url_rule('/io', 'io', lambda: time.sleep(0.01) or 'done')
+if sys.argv[1] == 'dev':
+    server = make_server('127.0.0.1', 0, app)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+else:
+    server = PreforkServer(app, port=0, workers=int(sys.argv[1]), threads=8)
+    print(server.address[1], flush=True)
+    server.serve_forever()
+"""
+
+
+def requests_per_second(args, path='/', requests=2000, clients=16):
+    """Serve a small page with SERVER_SCRIPT and time concurrent clients."""
+    env = subprocess_env()
+    process = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT] + args,
+                               env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    try:
+        port = int(process.stdout.readline())
+
+        def get(_):
+            """Request the page on a new connection."""
+            connection = HTTPConnection('127.0.0.1', port, timeout=30)
+            connection.request('GET', path)
+            connection.getresponse().read()
+            connection.close()
+
+        with ThreadPoolExecutor(clients) as executor:
+            list(executor.map(get, range(clients)))
+            start = time.perf_counter()
+            list(executor.map(get, range(requests)))
+            return requests / (time.perf_counter() - start)
+    finally:
+        process.terminate()
+        process.wait()
+        process.stdout.close()
+
+
+@benchmark
+class ServerBenchmark(BasicTest):
+    """Compare the dev server with the pre-forking server."""
+
+    def test_throughput(self):
+        """Serve a small page and a page waiting on I/O to 16 clients."""
+        for path in ('/', '/io'):
+            before = requests_per_second(['dev'], path)
+            for workers in (1, 2, 4):
+                after = requests_per_second([str(workers)], path)
+                print('\n%s requests per second: dev server %d, %d workers '
+                      'of 8 threads %d, x%.1f' % (path, before, workers,
+                                                  after, after / before))
+
+
+@benchmark
+class MetricsBenchmark(BasicTest):
+    """Measure the cost of recording the metrics of a request."""
+
+    def test_request(self):
+        """Time the hooks and phase timers run for a page request.
+
+        A HtmlPage request runs the request hooks and times the view, the
+        page options, the build and two Jinja segments.
+        """
+        flask_app = Flask(__name__)
+        hooks = metrics.RequestMetrics()
+        phase = metrics.timed('build')(lambda: None)
+        response = flask_app.response_class('page')
+
+        def instrument():
+            """Run the hooks and timers of one request."""
+            hooks.before_request()
+            for _ in range(5):
+                phase()
+            hooks.after_request(response)
+
+        self.addCleanup(metrics.REGISTRY.disable)
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                flask_app.test_request_context('/'):
+            before = best_of(instrument, 10000)
+            metrics.REGISTRY.enable(tmp_dir)
+            after = best_of(instrument, 10000)
+            scrape = best_of(lambda: metrics.format_text(
+                metrics.REGISTRY.collect()), 100)
+            metrics.REGISTRY.disable()
+        print('\nrequest instrumentation: disabled %s, enabled %s, '
+              'scraping the metrics: %s' % (format_time(before),
+                                            format_time(after),
+                                            format_time(scrape)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Tests for the netify.cache module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest import main
+
+from netify.cache import CACHES
+from netify.cache import LruCache
+
+from .base import BasicTest
+
+
+class TestLruCache(BasicTest):
+    """Verify the bounded LRU cache."""
+
+    def test_counters(self):
+        """Hits and misses are counted."""
+        cache = LruCache()
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats(), {'entries': 1, 'size': 0, 'hits': 1,
+                                         'misses': 1, 'evictions': 0})
+
+    def test_eviction(self):
+        """The least recently used entry is evicted first."""
+        cache = LruCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_bytes(self):
+        """Entries are evicted to keep the values within the byte budget."""
+        cache = LruCache(max_bytes=10)
+        cache.put('a', 'aaaa')
+        cache.put('b', 'bbbb')
+        cache.put('a', 'aaa')
+        self.assertEqual(cache.size, 7)
+        cache.put('c', 'cccc')
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.size, 7)
+        cache.put('d', 'd' * 11)
+        self.assertNotIn('d', cache)
+        self.assertEqual(cache.stats()['size'], 7)
+
+    def test_get_or_create(self):
+        """The factory is only called on a miss."""
+        cache = LruCache()
+        self.assertEqual(cache.get_or_create('a', lambda: 1), 1)
+        self.assertEqual(cache.get_or_create('a', lambda: 2), 1)
+
+    def test_name(self):
+        """Named caches are added to CACHES."""
+        cache = LruCache(name='test')
+        self.addCleanup(CACHES.pop, 'test')
+        self.assertIs(CACHES['test'], cache)
+
+
+if __name__ == "__main__":
+    main()
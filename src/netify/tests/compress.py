@@ -0,0 +1,140 @@
+"""Tests for the netify compress module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import Mock
+import gzip
+import tempfile
+import zlib
+
+from flask import Flask
+from flask import Response
+
+from netify.tests.base import BasicTest
+import netify.compress as compress
+import netify.metrics as metrics
+
+
+PAGE = '<html><body>%s</body></html>' % ('<p>compress me</p>' * 200)
+
+
+class CompressorTest(BasicTest):
+    """Verify the response compressor."""
+
+    def setUp(self):
+        """Create a Flask app with a page, a small page and a stream."""
+        self.options = {'compress': True, 'compress_min_size': 1024,
+                        'compress_level': 6, 'compress_cache_size': 8}
+        netify_app = Mock()
+        netify_app.config.get_page_options.return_value = self.options
+        self.compressor = compress.Compressor(netify_app)
+        flask_app = Flask(__name__)
+        flask_app.add_url_rule('/page', 'page', lambda: PAGE)
+        flask_app.add_url_rule('/etag', 'etag', lambda: Response(
+            PAGE, headers={'ETag': '"strong"'}))
+        flask_app.add_url_rule('/small', 'small', lambda: '<p>small</p>')
+        flask_app.add_url_rule('/stream', 'stream', lambda: Response(
+            iter(['<p>chunk</p>'] * 200), mimetype='text/html'))
+        flask_app.after_request(self.compressor.after_request)
+        self.client = flask_app.test_client()
+
+    def get(self, url, encoding='gzip, deflate'):
+        """Get a url accepting the given encodings."""
+        return self.client.get(url, headers={'Accept-Encoding': encoding})
+
+    def test_gzip(self):
+        """Pages are gzipped when the client accepts it."""
+        response = self.get('/page')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data).decode(), PAGE)
+        self.assertEqual(int(response.headers['Content-Length']),
+                         len(response.data))
+
+    def test_deflate(self):
+        """Deflate is used when it is the only accepted coding."""
+        response = self.get('/page', encoding='deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(response.data).decode(), PAGE)
+
+    def test_not_accepted(self):
+        """Pages are sent as is to clients that don't accept compression."""
+        response = self.get('/page', encoding='identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(response.data.decode(), PAGE)
+
+    def test_min_size(self):
+        """Pages smaller than compress_min_size are not compressed."""
+        response = self.get('/small')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_disabled(self):
+        """Nothing changes unless the compress option is enabled."""
+        self.options['compress'] = False
+        response = self.get('/page')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Vary', response.headers)
+
+    def test_cached(self):
+        """A page served repeatedly is compressed once."""
+        for _ in range(3):
+            self.get('/page')
+        stats = self.compressor.stats()
+        self.assertEqual(stats['responses'], 3)
+        self.assertEqual(stats['cache']['misses'], 1)
+        self.assertEqual(stats['cache']['hits'], 2)
+        self.assertEqual(stats['bytes_saved'],
+                         stats['bytes_in'] - stats['bytes_out'])
+        self.assertGreater(stats['bytes_saved'], 0)
+
+    def test_stream(self):
+        """Streamed responses are compressed as they are sent."""
+        response = self.get('/stream')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data).decode(),
+                         '<p>chunk</p>' * 200)
+        self.assertEqual(self.compressor.stats()['bytes_in'], 2400)
+
+    def test_metrics(self):
+        """The counters are recorded while the metrics registry is enabled."""
+        registry = metrics.MetricsRegistry()
+        self.compressor.registry = registry
+        self.get('/page')
+        self.assertNotIn('netify_compress_responses_total',
+                         registry.snapshot())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            registry.enable(tmp_dir, flush_interval=60)
+            self.addCleanup(registry.disable)
+            self.get('/page')
+            self.get('/page', encoding='deflate')
+            samples = registry.snapshot()
+        stats = self.compressor.stats()
+        self.assertEqual(samples['netify_compress_responses_total'],
+                         {'encoding="gzip"': 1, 'encoding="deflate"': 1})
+        self.assertEqual(
+            sum(samples['netify_compress_bytes_in_total'].values()),
+            2 * len(PAGE))
+        self.assertGreater(
+            samples['netify_compress_bytes_saved_total']['encoding="gzip"'],
+            0)
+        self.assertLessEqual(
+            sum(samples['netify_compress_cpu_seconds_total'].values()),
+            stats['cpu_time'])
+
+    def test_etag(self):
+        """A strong ETag becomes weak when the response is compressed."""
+        response = self.get('/etag')
+        self.assertEqual(response.headers['ETag'], 'W/"strong"')
+        response = self.get('/etag', encoding='identity')
+        self.assertEqual(response.headers['ETag'], '"strong"')
@@ -0,0 +1,283 @@
+"""Tests for the netify.config module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from io import StringIO
+from unittest import main
+from unittest.mock import Mock
+from unittest.mock import patch
+import os
+import tempfile
+
+import netify.config as config
+
+from .base import BasicTest
+
+
+TEST_CONFIG = """
+[flask]
+debug = false
+
+[netify_views]
+enabled = hello_world,raw_file
+
+[routes]
+hello_world=/
+
+[hello_world]
+debug = true
+flash_messages = no
+
+[raw_file]
+path = /tmp/netify
+suffix_whitelist = txt,rst
+"""
+
+
+def make_config(text=TEST_CONFIG):
+    """Build a Config object from a config file string."""
+    return config.Config(StringIO(text))
+
+
+class TestConfigSnapshot(BasicTest):
+    """Verify the precompiled config snapshot."""
+
+    def test_page_options_coerced(self):
+        """Check that section values are coerced once at compile time."""
+        options = make_config().get_page_options('hello_world')
+        self.assertIs(options['debug'], True)
+        self.assertIs(options['flash_messages'], False)
+
+    def test_page_options_read_only(self):
+        """Verify that views cannot modify the shared page options."""
+        options = make_config().get_page_options('raw_file')
+        with self.assertRaises(TypeError):
+            options['path'] = '/'
+
+    def test_missing_section(self):
+        """A missing section is presented as an empty mapping."""
+        self.assertEqual(dict(make_config().get_page_options('nope')), {})
+
+    def test_page_options_skip_parser(self):
+        """Verify reading options does not touch the config parser."""
+        conf = make_config()
+        conf.compile()
+        conf.parser = None
+        self.assertEqual(conf.get_page_options('raw_file')['path'],
+                         '/tmp/netify')
+        self.assertEqual(conf.routes['hello_world'], '/')
+
+    def test_generation(self):
+        """Each compiled snapshot gets a new, larger generation number."""
+        conf = make_config()
+        first = conf.generation
+        conf.compile()
+        self.assertGreater(conf.generation, first)
+
+    def test_to_string_dict(self):
+        """The string dict holds values exactly as written in the file."""
+        strings = make_config().to_string_dict()
+        self.assertEqual(strings['hello_world']['flash_messages'], 'no')
+
+
+RAW_FILE_SCHEMA = {
+    'path': config.Option(config.to_path, None),
+    'suffix_whitelist': config.Option(config.to_list, ()),
+    'max_size': config.Option(config.to_byte_size, 1024),
+}
+
+
+class TestConfigSchema(BasicTest):
+    """Verify option schemas are applied when the config is compiled."""
+
+    def test_converted(self):
+        """Declared options are converted to their declared type."""
+        conf = make_config()
+        conf.register_schema('raw_file', RAW_FILE_SCHEMA)
+        options = conf.get_page_options('raw_file')
+        self.assertEqual(options['suffix_whitelist'], ('txt', 'rst'))
+        self.assertEqual(options['max_size'], 1024)
+
+    def test_missing_section_defaults(self):
+        """A declared section missing from the file gets its defaults."""
+        conf = make_config()
+        conf.register_schema('other', RAW_FILE_SCHEMA)
+        self.assertIsNone(conf.get_page_options('other')['path'])
+
+    def test_invalid_value(self):
+        """Invalid values are reported with the section and option name."""
+        conf = make_config(TEST_CONFIG + 'max_size = lots\n')
+        conf.register_schema('raw_file', RAW_FILE_SCHEMA)
+        with self.assertRaisesRegex(config.ConfigError,
+                                    r'max_size.*\[raw_file\]'):
+            conf.compile()
+
+    def test_converters(self):
+        """Check the conversions of the option types."""
+        self.assertIs(config.to_bool(' Yes'), True)
+        self.assertRaises(ValueError, config.to_bool, 'maybe')
+        self.assertEqual(config.to_int(' 42 '), 42)
+        self.assertEqual(config.to_list('a, b,,c'), ('a', 'b', 'c'))
+        self.assertEqual(config.to_byte_size('64k'), 64 * 1024)
+        self.assertEqual(config.to_byte_size('1.5MB'), 3 * 512 * 1024)
+        self.assertEqual(config.to_duration('250ms'), 0.25)
+        self.assertEqual(config.to_duration('5m'), 300)
+        self.assertRaises(ValueError, config.to_duration, 'soon')
+        self.assertRaises(ValueError, config.to_path, ' ')
+
+
+class TestConfigCache(BasicTest):
+    """Verify the compiled config cache written next to the config file."""
+
+    def setUp(self):
+        """Write a config file in a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'netify.cfg')
+        with open(self.path, 'w') as fout:
+            fout.write(TEST_CONFIG)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        """A fresh cache is loaded without parsing the config file."""
+        self.assertTrue(config.Config(self.path).write_cache())
+        cached = config.Config.from_cache(self.path)
+        self.assertIsNone(cached.parser)
+        self.assertEqual(cached.to_string_dict(),
+                         config.Config(self.path).to_string_dict())
+        self.assertEqual(cached.get('raw_file', 'path'), '/tmp/netify')
+
+    def test_stale(self):
+        """The cache is ignored once the config file changes."""
+        config.Config(self.path).write_cache()
+        with open(self.path, 'a') as fout:
+            fout.write('extra = option\n')
+        self.assertIsNone(config.Config.from_cache(self.path))
+        self.assertIsNotNone(config.Config.load_config(self.path).parser)
+
+    def test_missing(self):
+        """Without a cache the config file is parsed."""
+        self.assertIsNone(config.Config.from_cache(self.path))
+        self.assertFalse(config.Config(StringIO(TEST_CONFIG)).write_cache())
+
+
+class TestSecretKeys(BasicTest):
+    """Verify how the shared secret keys are found and rotated."""
+
+    def setUp(self):
+        """Make a temporary directory for the key file."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.key_file = os.path.join(self.tmp_dir.name, 'keys', 'secret_key')
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_generated_once(self):
+        """A missing key file is generated and then reused."""
+        keys = config.load_secret_key_file(self.key_file)
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(config.load_secret_key_file(self.key_file), keys)
+        self.assertEqual(os.stat(self.key_file).st_mode & 0o777, 0o600)
+
+    def test_rotate(self):
+        """Rotation adds a new signing key and keeps the old ones."""
+        first = config.load_secret_key_file(self.key_file)
+        second = config.rotate_secret_key_file(self.key_file)
+        third = config.rotate_secret_key_file(self.key_file, keep=1)
+        self.assertEqual(second[1:], first)
+        self.assertEqual(third, (third[0], second[0]))
+        self.assertEqual(config.read_secret_key_file(self.key_file), third)
+
+    def test_default_key_file(self):
+        """Without other settings the default key file is used."""
+        with patch.dict(os.environ, clear=True):
+            keys = make_config().get_secret_keys(self.key_file)
+        self.assertEqual(keys, config.read_secret_key_file(self.key_file))
+
+    def test_precedence(self):
+        """The environment beats the config file which beats the key file."""
+        conf = make_config(TEST_CONFIG.replace(
+            '[flask]', '[flask]\nsecret_key = from-config'))
+        with patch.dict(os.environ, {'NETIFY_SECRET_KEY': 'new, old'}):
+            self.assertEqual(conf.get_secret_keys(self.key_file),
+                             ('new', 'old'))
+        with patch.dict(os.environ, clear=True):
+            self.assertEqual(conf.get_secret_keys(self.key_file),
+                             ('from-config',))
+        self.assertFalse(os.path.exists(self.key_file))
+
+    def test_key_file_in_flask_config(self):
+        """Only keys read from a key file set the SECRET_KEY_FILE option."""
+        flask_app = Mock(instance_path=self.tmp_dir.name, config={})
+        conf = make_config(TEST_CONFIG.replace(
+            '[flask]', '[flask]\nsecret_key = from-config'))
+        with patch.dict(os.environ, clear=True):
+            conf.update_flask(flask_app)
+            self.assertIsNone(flask_app.config['SECRET_KEY_FILE'])
+            make_config().update_flask(flask_app)
+        self.assertEqual(flask_app.config['SECRET_KEY_FILE'],
+                         os.path.join(self.tmp_dir.name, 'secret_key'))
+
+
+class TestConfigWatcher(BasicTest):
+    """Verify that config files are reloaded when they change."""
+
+    def setUp(self):
+        """Write a config file and point a watcher at it."""
+        fd, self.path = tempfile.mkstemp(suffix='.cfg')
+        with os.fdopen(fd, 'w') as fout:
+            fout.write(TEST_CONFIG)
+        self.netify_app = Mock()
+        self.netify_app.config = config.Config(self.path)
+        self.watcher = config.ConfigWatcher(self.netify_app)
+
+    def tearDown(self):
+        """Remove the config file."""
+        os.remove(self.path)
+
+    def _rewrite(self, text):
+        """Replace the config file contents and bump its mtime."""
+        stat = os.stat(self.path)
+        with open(self.path, 'w') as fout:
+            fout.write(text)
+        os.utime(self.path, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + 10 ** 9))
+
+    def test_unchanged(self):
+        """Nothing is reloaded while the file is unchanged."""
+        self.assertFalse(self.watcher.check())
+        self.assertFalse(self.netify_app.configure.called)
+
+    def test_reload(self):
+        """A changed file is compiled and handed to the app."""
+        old_generation = self.netify_app.config.generation
+        self._rewrite(TEST_CONFIG.replace('/tmp/netify', '/srv/netify'))
+        self.assertTrue(self.watcher.check())
+        new_config = self.netify_app.configure.call_args[0][0]
+        self.assertGreater(new_config.generation, old_generation)
+        self.assertEqual(new_config.get_page_options('raw_file')['path'],
+                         '/srv/netify')
+
+    def test_broken_file(self):
+        """A config file that fails to parse is not swapped in."""
+        self._rewrite('not an ini file')
+        with self.assertRaises(Exception):
+            self.watcher.check()
+        self.assertFalse(self.netify_app.configure.called)
+
+
+if __name__ == "__main__":
+    main()
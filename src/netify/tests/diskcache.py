@@ -0,0 +1,101 @@
+"""Tests for the netify diskcache module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+
+from netify.tests.base import BasicTest
+import netify.diskcache as diskcache
+
+
+class DiskCacheTest(BasicTest):
+    """Verify the cache of text shared through a directory."""
+
+    def setUp(self):
+        """Create an empty cache directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.directory = os.path.join(self.tmp_dir.name, 'cache')
+
+    def entries(self):
+        """Return the names of the files in the cache directory."""
+        return sorted(name for _, _, names in os.walk(self.directory)
+                      for name in names)
+
+    def test_get_put(self):
+        """Entries are shared by every cache of the same directory."""
+        cache = diskcache.DiskCache(self.directory, 1024)
+        self.assertIsNone(cache.get(('a', 1)))
+        self.assertTrue(cache.put(('a', 1), '<pre>été</pre>'))
+        self.assertTrue(cache.put(('b', 1), ''))
+        other = diskcache.DiskCache(self.directory, 1024)
+        self.assertEqual(other.get(('a', 1)), '<pre>été</pre>')
+        self.assertEqual(other.get(('b', 1)), '')
+        self.assertIsNone(other.get(('a', 2)))
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(other.stats()['hits'], 2)
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_replace(self):
+        """Writing an entry again replaces it and leaves no temp files."""
+        cache = diskcache.DiskCache(self.directory, 1024)
+        cache.put('key', 'old')
+        cache.put('key', 'new')
+        self.assertEqual(cache.get('key'), 'new')
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_too_big(self):
+        """Text bigger than the budget is not cached."""
+        cache = diskcache.DiskCache(self.directory, 10)
+        self.assertFalse(cache.put('key', 'x' * 11))
+        self.assertIsNone(cache.get('key'))
+
+    def test_evict(self):
+        """The least recently used entries are removed to fit the budget."""
+        cache = diskcache.DiskCache(self.directory, 100)
+        for num in range(3):
+            cache.put(num, 'x' * 30)
+            os.utime(cache._get_path(num), (num, num))
+        self.assertEqual(cache.evict(), 0)
+        cache.put(3, 'x' * 30)
+        self.assertIsNone(cache.get(0))
+        for num in range(1, 4):
+            self.assertIsNotNone(cache.get(num))
+        # The hits above refreshed the old entries, leaving 3 the oldest.
+        os.utime(cache._get_path(3), (3, 3))
+        cache.put(4, 'x' * 30)
+        self.assertIsNone(cache.get(3))
+        self.assertIsNotNone(cache.get(1))
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertEqual(cache.stats()['size'], 90)
+
+    def test_stale_temp_files(self):
+        """Temporary files left by a dead writer are removed by a scan."""
+        cache = diskcache.DiskCache(self.directory, 100)
+        cache.put('key', 'text')
+        temp_path = os.path.join(os.path.dirname(cache._get_path('key')),
+                                 '.tmp-dead')
+        open(temp_path, 'w').close()
+        cache.evict()
+        self.assertTrue(os.path.exists(temp_path))
+        os.utime(temp_path, (0, 0))
+        cache.evict()
+        self.assertFalse(os.path.exists(temp_path))
+        self.assertEqual(cache.get('key'), 'text')
+
+    def test_get_disk_cache(self):
+        """The cache of a directory is shared and takes the latest budget."""
+        cache = diskcache.get_disk_cache(self.directory, 100)
+        self.assertIs(diskcache.get_disk_cache(self.directory, 200), cache)
+        self.assertEqual(cache.max_bytes, 200)
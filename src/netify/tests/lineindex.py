@@ -0,0 +1,100 @@
+"""Tests for the netify lineindex module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+
+from netify.tests.base import BasicTest
+import netify.lineindex as lineindex
+
+
+LINES = [('line %d\n' % num).encode() for num in range(100)]
+
+
+class LineIndexTest(BasicTest):
+    """Verify the sparse newline index."""
+
+    def locate(self, index, data, start, count):
+        """Return the bytes of count lines from start."""
+        begin, end, _, _ = index.locate(data, (len(data), 0), start, count)
+        return data[begin:end]
+
+    def test_line_range(self):
+        """Every range matches splitting the data into lines."""
+        data = b''.join(LINES)
+        index = lineindex.LineIndex(block_size=16)
+        self.assertEqual(index.locate(data, (len(data), 0), 0, 0)[3], 100)
+        for start in (0, 1, 15, 50, 99, 100, 150):
+            for count in (0, 1, 7, 200):
+                self.assertEqual(self.locate(index, data, start, count),
+                                 b''.join(LINES[start:start + count]))
+
+    def test_negative_start(self):
+        """A negative start counts back from the end."""
+        data = b''.join(LINES)
+        index = lineindex.LineIndex(block_size=16)
+        begin, end, start, _ = index.locate(data, (len(data), 0), -3, 10)
+        self.assertEqual(start, 97)
+        self.assertEqual(data[begin:end], b''.join(LINES[-3:]))
+        self.assertEqual(index.locate(data, (len(data), 0), -500, 1)[2], 0)
+
+    def test_unterminated(self):
+        """A last line without a newline is still a line."""
+        index = lineindex.LineIndex(block_size=4)
+        data = b'a\nbb\nccc'
+        self.assertEqual(index.locate(data, (8, 0), 2, 5)[3], 3)
+        self.assertEqual(self.locate(index, data, 2, 5), b'ccc')
+        self.assertEqual(index.locate(b'', (0, 0), 0, 5)[:2], (0, 0))
+
+    def test_growth(self):
+        """Appended data extends the index from its last block."""
+        data = b''.join(LINES[:50])
+        index = lineindex.LineIndex(block_size=16)
+        index.locate(data, (len(data), 0), 0, 1)
+        counts = index.counts.tolist()
+        data += b''.join(LINES[50:])
+        self.assertEqual(self.locate(index, data, 60, 2),
+                         b''.join(LINES[60:62]))
+        self.assertEqual(index.counts.tolist()[:len(counts)], counts)
+        self.assertEqual(index.lines, 100)
+
+    def test_rewrite(self):
+        """A truncated or rewritten file is indexed from the start."""
+        data = b''.join(LINES)
+        index = lineindex.LineIndex(block_size=16)
+        index.locate(data, (len(data), 0), 0, 1)
+        data = data.replace(b'line', b'\n\n\n\n')[:200]
+        self.assertEqual(self.locate(index, data, 4, 5), b' 0\n' + b'\n' * 4)
+        self.assertEqual(index.newlines, data.count(b'\n'))
+        data = data[:100] + b'x' * 300
+        self.assertEqual(index.locate(data, (len(data), 1), 0, 1)[3],
+                         data.count(b'\n') + 1)
+
+    def test_find_lines(self):
+        """Indexes of files are cached and follow changes to the file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'file.log')
+            with open(path, 'wb') as fout:
+                fout.write(b''.join(LINES[:10]))
+            begin, end, start, lines = lineindex.find_lines(
+                path, os.stat(path), -2, 2)
+            self.assertEqual((start, lines), (8, 10))
+            with open(path, 'ab') as fout:
+                fout.write(b''.join(LINES[10:]))
+            begin, end, start, lines = lineindex.find_lines(
+                path, os.stat(path), -2, 2)
+            self.assertEqual((start, lines), (98, 100))
+            with open(path, 'rb') as fin:
+                self.assertEqual(fin.read()[begin:end],
+                                 b''.join(LINES[98:]))
@@ -0,0 +1,215 @@
+"""Tests for the netify metrics module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import tempfile
+
+from flask import Flask
+
+from netify.tests.base import BasicTest
+import netify.metrics as metrics
+
+
+def histogram(*counts):
+    """Return a latency histogram value with counts for the first buckets.
+
+    The sum of the values is 1.0.
+    """
+    value = [0] * (len(metrics.LATENCY_BUCKETS) + 2)
+    value[:len(counts)] = counts
+    value[-1] = 1.0
+    return value
+
+
+class FormatTest(BasicTest):
+    """Verify the Prometheus text format."""
+
+    def test_counter(self):
+        """Counters are written with their help and escaped labels."""
+        labels = metrics.format_labels(('view', 'status'), ('a"\\\n', 200))
+        self.assertEqual(labels, 'view="a\\"\\\\\\n",status="200"')
+        text = metrics.format_text({'netify_requests_total': {labels: 3}})
+        self.assertEqual(text.splitlines(), [
+            '# HELP netify_requests_total Requests handled, by view and '
+            'status code.',
+            '# TYPE netify_requests_total counter',
+            'netify_requests_total{%s} 3' % labels])
+
+    def test_histogram(self):
+        """Histogram buckets are cumulative and end with "+Inf"."""
+        text = metrics.format_text({'netify_phase_duration_seconds': {
+            'phase="build"': histogram(1, 0, 2)}})
+        lines = text.splitlines()
+        self.assertIn('netify_phase_duration_seconds_bucket{phase="build",'
+                      'le="0.0005"} 1', lines)
+        self.assertIn('netify_phase_duration_seconds_bucket{phase="build",'
+                      'le="0.0025"} 3', lines)
+        self.assertIn('netify_phase_duration_seconds_bucket{phase="build",'
+                      'le="+Inf"} 3', lines)
+        self.assertEqual(lines[-2:], [
+            'netify_phase_duration_seconds_sum{phase="build"} 1.0',
+            'netify_phase_duration_seconds_count{phase="build"} 3'])
+
+    def test_merge(self):
+        """Samples are summed, dropping the gauges of exited processes."""
+        merged = {}
+        samples = {'netify_cache_hits_total': {'cache="a"': 2},
+                   'netify_cache_entries': {'cache="a"': 5},
+                   'netify_phase_duration_seconds': {'': histogram(1)},
+                   'netify_unknown': {'': 1}}
+        metrics.merge_samples(merged, samples)
+        metrics.merge_samples(merged, samples, with_gauges=False)
+        metrics.merge_samples(merged, {'netify_phase_duration_seconds': {
+            '': [1, 1]}})
+        expected = histogram(2)
+        expected[-1] = 2.0
+        self.assertEqual(merged, {
+            'netify_cache_hits_total': {'cache="a"': 4},
+            'netify_cache_entries': {'cache="a"': 5},
+            'netify_phase_duration_seconds': {'': expected}})
+
+
+class MetricsRegistryTest(BasicTest):
+    """Verify the samples recorded and merged across processes."""
+
+    def setUp(self):
+        """Create an enabled registry saving to a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.directory = os.path.join(self.tmp_dir.name, 'metrics')
+        self.registry = metrics.MetricsRegistry()
+        self.registry.enable(self.directory, flush_interval=60)
+        self.addCleanup(self.registry.disable)
+
+    def saved(self):
+        """Return the names of the files of samples saved so far."""
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory)
+                if name.endswith('.json') and not name.startswith('.')]
+
+    def test_observe(self):
+        """Values fall in the first bucket whose bound they don't exceed."""
+        self.registry.observe('netify_request_duration_seconds', ('a',),
+                              0.001)
+        self.registry.observe('netify_request_duration_seconds', ('a',), 20)
+        self.registry.inc('netify_requests_total', ('a', '200'))
+        snapshot = self.registry.snapshot()
+        value = snapshot['netify_request_duration_seconds']['view="a"']
+        self.assertEqual(value[1], 1)
+        self.assertEqual(value[-2], 1)
+        self.assertEqual(sum(value[:-1]), 2)
+        self.assertEqual(value[-1], 20.001)
+        self.assertEqual(snapshot['netify_requests_total'],
+                         {'view="a",status="200"': 1})
+
+    def test_collect(self):
+        """The samples of every worker are merged into the totals.
+
+        A forked worker starts from empty samples and the file of a worker
+        that has exited is folded into the archive, keeping its counters.
+        """
+        self.registry.inc('netify_requests_total', ('a', '200'))
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self.registry.inc('netify_requests_total', ('a', '200'), 5)
+                self.registry.flush()
+                status = 0
+            finally:
+                os._exit(status)  # pylint: disable=protected-access
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.registry.inc('netify_requests_total', ('a', '200'))
+        for _ in range(2):
+            samples = self.registry.collect()
+            self.assertEqual(samples['netify_requests_total'],
+                             {'view="a",status="200"': 7})
+            self.assertEqual(samples['netify_cache_entries'],
+                             self.registry.snapshot()['netify_cache_entries'])
+        names = set(name for name in os.listdir(self.directory)
+                    if not name.startswith('.'))
+        self.assertIn(metrics.ARCHIVE_FILE, names)
+        names.remove(metrics.ARCHIVE_FILE)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().startswith('%d-' % os.getpid()))
+        archive_path = os.path.join(self.directory, metrics.ARCHIVE_FILE)
+        with open(archive_path) as fin:
+            archive = json.load(fin)
+        self.assertNotIn('netify_cache_entries', archive)
+
+    def test_flush_thread(self):
+        """Samples are saved in the background until disable is called."""
+        self.registry.enable(self.directory, flush_interval=0.01)
+        before = set(metrics.threading.enumerate())
+        self.registry.inc('netify_requests_total', ('a', '200'))
+        threads = [thread for thread in metrics.threading.enumerate()
+                   if thread.name == 'netify-metrics' and
+                   thread not in before]
+        self.assertEqual(len(threads), 1)
+        for _ in range(500):
+            if self.saved():
+                break
+            threads[0].join(0.01)
+        self.assertEqual(len(self.saved()), 1)
+        self.registry.disable()
+        threads[0].join(5)
+        self.assertFalse(threads[0].is_alive())
+
+
+class HooksTest(BasicTest):
+    """Verify the hooks recording the phases and requests of an app."""
+
+    def setUp(self):
+        """Create a Flask app with the request hooks and a timed view."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.addCleanup(metrics.REGISTRY.disable)
+        self.flask_app = Flask(__name__)
+        hooks = metrics.RequestMetrics()
+        self.flask_app.before_request(hooks.before_request)
+        self.flask_app.after_request(hooks.after_request)
+
+        @metrics.timed('build')
+        def build():
+            """Return a page."""
+            return 'page'
+        self.flask_app.add_url_rule('/page', 'page', build)
+        self.client = self.flask_app.test_client()
+
+    def test_disabled(self):
+        """Nothing is recorded while the registry is disabled."""
+        self.assertEqual(self.client.get('/page').data, b'page')
+        samples = metrics.REGISTRY.snapshot()
+        self.assertNotIn('netify_requests_total', samples)
+        self.assertNotIn('netify_phase_duration_seconds', samples)
+
+    def test_enabled(self):
+        """Requests, their sizes and their phases are recorded."""
+        metrics.REGISTRY.enable(self.tmp_dir.name, flush_interval=60)
+        self.client.get('/page')
+        self.client.get('/missing')
+        samples = metrics.REGISTRY.snapshot()
+        self.assertEqual(samples['netify_requests_total'], {
+            'view="page",status="200"': 1, 'view="",status="404"': 1})
+        self.assertEqual(
+            sum(samples['netify_response_size_bytes']['view="page"'][:-1]),
+            1)
+        self.assertEqual(samples['netify_response_size_bytes'][
+            'view="page"'][-1], 4)
+        self.assertEqual(sum(samples['netify_phase_duration_seconds'][
+            'view="page",phase="build"'][:-1]), 1)
+        self.assertEqual(sum(samples['netify_request_duration_seconds'][
+            'view=""'][:-1]), 1)
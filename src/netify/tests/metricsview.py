@@ -0,0 +1,62 @@
+"""Tests for the netify metricsview module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+from unittest.mock import Mock
+import os
+import tempfile
+
+from flask import Flask
+
+from netify.metrics import REGISTRY
+from netify.tests.base import BasicTest
+import netify.metricsview as metricsview
+
+
+class MetricsViewTest(BasicTest):
+    """Verify the Metrics view."""
+
+    def setUp(self):
+        """Register the Metrics view with a Flask app."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.flask_app = Flask(__name__, instance_path=self.tmp_dir.name)
+        netify_app = Mock(flask_app=self.flask_app, url_map_version=0)
+        netify_app.config.get_page_options.return_value = {
+            'directory': None, 'flush_interval': 60}
+        for patcher in (patch.object(metricsview.Metrics, 'netify_app'),
+                        patch('flask_classy.FlaskView.register')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(REGISTRY.disable)
+        metricsview.Metrics.register(netify_app)
+        self.metrics = metricsview.Metrics()
+        self.flask_app.add_url_rule('/metrics/', 'Metrics:index',
+                                    self.metrics.index)
+        self.client = self.flask_app.test_client()
+
+    def test_register(self):
+        """Registering the view starts recording in the instance path."""
+        self.assertTrue(REGISTRY.enabled)
+        self.assertEqual(REGISTRY.directory,
+                         os.path.join(self.tmp_dir.name, 'metrics'))
+
+    def test_index(self):
+        """The metrics are served in the Prometheus text format."""
+        REGISTRY.inc('netify_requests_total', ('Metrics:index', '200'))
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.headers['Content-Type'],
+                         metricsview.CONTENT_TYPE)
+        self.assertIn('\nnetify_requests_total{view="Metrics:index",'
+                      'status="200"} 1\n', response.data.decode())
@@ -0,0 +1,74 @@
+"""Tests for the netify minify module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from flask import Markup
+
+from netify.tests.base import BasicTest
+import netify.minify as minify
+
+
+PAGE = ('<!DOCTYPE html/><html lang="en"><head><meta charset="utf-8" />'
+        '<link href="/static/fret.css" rel="stylesheet"></link></head>'
+        '<body>\n  <h1 class="a b">File:   x</h1><br />\n'
+        '<ul><li><a href="/raw_file/a.txt">a.txt</a></li>\n'
+        '<li><a href="/raw_file/b c">b c</a></li></ul>'
+        '<div class="files"><pre>  keep\n\n  this  &lt;/li&gt; </li>\n'
+        '</pre></div>  \n</body></html>')
+
+MINIFIED = ('<!DOCTYPE html/><html lang=en><head><meta charset=utf-8>'
+            '<link href=/static/fret.css rel=stylesheet></head>'
+            '<body> <h1 class="a b">File: x</h1><br> '
+            '<ul><li><a href=/raw_file/a.txt>a.txt</a> '
+            '<li><a href="/raw_file/b c">b c</a></ul>'
+            '<div class=files><pre>  keep\n\n  this  &lt;/li&gt; </li>\n'
+            '</pre></div> </body></html>')
+
+
+class MinifyTest(BasicTest):
+    """Verify the HTML minifier."""
+
+    def test_minify(self):
+        """Whitespace, end tags, slashes and quotes are removed."""
+        self.assertEqual(''.join(minify.minify_chunks([PAGE])), MINIFIED)
+
+    def test_chunk_boundaries(self):
+        """The output does not depend on where the chunks are split."""
+        for size in range(1, 40):
+            chunks = [PAGE[index:index + size]
+                      for index in range(0, len(PAGE), size)]
+            self.assertEqual(''.join(minify.minify_chunks(chunks)), MINIFIED,
+                             'chunk size %d' % size)
+
+    def test_markup_chunks(self):
+        """Markup chunks don't escape the text held back before them."""
+        chunks = [Markup('<p>a</p><li'), Markup('>b')]
+        self.assertEqual(''.join(minify.minify_chunks(chunks)),
+                         '<p>a</p><li>b')
+
+    def test_pre_exact(self):
+        """Preserved elements are passed through byte for byte."""
+        body = '<pre>\n  a  \n\t</li></pre ><textarea> x  </textarea>'
+        self.assertEqual(''.join(minify.minify_chunks(['<p>  ', body])),
+                         '<p> ' + body)
+
+    def test_unclosed_pre(self):
+        """A document ending inside a pre element is not minified."""
+        self.assertEqual(''.join(minify.minify_chunks(['<pre>a  ', 'b  '])),
+                         '<pre>a  b  ')
+
+    def test_attributes_kept(self):
+        """Attribute values that need quotes keep them."""
+        for tag in ('<a title="a b">', '<a href="x=y">', "<a t='x'>"):
+            self.assertEqual(minify.minify_html(tag), tag)
+        self.assertEqual(minify.minify_html('<img src="x"/>'), '<img src=x>')
@@ -0,0 +1,382 @@
+"""Tests for the netify rawfile module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+from unittest.mock import Mock
+import os
+import tempfile
+
+from flask import Flask
+from flask import flash
+from flask import request
+
+from netify.tests.base import BasicTest
+from netify.tests.base import NetifyTest
+import netify.rawfile as rawfile
+
+
+class RawFileValidatorTest(NetifyTest):
+    """Verify the validators RawFile derives from file metadata."""
+
+    def setUp(self):
+        """Create a file to validate and a stand in for the netify app."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'file.txt')
+        with open(self.path, 'w') as fout:
+            fout.write('contents')
+        netify_app = Mock(url_map_version=1)
+        netify_app.config.generation = 1
+        netify_app.config.get_page_options.return_value = {
+            'flash_messages': True, 'suffix_whitelist': (),
+            'listing_cache_size': 1024, 'page_size': 0,
+            'max_page_size': 10}
+        patcher = patch.object(rawfile.RawFile, 'netify_app', netify_app)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.raw_file = rawfile.RawFile()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def validators(self):
+        """Return the validators of the test file."""
+        return self.raw_file._get_validators(os.stat(self.path))
+
+    def test_etag_changes(self):
+        """The ETag changes with the file and with the config generation."""
+        etag = self.validators()[0]
+        self.assertEqual(self.validators()[0], etag)
+        with open(self.path, 'a') as fout:
+            fout.write('more')
+        changed = self.validators()[0]
+        self.assertNotEqual(changed, etag)
+        self.raw_file.netify_app.config.generation = 2
+        self.assertNotEqual(self.validators()[0], changed)
+
+    def test_is_modified(self):
+        """Requests with matching validators are not modified."""
+        etag, last_modified = self.validators()
+        self.assertTrue(self.raw_file._is_modified(etag, last_modified))
+        headers = {'If-None-Match': '"%s"' % etag}
+        with self.app.test_request_context(headers=headers):
+            self.assertFalse(self.raw_file._is_modified(etag, last_modified))
+        headers = {'If-Modified-Since': last_modified.strftime(
+            '%a, %d %b %Y %H:%M:%S GMT')}
+        with self.app.test_request_context(headers=headers):
+            self.assertFalse(self.raw_file._is_modified(etag, last_modified))
+
+    def test_pending_flashes(self):
+        """Pages showing flashed messages are sent without validators.
+
+        Otherwise revalidating the page with the ETag of the page that
+        showed the messages would keep the stale messages in the cache.
+        """
+        options = dict((key, option.default) for key, option in
+                       rawfile.RawFile.option_schema.items())
+        options.update(path=self.tmp_dir.name, flash_messages=True)
+        self.raw_file.netify_app.config.get_page_options.return_value = (
+            options)
+        flask_app = Flask(__name__)
+        flask_app.secret_key = 'test'
+        flask_app.add_url_rule('/raw_file/<name>', 'RawFile:get',
+                               self.raw_file.get)
+        flask_app.add_url_rule('/raw_file/', 'RawFile:index',
+                               self.raw_file.index)
+        flask_app.add_url_rule('/download/<name>', 'RawFile:download',
+                               self.raw_file.download)
+
+        @flask_app.route('/flash')
+        def flash_message():
+            """Flash a message for the next page."""
+            flash('Flashed message')
+            return ''
+        client = flask_app.test_client()
+        client.get('/flash')
+        response = client.get('/raw_file/file.txt')
+        self.assertIn(b'Flashed message', response.data)
+        self.assertNotIn('ETag', response.headers)
+        self.assertNotIn('Last-Modified', response.headers)
+        response = client.get('/raw_file/file.txt')
+        self.assertNotIn(b'Flashed message', response.data)
+        etag = response.headers['ETag']
+        response = client.get('/raw_file/file.txt',
+                              headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        client.get('/flash')
+        response = client.get('/raw_file/file.txt',
+                              headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Flashed message', response.data)
+
+    def test_listing_cached(self):
+        """Listings are rebuilt only when the directory changes."""
+        with patch.object(rawfile.RawFile, '_build_dir_listing',
+                          return_value='<ul></ul>') as mock_build:
+            for _ in range(2):
+                self.assertEqual(
+                    self.raw_file._get_dir_listing(self.tmp_dir.name),
+                    '<ul></ul>')
+            self.assertEqual(mock_build.call_count, 1)
+            with open(self.path + '.new', 'w'):
+                pass
+            self.raw_file._get_dir_listing(self.tmp_dir.name)
+            self.assertEqual(mock_build.call_count, 2)
+        self.assertEqual(rawfile.LISTING_CACHE.max_bytes +
+                         rawfile.DIR_INDEX_CACHE.max_bytes, 1024)
+
+    def test_scan_dir(self):
+        """Hidden and filtered entries are skipped, directories kept."""
+        for name in ('b.txt', '.hidden.txt', 'c.py'):
+            open(os.path.join(self.tmp_dir.name, name), 'w').close()
+        os.mkdir(os.path.join(self.tmp_dir.name, 'sub'))
+        self.raw_file.netify_app.config.get_page_options.return_value[
+            'suffix_whitelist'] = ('.txt',)
+        self.assertEqual(self.raw_file._scan_dir(self.tmp_dir.name),
+                         ['b.txt', 'file.txt', 'sub/'])
+
+
+class RawFilePaginationTest(BasicTest):
+    """Verify the pages of a RawFile directory listing."""
+
+    names = tuple('%02d.txt' % num for num in range(10))
+
+    def setUp(self):
+        """Create a Flask app with the RawFile routes."""
+        self.flask_app = Flask(__name__)
+        self.flask_app.add_url_rule('/raw_file/', 'RawFile:index')
+        self.flask_app.add_url_rule('/raw_file/<name>', 'RawFile:get')
+        netify_app = Mock()
+        netify_app.config.get_page_options.return_value = {
+            'path': None, 'page_size': 4, 'max_page_size': 5}
+        patcher = patch.object(rawfile.RawFile, 'netify_app', netify_app)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.raw_file = rawfile.RawFile()
+
+    def listing(self, url):
+        """Return the listing page for the query string of url."""
+        with self.flask_app.test_request_context(url):
+            return self.raw_file._build_dir_listing(
+                '', self.names, request.args.get('after', ''),
+                self.raw_file._get_page_limit())
+
+    def test_first_page(self):
+        """The first page links to the next page only."""
+        html = self.listing('/raw_file/')
+        self.assertIn('Entries 1-4 of 10', html)
+        self.assertIn('03.txt</a>', html)
+        self.assertNotIn('04.txt</a>', html)
+        self.assertIn('href="/raw_file/?after=03.txt">Next Page', html)
+        self.assertNotIn('Previous Page', html)
+
+    def test_cursor(self):
+        """Pages start after the cursor and link back to the previous page."""
+        html = self.listing('/raw_file/x?after=05.txt&limit=2')
+        self.assertIn('Entries 7-8 of 10', html)
+        self.assertIn('href="/raw_file/x?after=03.txt&amp;limit=2">'
+                      'Previous Page', html)
+        self.assertIn('href="/raw_file/x?after=07.txt&amp;limit=2">'
+                      'Next Page', html)
+
+    def test_limit_bounded(self):
+        """The limit is kept within max_page_size."""
+        html = self.listing('/raw_file/?limit=50')
+        self.assertIn('Entries 1-5 of 10', html)
+        self.assertIn('href="/raw_file/?after=04.txt&amp;limit=5">'
+                      'Next Page', html)
+        html = self.listing('/raw_file/?limit=0')
+        self.assertIn('Entries 1-1 of 10', html)
+        self.assertIn('href="/raw_file/?after=00.txt&amp;limit=1">'
+                      'Next Page', html)
+        html = self.listing('/raw_file/?limit=many')
+        self.assertIn('href="/raw_file/?after=03.txt&amp;limit=4">'
+                      'Next Page', html)
+
+    def test_past_the_end(self):
+        """A cursor after the last name gives an empty page."""
+        html = self.listing('/raw_file/?after=zz&limit=3')
+        self.assertIn('No entries after the last of 10', html)
+        self.assertNotIn('Entries', html)
+        self.assertNotIn('Next Page', html)
+        self.assertIn('href="/raw_file/?limit=3">First Page', html)
+        self.assertIn('href="/raw_file/?after=06.txt&amp;limit=3">'
+                      'Previous Page', html)
+
+    def test_single_page(self):
+        """A listing that fits on one page has no page navigation."""
+        with self.flask_app.test_request_context('/raw_file/'):
+            html = self.raw_file._build_dir_listing('', self.names[:3], '', 4)
+        self.assertNotIn('Entries', html)
+
+
+class RawFileSliceTest(BasicTest):
+    """Verify the line and byte slices of files shown by RawFile."""
+
+    def setUp(self):
+        """Create a file of numbered lines and a Flask app to show it."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'file.log')
+        with open(self.path, 'w') as fout:
+            fout.writelines('line %d\n' % num for num in range(1, 101))
+        self.flask_app = Flask(__name__)
+        self.flask_app.add_url_rule('/raw_file/<name>', 'RawFile:get')
+        netify_app = Mock()
+        self.options = {
+            'line_count': 10, 'byte_count': 16, 'chunk_size': 4,
+            'stream_threshold': 1024, 'render_cache_size': 0,
+            'render_cache_min_size': 0,
+            'render_cache_dir': os.path.join(self.tmp_dir.name, 'cache')}
+        netify_app.config.get_page_options.return_value = self.options
+        patcher = patch.object(rawfile.RawFile, 'netify_app', netify_app)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.raw_file = rawfile.RawFile()
+
+    def contents(self, url):
+        """Return the file contents shown for the query string of url."""
+        with self.flask_app.test_request_context(url):
+            contents, stream = self.raw_file._get_file_contents(
+                self.path, os.stat(self.path))
+        self.assertFalse(stream)
+        return contents
+
+    def test_lines(self):
+        """Lines are counted from 1 and link to their neighbours."""
+        html = self.contents('/raw_file/file.log?start=11&count=2')
+        self.assertIn('Lines 11-12 of 100', html)
+        self.assertIn('<pre>line 11\nline 12\n</pre>', html)
+        self.assertIn('href="/raw_file/file.log?start=9&amp;count=2">'
+                      'Previous Lines', html)
+        self.assertIn('href="/raw_file/file.log?start=13&amp;count=2">'
+                      'Next Lines', html)
+
+    def test_last_lines(self):
+        """A negative start shows the end of the file."""
+        html = self.contents('/raw_file/file.log?start=-3')
+        self.assertIn('Lines 98-100 of 100', html)
+        self.assertIn('<pre>line 98\nline 99\nline 100\n</pre>', html)
+        self.assertNotIn('Next Lines', html)
+
+    def test_bytes(self):
+        """Byte slices are bounded by the file and escaped."""
+        with open(self.path, 'ab') as fout:
+            fout.write('<é>'.encode())
+        html = self.contents('/raw_file/file.log?offset=-2')
+        self.assertIn('Bytes 794-796 of 796', html)
+        self.assertIn('<pre>�&gt;</pre>', html)
+        html = self.contents('/raw_file/file.log?offset=0&length=8')
+        self.assertIn('<pre>line 1\nl</pre>', html)
+        self.assertIn('href="/raw_file/file.log?offset=8&amp;length=8">'
+                      'Next Bytes', html)
+
+    def test_whole_file(self):
+        """Without slice parameters the whole file is shown."""
+        self.assertEqual(self.contents('/raw_file/file.log').count('\n'), 100)
+
+    def test_render_cache(self):
+        """Whole files are rendered once until they change."""
+        self.options['render_cache_size'] = 1024 ** 2
+        html = self.contents('/raw_file/file.log')
+        with patch.object(rawfile.RawFile, '_get_file') as get_file:
+            self.assertEqual(self.contents('/raw_file/file.log'), html)
+            self.assertFalse(get_file.called)
+        with open(self.path, 'a') as fout:
+            fout.write('one more line\n')
+        self.assertIn('one more line', self.contents('/raw_file/file.log'))
+        self.assertEqual(sum(len(names) for _, _, names in os.walk(
+            self.options['render_cache_dir'])), 2)
+
+
+class RawFileDownloadTest(BasicTest):
+    """Verify the raw downloads of RawFile."""
+
+    def setUp(self):
+        """Create a file to download and a Flask app with the route."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'file.txt')
+        with open(self.path, 'wb') as fout:
+            fout.write(b'0123456789')
+        self.options = {'path': self.tmp_dir.name, 'chunk_size': 4,
+                        'accel_redirect': ''}
+        netify_app = Mock(url_map_version=1)
+        netify_app.config.generation = 1
+        netify_app.config.get_page_options.return_value = self.options
+        patcher = patch.object(rawfile.RawFile, 'netify_app', netify_app)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.raw_file = rawfile.RawFile()
+        flask_app = Flask(__name__)
+        flask_app.add_url_rule('/download/<name>', 'download',
+                               self.raw_file.download)
+        self.client = flask_app.test_client()
+
+    def test_download(self):
+        """The whole file is sent with its validators."""
+        response = self.client.get('/download/file.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'0123456789')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        etag = response.headers['ETag']
+        response = self.client.get('/download/file.txt',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        """Single byte ranges are sent as partial content."""
+        response = self.client.get('/download/file.txt',
+                                   headers={'Range': 'bytes=3-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'345')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 3-5/10')
+        response = self.client.get('/download/file.txt',
+                                   headers={'Range': 'bytes=20-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], 'bytes */10')
+
+    def test_if_range(self):
+        """A range is ignored if the file changed since the If-Range."""
+        response = self.client.get('/download/file.txt', headers={
+            'Range': 'bytes=-2', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        etag = self.client.get('/download/file.txt').headers['ETag']
+        response = self.client.get('/download/file.txt', headers={
+            'Range': 'bytes=-2', 'If-Range': etag})
+        self.assertEqual(response.data, b'89')
+
+    def test_accel_redirect(self):
+        """nginx is asked to send the file when accel_redirect is set."""
+        self.options['accel_redirect'] = '/internal/'
+        response = self.client.get('/download/file.txt')
+        self.assertEqual(response.headers['X-Accel-Redirect'],
+                         '/internal/file.txt')
+        self.assertEqual(response.data, b'')
+
+    def test_not_found(self):
+        """Directories, missing files and paths outside the root are 404."""
+        os.mkdir(os.path.join(self.tmp_dir.name, 'sub'))
+        for name in ('sub', 'missing', '..|file.txt', '..|..|etc|passwd'):
+            self.assertEqual(self.client.get('/download/' + name).status_code,
+                             404, name)
+
+    def test_safe_path(self):
+        """Only names inside the served directory give a path."""
+        root = self.tmp_dir.name
+        self.assertEqual(self.raw_file._get_safe_path(''), root)
+        self.assertEqual(self.raw_file._get_safe_path('a/../b'),
+                         os.path.join(root, 'b'))
+        for name in ('..', '../x', '/etc/passwd', 'a/../../x'):
+            self.assertIsNone(self.raw_file._get_safe_path(name), name)
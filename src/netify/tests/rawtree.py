@@ -0,0 +1,92 @@
+"""Tests for the netify rawtree module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+from unittest.mock import Mock
+import os
+import tempfile
+
+from flask import Flask
+
+from netify.tests.base import BasicTest
+import netify.rawtree as rawtree
+
+
+class RawTreeTest(BasicTest):
+    """Verify the formats of the RawTree view."""
+
+    def setUp(self):
+        """Create a small tree and a Flask app with the RawTree routes."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        os.mkdir(os.path.join(self.tmp_dir.name, 'sub'))
+        for name in ('a b.txt', 'sub/c.txt'):
+            with open(os.path.join(self.tmp_dir.name, name), 'w') as fout:
+                fout.write('text')
+        self.flask_app = Flask(__name__)
+        netify_app = Mock(flask_app=self.flask_app)
+        self.options = {
+            'raw_tree': {
+                'path': self.tmp_dir.name, 'suffix_whitelist': ('.txt',),
+                'max_depth': 4, 'max_entries': 10, 'workers': 2,
+                'flash_messages': False, 'minify': False},
+            'raw_file': {'path': self.tmp_dir.name}}
+        netify_app.config.get_page_options.side_effect = self.options.get
+        patcher = patch.object(rawtree.RawTree, 'netify_app', netify_app)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        raw_tree = rawtree.RawTree()
+        self.flask_app.add_url_rule('/raw_tree/', 'RawTree:index',
+                                    raw_tree.index)
+        self.flask_app.add_url_rule('/raw_tree/<name>', 'RawTree:get',
+                                    raw_tree.get)
+        self.flask_app.add_url_rule('/raw_file/<name>', 'RawFile:get',
+                                    lambda name: name)
+        self.client = self.flask_app.test_client()
+
+    def test_html(self):
+        """Every directory is listed with links to the RawFile view."""
+        html = self.client.get('/raw_tree/').data.decode()
+        self.assertIn('<a href="/raw_file/a%20b.txt">a b.txt</a>', html)
+        self.assertIn('<a href="/raw_file/sub%7Cc.txt">sub/c.txt</a>', html)
+
+    def test_text(self):
+        """The text format has a line per entry."""
+        response = self.client.get('/raw_tree/?format=text&limit=2')
+        self.assertEqual(response.mimetype, 'text/plain')
+        lines = response.data.decode().splitlines()
+        self.assertEqual([line.split('\t')[:2] for line in lines[:2]],
+                         [['a%20b.txt', '4'], ['sub/', '0']])
+        self.assertEqual(lines[2:], ['#truncated'])
+
+    def test_sitemap(self):
+        """The sitemap lists the files of a subtree by absolute URL."""
+        xml = self.client.get('/raw_tree/sub?format=sitemap').data.decode()
+        self.assertIn('<loc>http://localhost/raw_file/sub%7Cc.txt</loc>', xml)
+        self.assertNotIn('a%20b.txt', xml)
+
+    def test_other_raw_file_path(self):
+        """Names aren't linked to a RawFile view serving another directory."""
+        self.options['raw_file']['path'] = os.path.join(self.tmp_dir.name,
+                                                        'sub')
+        html = self.client.get('/raw_tree/').data.decode()
+        self.assertIn('<li>a b.txt</li>', html)
+        self.assertNotIn('/raw_file/', html)
+        self.assertEqual(
+            self.client.get('/raw_tree/?format=sitemap').status_code, 404)
+
+    def test_not_found(self):
+        """Only directories inside the served directory are listed."""
+        for url in ('/raw_tree/a%20b.txt', '/raw_tree/..|..'):
+            self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,152 @@
+"""Tests for the netify search module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+import fcntl
+import os
+import tempfile
+
+from netify.tests.base import BasicTest
+import netify.search as search
+
+
+class SearchIndexTest(BasicTest):
+    """Verify the search index of a tree of files."""
+
+    def setUp(self):
+        """Create a tree of files and an index for it."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.root = os.path.join(self.tmp_dir.name, 'tree')
+        os.makedirs(os.path.join(self.root, 'sub'))
+        os.makedirs(os.path.join(self.root, '.hidden'))
+        self.write('a.txt', 'The quick brown fox')
+        self.write('sub/b.txt', 'the lazy dog\nQuick!')
+        self.write('c.py', 'quick python')
+        self.write('.hidden/d.txt', 'quick')
+        self.index = search.SearchIndex(
+            os.path.join(self.tmp_dir.name, 'index', 'index.sqlite'))
+
+    def write(self, name, text):
+        """Write text to a file of the tree, changing its size."""
+        with open(os.path.join(self.root, name), 'w') as fout:
+            fout.write(text)
+
+    def test_tokenize(self):
+        """Words are split on punctuation and lower cased."""
+        self.assertEqual(search.tokenize('Hello, hello WORLD_1 x-y!'),
+                         {'hello', 'world_1', 'x', 'y'})
+
+    def test_walk_files(self):
+        """Hidden files and files without a listed suffix are skipped."""
+        self.assertEqual(
+            sorted(name for name, _ in search.walk_files(self.root,
+                                                         ('.txt',))),
+            ['a.txt', 'sub/b.txt'])
+
+    def test_search(self):
+        """Files containing every word of the query are found."""
+        self.assertEqual(self.index.search('quick'), ([], False))
+        self.assertEqual(self.index.update(self.root, ('.txt',)),
+                         {'added': 2, 'updated': 0, 'removed': 0,
+                          'merged': 0, 'compacted': 0})
+        self.assertEqual(self.index.search('QUICK'),
+                         (['a.txt', 'sub/b.txt'], False))
+        self.assertEqual(self.index.search('quick dog'), (['sub/b.txt'],
+                                                          False))
+        self.assertEqual(self.index.search('quick cat'), ([], False))
+        self.assertEqual(self.index.search('python'), ([], False))
+        self.assertEqual(self.index.search('!!'), ([], False))
+        self.assertEqual(self.index.search('the', limit=1), (['a.txt'],
+                                                             True))
+
+    def test_limit_sorted(self):
+        """A capped result holds the first names, not the first indexed."""
+        self.index.update(self.root, ('.txt',))
+        self.write('a.txt', 'The quick red fox')
+        self.index.update(self.root, ('.txt',))
+        self.assertEqual(self.index.search('quick', limit=1), (['a.txt'],
+                                                               True))
+
+    def test_incremental(self):
+        """Only new, changed and removed files are updated."""
+        self.index.update(self.root, ('.txt',))
+        with patch.object(search.SearchIndex, '_read_words') as mock_read:
+            self.assertEqual(self.index.update(self.root, ('.txt',)),
+                             {'added': 0, 'updated': 0, 'removed': 0,
+                              'merged': 0, 'compacted': 0})
+            self.assertFalse(mock_read.called)
+        self.write('a.txt', 'a slow red fox')
+        os.remove(os.path.join(self.root, 'sub', 'b.txt'))
+        self.write('sub/e.txt', 'slow')
+        self.assertEqual(self.index.update(self.root, ('.txt',)),
+                         {'added': 1, 'updated': 1, 'removed': 1,
+                          'merged': 0, 'compacted': 1})
+        self.assertEqual(self.index.search('slow'),
+                         (['a.txt', 'sub/e.txt'], False))
+        self.assertEqual(self.index.search('quick'), ([], False))
+        self.assertEqual(self.index.search('fox'), (['a.txt'], False))
+
+    def test_merge(self):
+        """Small segments are merged without the ids of stale files."""
+        self.index.max_segments = 2
+        self.index.max_dead_ratio = 1
+        for num in range(3):
+            self.write('a.txt', 'fox %s' % ('x' * num))
+            counts = self.index.update(self.root, ('.txt',))
+        self.assertEqual(counts['merged'], 2)
+        connection = self.index._connect()
+        self.assertEqual(connection.execute(
+            'SELECT COUNT(*) FROM segments').fetchone()[0], 2)
+        self.assertEqual(len(self.index._read_postings(connection, 'fox')),
+                         2)
+        self.assertEqual(self.index.search('fox'), (['a.txt'], False))
+        self.assertEqual(self.index.search('xx'), (['a.txt'], False))
+
+    def test_compact(self):
+        """Kept segments are rewritten once enough of their files are gone."""
+        for num in range(4):
+            self.write('f%d.txt' % num, 'wolf')
+        self.index.update(self.root, ('.txt',))
+        connection = self.index._connect()
+        self.assertEqual(len(self.index._read_postings(connection, 'wolf')),
+                         4)
+        os.remove(os.path.join(self.root, 'f0.txt'))
+        self.assertEqual(self.index.update(self.root, ('.txt',))[
+            'compacted'], 0)
+        self.assertEqual(len(self.index._read_postings(connection, 'wolf')),
+                         4)
+        self.assertEqual(self.index.search('wolf')[0],
+                         ['f1.txt', 'f2.txt', 'f3.txt'])
+        os.remove(os.path.join(self.root, 'f1.txt'))
+        self.assertEqual(self.index.update(self.root, ('.txt',))[
+            'compacted'], 1)
+        self.assertEqual(len(self.index._read_postings(connection, 'wolf')),
+                         2)
+        self.assertEqual(self.index.search('wolf')[0], ['f2.txt', 'f3.txt'])
+        self.assertEqual(connection.execute(
+            'SELECT COUNT(*) FROM segments').fetchone()[0], 1)
+
+    def test_refresh(self):
+        """Background updates are rate limited and skip a locked index."""
+        self.assertTrue(self.index.refresh(self.root, ('.txt',), 60))
+        self.index._thread.join()
+        self.assertFalse(self.index.refresh(self.root, ('.txt',), 60))
+        self.assertEqual(self.index.search('lazy'), (['sub/b.txt'], False))
+        self.write('a.txt', 'lazy')
+        with open(self.index.db_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.assertTrue(self.index.refresh(self.root, ('.txt',), 0))
+            self.index._thread.join()
+        self.assertEqual(self.index.search('lazy'), (['sub/b.txt'], False))
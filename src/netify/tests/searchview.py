@@ -0,0 +1,86 @@
+"""Tests for the netify searchview module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+from unittest.mock import Mock
+import os
+import tempfile
+
+from flask import Flask
+
+from netify.search import get_index
+from netify.tests.base import BasicTest
+import netify.searchview as searchview
+
+
+class SearchViewTest(BasicTest):
+    """Verify the pages of the Search view."""
+
+    def setUp(self):
+        """Create a tree to search and a Flask app with the Search route."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.root = os.path.join(self.tmp_dir.name, 'tree')
+        os.mkdir(self.root)
+        with open(os.path.join(self.root, '<a>.txt'), 'w') as fout:
+            fout.write('needle')
+        self.flask_app = Flask(__name__)
+        netify_app = Mock(flask_app=self.flask_app)
+        self.options = {
+            'search': {
+                'path': self.root, 'suffix_whitelist': None,
+                'index_file': os.path.join(self.tmp_dir.name,
+                                           'index.sqlite'),
+                'update_interval': 60, 'max_results': 10,
+                'flash_messages': False, 'minify': False},
+            'raw_file': {'path': self.root, 'suffix_whitelist': ()}}
+        netify_app.config.get_page_options.side_effect = self.options.get
+        patcher = patch.object(searchview.Search, 'netify_app', netify_app)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.search = searchview.Search()
+        self.flask_app.add_url_rule('/search/', 'Search:index',
+                                    self.search.index)
+        self.client = self.flask_app.test_client()
+        index = get_index(self.search.index_file)
+        index.refresh(self.root, (), 60)
+        index._thread.join()
+
+    def test_results(self):
+        """Matching files are listed with their names escaped."""
+        html = self.client.get('/search/?q=needle').data.decode()
+        self.assertIn('value="needle"', html)
+        self.assertIn('Matching files: 1', html)
+        self.assertIn('<li>&lt;a&gt;.txt</li>', html)
+
+    def test_raw_file_links(self):
+        """Results link to the RawFile view when it is registered."""
+        self.flask_app.add_url_rule('/raw_file/<name>', 'RawFile:get',
+                                    lambda name: name)
+        html = self.client.get('/search/?q=needle').data.decode()
+        self.assertIn('<a href="/raw_file/%3Ca%3E.txt">&lt;a&gt;.txt</a>',
+                      html)
+
+    def test_raw_file_root(self):
+        """Only a tree served by RawFile is linked and it is the default."""
+        self.flask_app.add_url_rule('/raw_file/<name>', 'RawFile:get',
+                                    lambda name: name)
+        self.options['raw_file'] = {'path': self.tmp_dir.name,
+                                    'suffix_whitelist': ('.txt',)}
+        self.assertEqual(self.search._get_tree(), (self.root, ('.txt',),
+                                                   False))
+        self.options['search']['path'] = None
+        self.options['search']['suffix_whitelist'] = ()
+        self.assertEqual(self.search._get_tree(), (self.tmp_dir.name, (),
+                                                   True))
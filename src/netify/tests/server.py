@@ -0,0 +1,123 @@
+"""Tests for the netify server module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from urllib.request import urlopen
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from netify.tests.base import BasicTest
+import netify.server as server
+
+
+def pid_app(environ, start_response):
+    """A WSGI app answering with the pid of the process serving it."""
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+
+
+SERVER_SCRIPT = """
+import os
+from netify.server import PreforkServer
+from netify.tests.server import pid_app
+server = PreforkServer(pid_app, port=0, workers=2, threads=2,
+                       graceful_timeout=5)
+server.poll_interval = 0.05
+print(server.address[1], flush=True)
+server.serve_forever()
+"""
+
+
+class WorkerServerTest(BasicTest):
+    """Verify the threaded server of a worker process."""
+
+    def setUp(self):
+        """Create a listening socket."""
+        self.listener = socket.socket()
+        self.addCleanup(self.listener.close)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(8)
+        self.listener.setblocking(False)
+        self.url = 'http://127.0.0.1:%d/' % self.listener.getsockname()[1]
+
+    def test_serve(self):
+        """Requests are answered until the server is stopped."""
+        worker = server.WorkerServer(self.listener, pid_app, 'localhost',
+                                     threads=2)
+        worker.poll_interval = 0.05
+        thread = threading.Thread(target=worker.serve)
+        thread.start()
+        try:
+            for _ in range(3):
+                with urlopen(self.url, timeout=5) as response:
+                    self.assertEqual(int(response.read()), os.getpid())
+        finally:
+            worker.stop()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_max_requests(self):
+        """The server stops by itself after max_requests requests."""
+        worker = server.WorkerServer(self.listener, pid_app, 'localhost',
+                                     threads=1, max_requests=2)
+        worker.poll_interval = 0.05
+        thread = threading.Thread(target=worker.serve)
+        thread.start()
+        for _ in range(2):
+            urlopen(self.url, timeout=5).close()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(worker.requests, 2)
+
+
+class PreforkServerTest(BasicTest):
+    """Verify the workers of the pre-forking server."""
+
+    def setUp(self):
+        """Start a server in a new process."""
+        env = dict(os.environ)
+        src_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [src_dir] + env.get('PYTHONPATH', '').split(os.pathsep))
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SCRIPT], env=env,
+            stdout=subprocess.PIPE)
+        self.addCleanup(self.process.stdout.close)
+        self.addCleanup(self.process.kill)
+        self.url = 'http://127.0.0.1:%d/' % int(
+            self.process.stdout.readline())
+
+    def get_pids(self, count, exclude=()):
+        """Return the pids serving requests once count new ones are seen."""
+        pids = set()
+        deadline = time.monotonic() + 10
+        while len(pids - set(exclude)) < count:
+            self.assertLess(time.monotonic(), deadline)
+            with urlopen(self.url, timeout=5) as response:
+                pids.add(int(response.read()))
+        return pids - set(exclude)
+
+    def test_workers(self):
+        """Requests are served by the workers, which SIGHUP replaces."""
+        pids = self.get_pids(2)
+        self.assertNotIn(self.process.pid, pids)
+        self.process.send_signal(signal.SIGHUP)
+        self.get_pids(2, exclude=pids)
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(10), 0)
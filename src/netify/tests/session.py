@@ -0,0 +1,115 @@
+"""Tests for the netify.session module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+from io import StringIO
+from unittest import main
+from unittest.mock import patch
+
+from flask import Flask
+from flask import request
+from flask import session
+
+from netify.config import Config
+from netify.config import rotate_secret_key_file
+from netify.session import KeyRotatingSessionInterface
+
+from .base import BasicTest
+
+
+class TestKeyRotatingSessionInterface(BasicTest):
+    """Verify sessions survive a secret key rotation."""
+
+    def setUp(self):
+        """Create a bare flask app using the rotating session interface."""
+        self.flask_app = Flask(__name__)
+        self.interface = KeyRotatingSessionInterface()
+        self.flask_app.session_interface = self.interface
+
+    def _open(self, cookie):
+        """Open a session from a request carrying the given cookie."""
+        headers = {'Cookie': 'session=%s' % cookie}
+        with self.flask_app.test_request_context(headers=headers):
+            return self.interface.open_session(self.flask_app, request)
+
+    def _sign(self, key, data):
+        """Sign some session data with the given key."""
+        return self.interface.get_signing_serializer(
+            self.flask_app, key).dumps(data)
+
+    def test_current_key(self):
+        """Cookies signed with the current key are accepted."""
+        self.flask_app.secret_key = 'new'
+        self.assertEqual(self._open(self._sign('new', {'a': 1}))['a'], 1)
+
+    def test_fallback_key(self):
+        """Cookies signed with an old key are accepted after rotation."""
+        self.flask_app.secret_key = 'new'
+        self.flask_app.config['SECRET_KEY_FALLBACKS'] = ['old']
+        self.assertEqual(self._open(self._sign('old', {'a': 1}))['a'], 1)
+
+    def test_unknown_key(self):
+        """Cookies signed with an unknown key give an empty session."""
+        self.flask_app.secret_key = 'new'
+        self.assertEqual(dict(self._open(self._sign('other', {'a': 1}))), {})
+
+
+class TestKeyFileReload(BasicTest):
+    """Verify running apps pick up a key rotated in the key file."""
+
+    def setUp(self):
+        """Create an app whose keys are loaded from a key file."""
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.key_file = os.path.join(tmp_dir.name, 'secret_key')
+        self.flask_app = Flask(__name__, instance_path=tmp_dir.name)
+        with patch.dict(os.environ, clear=True):
+            Config(StringIO('[flask]\n')).update_flask(self.flask_app)
+        self.assertEqual(self.flask_app.config['SECRET_KEY_FILE'],
+                         self.key_file)
+        self.interface = KeyRotatingSessionInterface()
+        self.interface.key_file_check_interval = 0
+        self.flask_app.session_interface = self.interface
+
+        @self.flask_app.route('/count')
+        def count():
+            """Count the requests made in this session."""
+            session['count'] = session.get('count', 0) + 1
+            return str(session['count'])
+        self.client = self.flask_app.test_client()
+
+    def test_rotate(self):
+        """Sessions continue across a rotation and are re-signed."""
+        old_key = self.flask_app.secret_key
+        self.assertEqual(self.client.get('/count').data, b'1')
+        new_keys = rotate_secret_key_file(self.key_file)
+        self.assertEqual(self.client.get('/count').data, b'2')
+        self.assertEqual(self.flask_app.secret_key, new_keys[0])
+        self.assertEqual(self.flask_app.config['SECRET_KEY_FALLBACKS'],
+                         [old_key])
+        self.flask_app.config['SECRET_KEY_FALLBACKS'] = []
+        self.interface.key_file_check_interval = 60
+        self.assertEqual(self.client.get('/count').data, b'3')
+
+    def test_unreadable(self):
+        """The current keys are kept if the key file cannot be read."""
+        old_key = self.flask_app.secret_key
+        os.remove(self.key_file)
+        self.assertEqual(self.client.get('/count').data, b'1')
+        self.assertEqual(self.flask_app.secret_key, old_key)
+
+
+if __name__ == "__main__":
+    main()
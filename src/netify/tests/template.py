@@ -27,27 +27,213 @@ class RenderTemplateTest(BasicTest):
     """Test that the template module's methods work as expected."""
 
     @staticmethod
+    @patch('netify.template.current_app', Mock())
     @patch('netify.template.Markup')
-    @patch('netify.template.render_template_string')
-    def test_render_template_string(mock_rts, mock_markup):
+    @patch('netify.template.compile_template')
+    def test_render_template_string(mock_compile, mock_markup):
         """Verify that render_template accepts a string template."""
         test_string = 'some string'
         template.render_template(test_string)
-        mock_rts.assert_called_once_with(test_string)
-        mock_markup.assert_called_once_with(mock_rts(test_string))
+        mock_compile.assert_called_once_with(test_string)
+        mock_markup.assert_called_once_with(mock_compile().render())
 
     @staticmethod
+    @patch('netify.template.current_app', Mock())
     @patch('netify.template.Markup')
-    @patch('netify.template.render_template_string')
-    def test_render_template_doc(mock_rts, mock_markup):
+    @patch('netify.template.compile_template')
+    def test_render_template_doc(mock_compile, mock_markup):
         """Verify that render_template accepts a yattag Doc template."""
         test_string = 'some string'
         test_doc = Mock(spec=yattag.Doc)
         test_doc.getvalue.return_value = test_string
         template.render_template(test_doc)
         test_doc.getvalue.assert_called_once_with()
-        mock_rts.assert_called_once_with(test_string)
-        mock_markup.assert_called_once_with(mock_rts(test_string))
+        mock_compile.assert_called_once_with(test_string)
+        mock_markup.assert_called_once_with(mock_compile().render())
+
+
+class TemplateCacheTest(NetifyTest):
+    """Verify compiled templates are reused between renders."""
+
+    def setUp(self):
+        """Start each test with an empty template cache."""
+        template.TEMPLATE_CACHE.clear()
+
+    def test_compile_cached(self):
+        """The same template string is only compiled once."""
+        first = template.compile_template('{{ 1 + 1 }}')
+        self.assertIs(template.compile_template('{{ 1 + 1 }}'), first)
+        self.assertEqual(first.render(), '2')
+
+    def test_render_context(self):
+        """Context variables are available to the template."""
+        self.assertEqual(template.render_template('{{ a }}', a='b'), 'b')
+
+    def test_literal_body(self):
+        """A literal body is never compiled or evaluated as a template."""
+        page = template.HtmlPage(body='{{ 1 + 1 }}{% if %}', static=('head',))
+        self.assertIn('{{ 1 + 1 }}{% if %}', page.render_template())
+        entries = len(template.TEMPLATE_CACHE)
+        template.HtmlPage(body='other', static=('head',)).render_template()
+        self.assertEqual(len(template.TEMPLATE_CACHE), entries)
+
+    def test_literal_head(self):
+        """A literal head is spliced in around the rendered segments."""
+        page = template.HtmlPage(head='<title>{{ x }}</title>', body='{{ 2 }}',
+                                 static=('body',), flash_messages=False)
+        self.assertEqual(page.render_template(),
+                         '<!DOCTYPE html/><html lang="en"><head><title>'
+                         '{{ x }}</title></head><body>2</body></html>')
+
+    def test_stream(self):
+        """A literal body iterable is only consumed as the page streams."""
+        consumed = []
+
+        def body():
+            """Yield the body in chunks, recording what was consumed."""
+            for chunk in ('a', 'b'):
+                consumed.append(chunk)
+                yield chunk
+        response = template.HtmlPage(body=body(), static=('head',),
+                                     flash_messages=False).stream()
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(consumed, [])
+        self.assertTrue(response.get_data(as_text=True).endswith(
+            '<body>ab</body></html>'))
+        self.assertEqual(consumed, ['a', 'b'])
+
+    def test_minify(self):
+        """Minified pages keep literal pre content byte for byte."""
+        body = ['<p>a  b</p><pre>', '  x  \n\n', '</pre>']
+        page = template.HtmlPage(body=iter(body), static=('head',),
+                                 flash_messages=False, minify=True)
+        self.assertEqual(page.render_template(),
+                         '<!DOCTYPE html/><html lang=en><head>'
+                         '<meta charset=utf-8></head><body><p>a b</p>'
+                         '<pre>  x  \n\n</pre></body></html>')
+
+    def test_make_response(self):
+        """Pages carry a strong ETag and matching requests get a 304."""
+        page = template.HtmlPage(body='<p>etag</p>', flash_messages=False)
+        response = page.make_response()
+        etag, weak = response.get_etag()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(weak)
+        headers = {'If-None-Match': '"%s"' % etag}
+        with self.app.test_request_context(headers=headers):
+            response = page.make_response()
+        self.assertEqual(response.status_code, 304)
+
+
+class HtmlPageTest(BasicTest):
+    """Verify the HtmlPage builder."""
+
+    def test_build(self):
+        """The body is spliced into the pre-rendered page shell."""
+        page = template.HtmlPage(head='<title>t</title>', body='<p>b</p>',
+                                 flash_messages=False)
+        self.assertEqual(page.build(),
+                         '<!DOCTYPE html/><html lang="en"><head><title>t'
+                         '</title></head><body><p>b</p></body></html>')
+
+    def test_default_head(self):
+        """The default head holds only the charset meta tag."""
+        page = template.HtmlPage(body='', flash_messages=False)
+        self.assertIn('<head><meta charset="utf-8" /></head>', page.build())
+
+    def test_shell_cached(self):
+        """The shell is only rendered once for the same head."""
+        template.HtmlPage(head='<b>cached</b>', body='a').build()
+        with patch.object(template.HtmlPage, 'build_shell') as mock_shell:
+            template.HtmlPage(head='<b>cached</b>', body='b').build()
+        self.assertFalse(mock_shell.called)
+
+
+class FragmentCacheTest(BasicTest):
+    """Verify the memoized page fragments."""
+
+    def setUp(self):
+        """Create a stand in for the netify app."""
+        self.netify = Mock(url_map_version=1)
+        self.netify.config.generation = 1
+        self.factory = Mock(return_value='<div>fragment</div>')
+
+    def test_memoized(self):
+        """A fragment is built once for the same config and URL map."""
+        for _ in range(3):
+            self.assertEqual(
+                template.memoize_fragment(self.netify, self.factory, 'arg'),
+                '<div>fragment</div>')
+        self.factory.assert_called_once_with('arg')
+
+    def test_config_generation(self):
+        """A fragment is rebuilt when the config is reloaded."""
+        template.memoize_fragment(self.netify, self.factory)
+        self.netify.config.generation = 2
+        template.memoize_fragment(self.netify, self.factory)
+        self.assertEqual(self.factory.call_count, 2)
+
+    def test_url_map_version(self):
+        """A fragment is rebuilt when views are registered."""
+        template.memoize_fragment(self.netify, self.factory)
+        self.netify.url_map_version += 1
+        template.memoize_fragment(self.netify, self.factory)
+        self.assertEqual(self.factory.call_count, 2)
+
+
+class DebugDivTest(BasicTest):
+    """Verify the debugging information shown on pages."""
+
+    def test_no_secret_keys(self):
+        """The secret keys are not shown."""
+        netify = Mock()
+        netify.flask_app.url_map.iter_rules.return_value = []
+        netify.flask_app.config = {
+            'DEBUG': True, 'SECRET_KEY': 'current-key',
+            'SECRET_KEY_FALLBACKS': ['old-key']}
+        netify.config.to_string_dict.return_value = {
+            'flask': {'debug': 'true', 'secret_key': 'config-key'}}
+        html = template.build_debug_div(netify)
+        self.assertIn('DEBUG', html)
+        self.assertIn('debug', html)
+        for key in ('current-key', 'old-key', 'config-key', 'SECRET_KEY'):
+            self.assertNotIn(key, html)
+
+
+class HtmlListTest(BasicTest):
+    """Verify the HTML list builders."""
+
+    def test_list(self):
+        """List items are written as is and nested lists become ul."""
+        self.assertEqual(template.list_to_html_list(['<b>a</b>', ('c',)],
+                                                    list_tag='ol'),
+                         '<ol><li><b>a</b></li><li><ul><li>c</li></ul>'
+                         '</li></ol>')
+        self.assertEqual(template.list_to_html_list([]), '')
+
+    def test_dict(self):
+        """Dict keys and values are escaped and nested dicts use ": "."""
+        self.assertEqual(
+            template.dict_to_html_list({'a<': 'b&', 'c': {'d': 1}},
+                                       key_sep=' - '),
+            '<ul><li>a&lt; - b&amp;</li><li>c - <ul><li>d: 1</li></ul>'
+            '</li></ul>')
+
+    def test_deep(self):
+        """Deeply nested data does not hit the recursion limit."""
+        data = ['leaf']
+        for _ in range(5000):
+            data = [data]
+        html = template.list_to_html_list(data)
+        self.assertTrue(html.startswith('<ul><li><ul>'))
+        self.assertEqual(html.count('<ul>'), 5001)
+
+    def test_link_list(self):
+        """Link hrefs and texts are escaped."""
+        self.assertEqual(
+            template.link_list_to_html_list([('/a?b="c"&d', 'x<y')]),
+            '<ul><li><a href="/a?b=&quot;c&quot;&amp;d">x&lt;y</a></li></ul>')
+        self.assertEqual(template.link_list_to_html_list([]), '')
 
 
 class PageTest(BasicTest):
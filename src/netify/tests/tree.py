@@ -0,0 +1,85 @@
+"""Tests for the netify tree module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+
+from netify.tests.base import BasicTest
+import netify.tree as tree
+
+
+class TreeWalkTest(BasicTest):
+    """Verify the parallel walk of a directory tree."""
+
+    def setUp(self):
+        """Create a tree three directories deep."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.root = self.tmp_dir.name
+        for name in ('a.txt', 'b.py', '.hidden.txt', 'x/c.txt', 'x/y/d.txt',
+                     'x/y/z/e.txt', '.h/f.txt'):
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as fout:
+                fout.write(name)
+        os.symlink(os.path.join(self.root, 'x'),
+                   os.path.join(self.root, 'link'))
+
+    def walk(self, **kwargs):
+        """Return the sorted names of the entries of a walk and the walk."""
+        walk = tree.TreeWalk(self.root, **kwargs)
+        return sorted(entry.name for _, entries in walk
+                      for entry in entries), walk
+
+    def test_walk(self):
+        """Every directory is listed once and links are not followed."""
+        names, walk = self.walk(suffixes=('.txt',))
+        self.assertEqual(names, ['a.txt', 'link/', 'x/', 'x/c.txt', 'x/y/',
+                                 'x/y/d.txt', 'x/y/z/', 'x/y/z/e.txt'])
+        self.assertFalse(walk.truncated)
+        self.assertEqual(walk.entries, 8)
+
+    def test_entries(self):
+        """Entries hold the sizes and mtimes of the files."""
+        entries, subdirs = tree.scan_dir(self.root, 'x/')
+        self.assertEqual(subdirs, ['x/y/'])
+        self.assertEqual(entries[0].name, 'x/c.txt')
+        self.assertEqual(entries[0].size, 7)
+        self.assertEqual(entries[0].mtime, int(os.stat(
+            os.path.join(self.root, 'x', 'c.txt')).st_mtime))
+        self.assertTrue(entries[1].is_dir)
+        self.assertEqual(tree.scan_dir(self.root, 'missing/'), ([], []))
+
+    def test_depth(self):
+        """Directories deeper than max_depth are not walked."""
+        names, _ = self.walk(prefix='x/', max_depth=1)
+        self.assertEqual(names, ['x/c.txt', 'x/y/', 'x/y/d.txt', 'x/y/z/'])
+        names, _ = self.walk(max_depth=0)
+        self.assertEqual(names, ['a.txt', 'b.py', 'link/', 'x/'])
+
+    def test_max_entries(self):
+        """The walk stops after max_entries entries."""
+        for max_pending in (1, 4):
+            names, walk = self.walk(max_entries=5, max_pending=max_pending)
+            self.assertEqual(len(names), 5)
+            self.assertEqual(walk.entries, 5)
+            self.assertTrue(walk.truncated)
+
+    def test_resized_executor(self):
+        """A walk keeps its pool when the shared pool is resized."""
+        walk = tree.TreeWalk(self.root, executor=tree.get_executor(2),
+                             max_pending=2)
+        self.assertIsNot(tree.get_executor(3), walk.executor)
+        self.assertEqual(len(list(walk)), 4)
+        self.assertIs(tree.get_executor(3), tree.get_executor(3))
@@ -0,0 +1,65 @@
+"""Tests for the netify view module."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import subprocess
+import sys
+
+from netify.tests.base import BasicTest
+import netify.catalog as catalog
+import netify.rawfile as rawfile
+import netify.view as view
+
+
+LAZY_SCRIPT = """
+import sys
+import netify.app
+print(' '.join(sorted(sys.modules)))
+"""
+
+
+class ViewsTest(BasicTest):
+    """Verify that the views are loaded on demand."""
+
+    def test_load_view(self):
+        """Every member of Views loads the view it names."""
+        for member in catalog.Views:
+            view_cls = catalog.load_view(member)
+            self.assertTrue(issubclass(view_cls, view.NetifyView))
+            self.assertEqual(view_cls.name, member.name)
+
+    def test_moved_views(self):
+        """The views that moved out of the module can still be found there."""
+        self.assertIs(view.RawFile, rawfile.RawFile)
+        self.assertIs(view.LISTING_CACHE, rawfile.LISTING_CACHE)
+        with self.assertRaises(AttributeError):
+            view.NoSuchView  # pylint: disable=pointless-statement
+
+    def test_lazy_import(self):
+        """Importing the app imports neither Flask nor the views."""
+        env = dict(os.environ)
+        src_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [src_dir] + env.get('PYTHONPATH', '').split(os.pathsep))
+        modules = subprocess.check_output(
+            [sys.executable, '-c', LAZY_SCRIPT], env=env).decode().split()
+        for module in ('flask', 'flask_classy', 'yattag', 'netify.view',
+                       'netify.template', 'netify.session',
+                       'netify.metrics', 'netify.diskcache',
+                       'netify.rawfile', 'netify.rawtree',
+                       'netify.searchview', 'netify.metricsview',
+                       'netify.server', 'netify.compress', 'sqlite3',
+                       'argparse'):
+            self.assertNotIn(module, modules)
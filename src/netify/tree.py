@@ -0,0 +1,173 @@
+"""Walk directory trees with a pool of threads."""
+# Copyright 2016 Curtis Sand
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import os
+import threading
+
+
+# The thread pool shared by every walk in this process.
+_EXECUTOR = None
+_EXECUTOR_KEY = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+class Entry(namedtuple('Entry', ['name', 'is_dir', 'size', 'mtime'])):
+    """An entry of a directory tree.
+
+    :param name: The path of the entry relative to the top of the tree.
+                 Directory names end with "/".
+    :param is_dir: True for directories.
+    :param size: The size in bytes, 0 for directories.
+    :param mtime: The modification time in seconds.
+
+    The size and mtime are None when the walk doesn't stat the entries.
+    """
+
+    __slots__ = ()
+
+
+def get_executor(workers):
+    """Return the process wide thread pool for scanning directories.
+
+    The pool is created lazily so forked workers (as started by uwsgi)
+    don't use a pool whose threads stayed behind in the parent process.
+    When the number of workers changes the old pool is not shut down, as
+    walks that are still running hold on to it; its threads exit once the
+    last of those walks is done with it and it is garbage collected.
+    """
+    global _EXECUTOR, _EXECUTOR_KEY  # pylint: disable=global-statement
+    key = (os.getpid(), workers)
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR_KEY != key:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=workers)
+            _EXECUTOR_KEY = key
+        return _EXECUTOR
+
+
+def scan_dir(root, prefix, suffixes=(), with_stat=True):
+    """Return the entries of the directory prefix below root and its subdirs.
+
+    Hidden entries are skipped and, when suffixes is not empty, so are the
+    files without one of the suffixes. Symbolic links to directories are
+    listed but not walked into. Without with_stat the entries have no size
+    or mtime, which saves a stat call per file.
+
+    :return: A (entries, subdirs) tuple of the sorted entries and the names
+             of the directories to walk into. An unreadable directory has no
+             entries.
+    """
+    entries = []
+    subdirs = []
+    size = mtime = None
+    try:
+        with os.scandir(os.path.join(root, prefix)) as dir_entries:
+            for dir_entry in dir_entries:
+                name = dir_entry.name
+                if name.startswith('.'):
+                    continue
+                try:
+                    is_dir = dir_entry.is_dir()
+                    if not is_dir and suffixes and not name.endswith(
+                            suffixes):
+                        continue
+                    if with_stat:
+                        entry_stat = dir_entry.stat()
+                        size = 0 if is_dir else entry_stat.st_size
+                        mtime = int(entry_stat.st_mtime)
+                except OSError:
+                    continue
+                if is_dir:
+                    entries.append(Entry(prefix + name + '/', True, size,
+                                         mtime))
+                    if not dir_entry.is_symlink():
+                        subdirs.append(prefix + name + '/')
+                else:
+                    entries.append(Entry(prefix + name, False, size, mtime))
+    except OSError:
+        pass
+    entries.sort()
+    subdirs.sort()
+    return entries, subdirs
+
+
+class TreeWalk(object):
+    """Iterate over the directories of a tree as a thread pool scans them.
+
+    Iterating yields a (dirname, entries) pair for every directory, in the
+    order their scans complete, starting with ('', entries) for the top.
+    The walk stops descending below max_depth levels and stops altogether
+    once max_entries entries have been yielded, setting truncated. At most
+    max_pending directories are scanned at once so one walk can't fill the
+    pool's queue and starve the others.
+
+    :param root: The top directory of the tree.
+    :param prefix: The name of the directory to start from, relative to
+                   root, ending with "/" or empty for root itself.
+    :param suffixes: Only list files ending with one of these suffixes.
+    :param with_stat: Give the entries their size and mtime.
+    :param executor: The concurrent.futures executor to scan with. The
+                     shared pool from get_executor is used by default.
+    """
+
+    def __init__(self, root, prefix='', suffixes=(), with_stat=True,
+                 max_depth=16, max_entries=100000, executor=None,
+                 max_pending=4):
+        """Set up a walk, which starts when it is iterated."""
+        self.root = root
+        self.prefix = prefix
+        self.suffixes = tuple(suffixes)
+        self.with_stat = with_stat
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.max_pending = max(1, max_pending)
+        self.executor = executor or get_executor(self.max_pending)
+        self.entries = 0
+        self.truncated = False
+
+    def __iter__(self):
+        """Yield (dirname, entries) pairs as the directories are scanned."""
+        queue = deque([(self.prefix, 0)])
+        pending = {}
+        try:
+            while queue or pending:
+                while queue and len(pending) < self.max_pending:
+                    prefix, depth = queue.popleft()
+                    future = self.executor.submit(
+                        scan_dir, self.root, prefix, self.suffixes,
+                        self.with_stat)
+                    pending[future] = (prefix, depth)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    prefix, depth = pending.pop(future)
+                    entries, subdirs = future.result()
+                    if depth < self.max_depth:
+                        queue.extend((subdir, depth + 1)
+                                     for subdir in subdirs)
+                    remaining = self.max_entries - self.entries
+                    if len(entries) > remaining:
+                        entries = entries[:remaining]
+                        self.truncated = True
+                    self.entries += len(entries)
+                    if entries or not self.truncated:
+                        yield prefix, entries
+                    if self.truncated:
+                        return
+        finally:
+            for future in pending:
+                future.cancel()